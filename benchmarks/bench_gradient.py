@@ -0,0 +1,66 @@
+import numpy as np
+
+from topocalc.gradient import gradient_c, gradient_d4, gradient_d8
+from topocalc.shade import shade, shade_series
+
+from .common import SPACING, cells_per_second, load_dem
+
+GRADIENTS = {
+    'd4': lambda dem: gradient_d4(dem, SPACING, SPACING),
+    'd8': lambda dem: gradient_d8(dem, SPACING, SPACING),
+    'c': lambda dem: gradient_c(dem, SPACING, SPACING),
+}
+
+
+class Gradient:
+
+    params = (['lakes', 512, 2048], list(GRADIENTS))
+    param_names = ['dem', 'method']
+
+    def setup(self, dem, method):
+        self.dem = load_dem(dem)
+
+    def time_gradient(self, dem, method):
+        GRADIENTS[method](self.dem)
+
+    def peakmem_gradient(self, dem, method):
+        GRADIENTS[method](self.dem)
+
+    def track_gradient_cells_per_second(self, dem, method):
+        return cells_per_second(
+            lambda: GRADIENTS[method](self.dem), self.dem.size)
+
+    track_gradient_cells_per_second.unit = 'cells/s'
+
+
+class Shade:
+    """shade for one sun position and a day of hourly positions"""
+
+    params = (['lakes', 512, 2048], [1, 24])
+    param_names = ['dem', 'times']
+
+    def setup(self, dem, times):
+        _, self.sin_slope, _, self.aspect = gradient_c(
+            load_dem(dem), SPACING, SPACING)
+
+        self.azimuth = np.linspace(-120, 120, times)
+        self.zenith = np.linspace(30, 80, times)
+
+    def shade(self):
+        if len(self.azimuth) == 1:
+            return shade(self.sin_slope, self.aspect, self.azimuth[0],
+                         zenith=self.zenith[0])
+
+        return shade_series(self.sin_slope, self.aspect, self.azimuth,
+                            zenith=self.zenith)
+
+    def time_shade(self, dem, times):
+        self.shade()
+
+    def peakmem_shade(self, dem, times):
+        self.shade()
+
+    def track_shade_cells_per_second(self, dem, times):
+        return cells_per_second(self.shade, self.sin_slope.size * times)
+
+    track_shade_cells_per_second.unit = 'cells/s'
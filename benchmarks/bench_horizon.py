@@ -0,0 +1,72 @@
+from topocalc.horizon import hor2d_c, horizon
+from topocalc.skew import skew
+
+from .common import SPACING, cells_per_second, load_dem
+
+
+class Horizon:
+    """horizon for the directions along the grid and the skewed ones"""
+
+    params = (['lakes', 512, 2048], [0, 90, 45, -135])
+    param_names = ['dem', 'azimuth']
+
+    def setup(self, dem, azimuth):
+        self.dem = load_dem(dem)
+
+    def time_horizon(self, dem, azimuth):
+        horizon(azimuth, self.dem, SPACING)
+
+    def peakmem_horizon(self, dem, azimuth):
+        horizon(azimuth, self.dem, SPACING)
+
+    def track_horizon_cells_per_second(self, dem, azimuth):
+        return cells_per_second(
+            lambda: horizon(azimuth, self.dem, SPACING), self.dem.size)
+
+    track_horizon_cells_per_second.unit = 'cells/s'
+
+
+class Hor2d:
+    """The native horizon search along the rows"""
+
+    params = (['lakes', 512, 2048], [True, False])
+    param_names = ['dem', 'hull']
+
+    def setup(self, dem, hull):
+        self.dem = load_dem(dem)
+
+        # the brute force search is quadratic in the line length
+        if not hull and self.dem.shape[1] > 512:
+            raise NotImplementedError()
+
+    def time_hor2d(self, dem, hull):
+        hor2d_c(self.dem, SPACING, hull=hull)
+
+    def peakmem_hor2d(self, dem, hull):
+        hor2d_c(self.dem, SPACING, hull=hull)
+
+    def track_hor2d_cells_per_second(self, dem, hull):
+        return cells_per_second(
+            lambda: hor2d_c(self.dem, SPACING, hull=hull), self.dem.size)
+
+    track_hor2d_cells_per_second.unit = 'cells/s'
+
+
+class Skew:
+
+    params = (['lakes', 512, 2048], [15, 45])
+    param_names = ['dem', 'angle']
+
+    def setup(self, dem, angle):
+        self.dem = load_dem(dem)
+
+    def time_skew(self, dem, angle):
+        skew(self.dem, angle)
+
+    def peakmem_skew(self, dem, angle):
+        skew(self.dem, angle)
+
+    def track_skew_cells_per_second(self, dem, angle):
+        return cells_per_second(lambda: skew(self.dem, angle), self.dem.size)
+
+    track_skew_cells_per_second.unit = 'cells/s'
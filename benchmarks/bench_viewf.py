@@ -0,0 +1,27 @@
+from topocalc.viewf import viewf
+
+from .common import SPACING, cells_per_second, load_dem
+
+
+class Viewf:
+
+    # each call is a horizon for every angle, so the dems are kept small
+    params = (['lakes', 512], [16, 72])
+    param_names = ['dem', 'nangles']
+    timeout = 600
+
+    def setup(self, dem, nangles):
+        self.dem = load_dem(dem)
+
+    def time_viewf(self, dem, nangles):
+        viewf(self.dem, SPACING, nangles=nangles)
+
+    def peakmem_viewf(self, dem, nangles):
+        viewf(self.dem, SPACING, nangles=nangles)
+
+    def track_viewf_cells_per_second(self, dem, nangles):
+        return cells_per_second(
+            lambda: viewf(self.dem, SPACING, nangles=nangles),
+            self.dem.size, repeat=1)
+
+    track_viewf_cells_per_second.unit = 'cells/s'
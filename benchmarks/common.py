@@ -0,0 +1,34 @@
+import os
+import timeit
+
+import numpy as np
+
+import topocalc
+
+LAKES = os.path.join(
+    os.path.dirname(topocalc.__file__), 'tests', 'Lakes', 'topo.nc')
+
+# grid spacing of the Lakes dem, used for the synthetic dems too
+SPACING = 50
+
+
+def load_dem(name):
+    """The Lakes dem for 'lakes', otherwise a square synthetic dem with
+    name rows and columns
+    """
+
+    if name == 'lakes':
+        from netCDF4 import Dataset
+
+        with Dataset(LAKES) as ds:
+            return np.asarray(ds['dem'][:], dtype=np.float64)
+
+    # a random walk surface like the dems in the tests
+    rng = np.random.RandomState(42)
+    return 10 * np.cumsum(np.cumsum(rng.randn(name, name), axis=0), axis=1)
+
+
+def cells_per_second(fn, cells, repeat=3):
+    """Cells calculated per second for the fastest of repeat calls"""
+
+    return cells / min(timeit.repeat(fn, number=1, repeat=repeat))
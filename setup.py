@@ -1,6 +1,9 @@
 #!/usr/bin/env python
 
 import os
+import shutil
+import tempfile
+from distutils.errors import CompileError, LinkError
 
 import numpy
 from setuptools import Extension, find_packages, setup
@@ -22,6 +25,41 @@ class build_ext(_build_ext):
     def finalize_options(self):
         _build_ext.finalize_options(self)
 
+    def build_extensions(self):
+        # OpenMP only where the compiler has it, the C functions run
+        # with one thread without it
+        if has_openmp(self.compiler):
+            for extension in self.extensions:
+                extension.extra_compile_args += ['-fopenmp']
+                extension.extra_link_args += ['-fopenmp']
+        else:
+            print('OpenMP not found, building without it')
+
+        _build_ext.build_extensions(self)
+
+
+def has_openmp(compiler):
+    """Test if the compiler can compile and link an OpenMP program"""
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        source = os.path.join(tmp_dir, 'omp_test.c')
+        with open(source, 'w') as f:
+            f.write('#include <omp.h>\n'
+                    'int main(void) { return omp_get_max_threads() < 1; }\n')
+
+        objects = compiler.compile(
+            [source], output_dir=tmp_dir, extra_postargs=['-fopenmp'])
+        compiler.link_executable(
+            objects, 'omp_test', output_dir=tmp_dir,
+            extra_postargs=['-fopenmp'])
+    except (CompileError, LinkError):
+        return False
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    return True
+
 
 with open('README.md') as readme_file:
     readme = readme_file.read()
@@ -49,6 +87,7 @@ ext_modules += [
               sources=[os.path.join(loc, val) for val in [
                   "topo_core.pyx",
                   "hor1d.c",
+                  "gradient.c",
               ]],
               include_dirs=[numpy.get_include()],
               ),
@@ -76,6 +115,9 @@ setup(
         ],
     },
     install_requires=requirements,
+    extras_require={
+        'xarray': ['xarray', 'dask[array]'],
+    },
     license="CC0 1.0",
     long_description=readme,
     long_description_content_type="text/markdown",
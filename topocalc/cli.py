@@ -1,16 +1,483 @@
 """Console script for topocalc."""
+import os
 import sys
 
 import click
+import numpy as np
+from netCDF4 import Dataset
 
+from topocalc.gradient import gradient_c
+from topocalc.horizon import horizon
+from topocalc.shade import iter_shade
+from topocalc.shadow import illumination
+from topocalc.tiles import (halo_size, horizon_tiled, tile_windows,
+                            viewf_tiled)
+from topocalc.viewf import viewf
 
-@click.command()
-def main(args=None):
-    """Console script for topocalc."""
-    click.echo("Replace this message by putting your code into "
-               "topocalc.cli.main")
-    click.echo("See click documentation at https://click.palletsprojects.com/")
-    return 0
+# rows and columns of the output chunks
+CHUNK_SIZE = 512
+
+# rows and columns of the tiles when --max-distance is set without
+# --tile-size or --max-memory, and the rows of the gradient blocks
+TILE_SIZE = 1024
+
+# about how many arrays the size of a tile each calculation holds at
+# once, used to size the tiles for --max-memory
+ARRAYS = {
+    'gradient': 4,
+    'horizon': 4,
+    'viewf': 10,
+    'shade': 8,
+}
+
+MEMORY_UNITS = {
+    '': 1,
+    'K': 1024,
+    'M': 1024 ** 2,
+    'G': 1024 ** 3,
+    'T': 1024 ** 4,
+}
+
+
+class _Layer():
+    """One layer of a 3D netCDF variable that tiles can be written to
+    with 2D slice assignment
+    """
+
+    def __init__(self, variable, index):
+        self.variable = variable
+        self.index = index
+
+    @property
+    def shape(self):
+        return self.variable.shape[1:]
+
+    def __setitem__(self, key, value):
+        self.variable[(self.index,) + key] = value
+
+
+def _parse_memory(ctx, param, value):
+    """Bytes from a memory size like 512M or 4G"""
+
+    if value is None:
+        return None
+
+    text = value.strip().upper()
+    if text.endswith('B'):
+        text = text[:-1]
+
+    unit = text[-1:] if text[-1:] in MEMORY_UNITS else ''
+
+    try:
+        size = float(text[:len(text) - len(unit)]) * MEMORY_UNITS[unit]
+    except ValueError:
+        raise click.BadParameter(
+            'must be a size like 512M or 4G, not {}'.format(value))
+
+    if size <= 0:
+        raise click.BadParameter('must be greater than 0')
+
+    return int(size)
+
+
+def _tile_size(shape, spacing, max_distance, tile_size, max_memory,
+               itemsize, arrays):
+    """Rows and columns of the tiles, or None to calculate the whole dem
+    at once when there is no max_distance for the halo.
+    """
+
+    if max_distance is None:
+        if tile_size is not None:
+            raise click.UsageError(
+                '--tile-size needs --max-distance for the halo around '
+                'the tiles')
+
+        if max_memory is not None:
+            needed = int(np.prod(shape)) * itemsize * arrays
+            if needed > max_memory:
+                raise click.UsageError(
+                    'the dem needs about {} MB, more than --max-memory, '
+                    'set --max-distance to calculate it in tiles'.format(
+                        needed // MEMORY_UNITS['M']))
+
+        return None
+
+    if tile_size is not None:
+        return tile_size
+
+    if max_memory is None:
+        return TILE_SIZE
+
+    # the largest square window that fits, less the halo
+    halo = halo_size(max_distance, spacing)
+    size = int(np.sqrt(max_memory / (itemsize * arrays))) - 2 * halo
+    if size < 1:
+        raise click.UsageError(
+            '--max-memory is too small for a tile and the halo of '
+            '--max-distance')
+
+    return size
+
+
+def _block_rows(ncols, tile_size, max_memory, itemsize, arrays):
+    """Rows in each block for the calculations that read the dem a block
+    of rows at a time
+    """
+
+    if tile_size is not None:
+        return tile_size
+
+    if max_memory is None:
+        return TILE_SIZE
+
+    # the block has a row above and below it
+    rows = max_memory // (ncols * itemsize * arrays) - 2
+    if rows < 1:
+        raise click.UsageError(
+            '--max-memory is too small for a block of rows')
+
+    return int(rows)
+
+
+def _open_dem(dem_file, variable, spacing):
+    """Open the dem variable in a netCDF file and find the spacing from
+    the coordinates if it isn't given
+
+    Returns:
+        ds: netCDF4 Dataset
+        dem: netCDF4 variable of the dem
+        dx: cell size along the x axis
+        dy: cell size along the y axis
+    """
+
+    ds = Dataset(dem_file, 'r')
+
+    if variable not in ds.variables:
+        ds.close()
+        raise click.UsageError(
+            'variable {} is not in {}'.format(variable, dem_file))
+
+    dem = ds.variables[variable]
+    if len(dem.shape) != 2:
+        ds.close()
+        raise click.UsageError('variable {} is not 2D'.format(variable))
+
+    # fill values are read as numbers instead of a masked array
+    dem.set_auto_mask(False)
+
+    if spacing is not None:
+        return ds, dem, spacing, spacing
+
+    ydim, xdim = dem.dimensions
+    if xdim not in ds.variables or ydim not in ds.variables or \
+            min(dem.shape) < 2:
+        ds.close()
+        raise click.UsageError(
+            'the dem has no coordinates to find the spacing from, '
+            'set --spacing')
+
+    x = ds.variables[xdim][:2]
+    y = ds.variables[ydim][:2]
+
+    return ds, dem, abs(float(x[1] - x[0])), abs(float(y[1] - y[0]))
+
+
+def _create_output(out_file, ds, dem):
+    """Create the output netCDF file with the dimensions and coordinates
+    of the dem
+    """
+
+    out = Dataset(out_file, 'w')
+
+    for name in dem.dimensions:
+        out.createDimension(name, len(ds.dimensions[name]))
+
+        if name in ds.variables:
+            coord = ds.variables[name]
+            v = out.createVariable(name, coord.dtype, (name,))
+            v.setncatts({
+                k: coord.getncattr(k) for k in coord.ncattrs()
+                if k != '_FillValue'
+            })
+            v[:] = coord[:]
+
+    out.setncattr('history', 'Created with topocalc')
+
+    return out
+
+
+def _create_variable(out, name, dimensions, dtype, **attrs):
+    """Create a chunked and compressed variable, each chunk is one layer
+    of the leading dimensions and up to CHUNK_SIZE rows and columns
+    """
+
+    shape = [len(out.dimensions[d]) for d in dimensions]
+    chunks = [1] * (len(shape) - 2) + [min(CHUNK_SIZE, n) for n in shape[-2:]]
+
+    v = out.createVariable(name, dtype, dimensions, zlib=True,
+                           chunksizes=chunks)
+    v.setncatts(attrs)
+
+    return v
+
+
+def _create_layers(out, name, values, **attrs):
+    """Create a leading dimension and its coordinate variable"""
+
+    out.createDimension(name, len(values))
+    v = out.createVariable(name, np.float64, (name,))
+    v.setncatts(attrs)
+    v[:] = values
+
+
+def dem_options(f):
+    """Arguments and options shared by all the commands"""
+
+    options = [
+        click.argument('dem_file',
+                       type=click.Path(exists=True, dir_okay=False)),
+        click.argument('out_file', type=click.Path(dir_okay=False)),
+        click.option('--variable', default='dem', show_default=True,
+                     help='Name of the dem variable in DEM_FILE.'),
+        click.option('--spacing', type=float,
+                     help='Grid spacing, defaults to the spacing of the '
+                     'x coordinate.'),
+        click.option('--dtype', type=click.Choice(['float32', 'float64']),
+                     default='float64', show_default=True,
+                     help='Type to calculate and write the outputs in, '
+                     'float32 halves the memory.'),
+        click.option('--workers', type=click.IntRange(min=0), default=1,
+                     show_default=True,
+                     help='Number of threads, 0 uses all available '
+                     'cores.'),
+        click.option('--tile-size', type=click.IntRange(min=1),
+                     help='Rows and columns of each tile.'),
+        click.option('--max-memory', callback=_parse_memory,
+                     help='Memory to size the tiles for, like 512M or '
+                     '4G.'),
+    ]
+
+    for option in reversed(options):
+        f = option(f)
+
+    return f
+
+
+@click.group()
+def main():
+    """Topographic calculations on a dem in a netCDF file."""
+
+
+@main.command()
+@dem_options
+@click.option('--method', type=click.Choice(['d8', 'd4']), default='d8',
+              show_default=True, help='Finite difference for the gradient.')
+def gradient(dem_file, out_file, variable, spacing, dtype, workers,
+             tile_size, max_memory, method):
+    """Slope and aspect of a dem.
+
+    The dem is read a block of --tile-size rows at a time with a row
+    above and below, so the result is the same as for the whole dem.
+    The slope is in radians and the aspect in radians from south.
+    """
+
+    dtype = np.dtype(dtype)
+    ds, dem, dx, dy = _open_dem(dem_file, variable, spacing)
+
+    try:
+        rows = _block_rows(dem.shape[1], tile_size, max_memory,
+                           dtype.itemsize, ARRAYS['gradient'])
+
+        with _create_output(out_file, ds, dem) as out:
+            slope = _create_variable(
+                out, 'slope', dem.dimensions, dtype, units='radians',
+                long_name='slope')
+            aspect = _create_variable(
+                out, 'aspect', dem.dimensions, dtype, units='radians',
+                long_name='aspect from south')
+
+            for tile, window, inner in tile_windows(
+                    dem.shape, (rows, dem.shape[1]), 1):
+                block = np.asarray(dem[window], dtype=dtype)
+                s, _, _, a = gradient_c(
+                    block, dx, dy, d8=method == 'd8', nthreads=workers,
+                    out=(np.empty_like(block), None, None,
+                         np.empty_like(block)),
+                    dtype=dtype)
+
+                slope[tile] = s[inner]
+                aspect[tile] = a[inner]
+    finally:
+        ds.close()
+
+
+@main.command('horizon')
+@dem_options
+@click.option('--azimuth', type=float, multiple=True, required=True,
+              help='Azimuth in degrees from south, -180..180. Can be '
+              'given more than once.')
+@click.option('--max-distance', type=float,
+              help='Only search for horizons within this distance, in '
+              'the units of the spacing. Needed to calculate the dem in '
+              'tiles.')
+def horizon_command(dem_file, out_file, variable, spacing, dtype, workers,
+                    tile_size, max_memory, azimuth, max_distance):
+    """Cosines of the horizon angles of a dem for each azimuth.
+
+    With --max-distance the horizons are calculated a tile at a time
+    with a halo of --max-distance around each tile.
+    """
+
+    dtype = np.dtype(dtype)
+    ds, dem, spacing, _ = _open_dem(dem_file, variable, spacing)
+
+    try:
+        tile_size = _tile_size(dem.shape, spacing, max_distance, tile_size,
+                               max_memory, dtype.itemsize, ARRAYS['horizon'])
+
+        with _create_output(out_file, ds, dem) as out:
+            _create_layers(out, 'azimuth', azimuth, units='degrees',
+                           long_name='azimuth from south')
+            hcos = _create_variable(
+                out, 'hcos', ('azimuth',) + dem.dimensions, dtype,
+                long_name='cosine of the horizon angle')
+
+            if tile_size is None:
+                dem = np.asarray(dem[:], dtype=dtype)
+
+            for k, az in enumerate(azimuth):
+                if tile_size is None:
+                    hcos[k] = horizon(az, dem, spacing, nthreads=workers,
+                                      dtype=dtype)
+                else:
+                    horizon_tiled(az, dem, spacing, max_distance,
+                                  tile_size=tile_size,
+                                  out=_Layer(hcos, k), nthreads=workers,
+                                  dtype=dtype)
+    finally:
+        ds.close()
+
+
+@main.command('viewf')
+@dem_options
+@click.option('--nangles', type=click.IntRange(min=16), default=72,
+              show_default=True, help='Number of azimuths for the '
+              'horizons.')
+@click.option('--max-distance', type=float,
+              help='Only search for horizons within this distance, in '
+              'the units of the spacing. Needed to calculate the dem in '
+              'tiles.')
+def viewf_command(dem_file, out_file, variable, spacing, dtype, workers,
+                  tile_size, max_memory, nangles, max_distance):
+    """Sky view factor and terrain configuration factor of a dem.
+
+    The --workers calculate that many azimuths at the same time, 0 is
+    one for each core. With --max-distance the dem is calculated a tile
+    at a time with a halo of --max-distance around each tile.
+    """
+
+    dtype = np.dtype(dtype)
+    ds, dem, spacing, _ = _open_dem(dem_file, variable, spacing)
+
+    if workers == 0:
+        workers = os.cpu_count() or 1
+
+    try:
+        # each worker holds a horizon and an integrand
+        arrays = ARRAYS['viewf'] + 2 * workers
+        tile_size = _tile_size(dem.shape, spacing, max_distance, tile_size,
+                               max_memory, dtype.itemsize, arrays)
+
+        with _create_output(out_file, ds, dem) as out:
+            svf = _create_variable(out, 'sky_view_factor', dem.dimensions,
+                                   dtype, long_name='sky view factor')
+            tcf = _create_variable(
+                out, 'terrain_configuration_factor', dem.dimensions,
+                dtype, long_name='terrain configuration factor')
+
+            kwargs = dict(nangles=nangles, workers=workers, dtype=dtype)
+            if tile_size is None:
+                svf[:], tcf[:] = viewf(
+                    np.asarray(dem[:], dtype=dtype), spacing, **kwargs)
+            else:
+                viewf_tiled(dem, spacing, max_distance, tile_size=tile_size,
+                            svf=svf, tcf=tcf, **kwargs)
+    finally:
+        ds.close()
+
+
+@main.command('shade')
+@dem_options
+@click.option('--azimuth', type=float, multiple=True, required=True,
+              help='Azimuth to the sun in degrees from south, -180..180. '
+              'Give one for each time.')
+@click.option('--zenith', type=float, multiple=True, required=True,
+              help='Solar zenith angle in degrees, 0..90. Give one for '
+              'each time.')
+@click.option('--cast-shadows', is_flag=True,
+              help='Set the cells in the shadow of the terrain to 0.')
+def shade_command(dem_file, out_file, variable, spacing, dtype, workers,
+                  tile_size, max_memory, azimuth, zenith, cast_shadows):
+    """Cosine of the local illumination angle for each sun position.
+
+    The dem is read a block of --tile-size rows at a time. The shadows
+    of --cast-shadows are found along lines through the whole dem, so
+    the whole dem is read.
+    """
+
+    if len(azimuth) != len(zenith):
+        raise click.UsageError(
+            'give the same number of --azimuth and --zenith')
+
+    dtype = np.dtype(dtype)
+    ds, dem, dx, dy = _open_dem(dem_file, variable, spacing)
+
+    try:
+        if cast_shadows:
+            if tile_size is not None:
+                raise click.UsageError(
+                    '--tile-size can not be used with --cast-shadows')
+
+            _tile_size(dem.shape, dx, None, None, max_memory,
+                       dtype.itemsize, ARRAYS['shade'])
+            rows = dem.shape[0]
+        else:
+            rows = _block_rows(dem.shape[1], tile_size, max_memory,
+                               dtype.itemsize, ARRAYS['shade'])
+
+        with _create_output(out_file, ds, dem) as out:
+            out.createDimension('time', len(azimuth))
+            for name, values in (('azimuth', azimuth), ('zenith', zenith)):
+                v = out.createVariable(name, np.float64, ('time',))
+                v.units = 'degrees'
+                v[:] = values
+
+            mu = _create_variable(
+                out, 'illumination', ('time',) + dem.dimensions, dtype,
+                long_name='cosine of the local illumination angle')
+
+            for tile, window, inner in tile_windows(
+                    dem.shape, (rows, dem.shape[1]), 1):
+                block = np.asarray(dem[window], dtype=dtype)
+                _, sin_slope, _, aspect = gradient_c(
+                    block, dx, dy, nthreads=workers,
+                    out=(None, np.empty_like(block), None,
+                         np.empty_like(block)),
+                    dtype=dtype)
+
+                if cast_shadows:
+                    for k in range(len(azimuth)):
+                        mu[k] = illumination(
+                            block, dx, azimuth[k], zenith=zenith[k],
+                            sin_slope=sin_slope, aspect=aspect,
+                            nthreads=workers, dtype=dtype)
+                else:
+                    for k, m in enumerate(iter_shade(
+                            sin_slope[inner], aspect[inner], azimuth,
+                            zenith=zenith, dtype=dtype)):
+                        mu[(k,) + tile] = m
+    finally:
+        ds.close()
 
 
 if __name__ == "__main__":
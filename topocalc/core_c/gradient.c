@@ -0,0 +1,36 @@
+/*
+ * gradient for the slope and aspect of an elevation array
+ */
+
+#include <math.h>
+#include <stdlib.h>
+#include <stdbool.h>
+#include <stddef.h>
+#include "topo_core.h"
+
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+
+#ifndef M_PI
+#define M_PI 3.14159265358979323846
+#endif
+
+/*
+ * The gradient for double (gradient2d) and float (gradient2d_f) arrays
+ */
+#define REAL double
+#define PAD_ROW pad_row
+#define GRADIENT2D gradient2d
+#include "gradient_real.h"
+#undef REAL
+#undef PAD_ROW
+#undef GRADIENT2D
+
+#define REAL float
+#define PAD_ROW pad_row_f
+#define GRADIENT2D gradient2d_f
+#include "gradient_real.h"
+#undef REAL
+#undef PAD_ROW
+#undef GRADIENT2D
@@ -0,0 +1,159 @@
+/*
+ * Gradient functions for elevations of type REAL, included by
+ * gradient.c once for double and once for float.
+ */
+
+/*
+ * Row r of the padded elevations in buf, with ncols + 2 values. The
+ * edges are extrapolated the same as topocalc.gradient.pad_rows, the
+ * rows above and below the array first and then the columns on either
+ * side of every row. With a single row or column the edge is its own
+ * neighbor, so the padding repeats it like the edge padding of
+ * pad_rows.
+ */
+static void PAD_ROW(
+    ptrdiff_t nrows, /* rows of elevations array */
+    ptrdiff_t ncols, /* columns of elevations array */
+    REAL *z,         /* elevations */
+    ptrdiff_t r,     /* row from -1 to nrows */
+    double *buf)     /* padded row (return) */
+{
+    ptrdiff_t c; /* column index */
+    REAL *z0;    /* row at the edge */
+    REAL *z1;    /* row inside the edge */
+
+    if (r < 0 || r >= nrows)
+    {
+        if (r < 0)
+        {
+            z0 = z;
+            z1 = nrows > 1 ? z + ncols : z0;
+        }
+        else
+        {
+            z0 = z + (nrows - 1) * ncols;
+            z1 = nrows > 1 ? z0 - ncols : z0;
+        }
+
+        for (c = 0; c < ncols; c++)
+            buf[c + 1] = (double)z0[c] + ((double)z0[c] - (double)z1[c]);
+    }
+    else
+    {
+        for (c = 0; c < ncols; c++)
+            buf[c + 1] = (double)z[r * ncols + c];
+    }
+
+    // left
+    if (ncols == 1)
+        buf[2] = buf[1];
+    buf[0] = buf[1] + (buf[1] - buf[2]);
+
+    // right
+    buf[ncols + 1] = buf[ncols] - (buf[ncols - 1] - buf[ncols]);
+}
+
+/*
+ * Slope and aspect in one pass over the elevations with the d8 or d4
+ * finite differences of topocalc.gradient. Three padded rows are kept
+ * for the stencil instead of a padded copy of the array. Any of the
+ * outputs can be NULL.
+ */
+void GRADIENT2D(
+    ptrdiff_t nrows,  /* rows of elevations array */
+    ptrdiff_t ncols,  /* columns of elevations array */
+    REAL *z,          /* elevations */
+    double dx,        /* cell size along the x axis */
+    double dy,        /* cell size along the y axis */
+    bool d8,          /* d8 finite difference, d4 if false */
+    int nthreads,     /* number of threads, < 1 uses the OpenMP default */
+    REAL *slope,      /* slope in radians */
+    REAL *sin_slope,  /* sine of the slope */
+    REAL *cos_slope,  /* cosine of the slope */
+    REAL *aspect)     /* aspect in IPW radians from south */
+{
+#ifdef _OPENMP
+    if (nthreads < 1)
+        nthreads = omp_get_max_threads();
+#else
+    nthreads = 1;
+#endif
+
+#pragma omp parallel num_threads(nthreads)
+    {
+        ptrdiff_t r, c; /* loop index */
+        ptrdiff_t i;    /* array index */
+        double *above;  /* padded row above */
+        double *row;    /* padded row */
+        double *below;  /* padded row below */
+        double dz_dx;   /* finite difference in x */
+        double dz_dy;   /* finite difference in y */
+        double g;       /* gradient */
+        double h;       /* hypotenuse of the gradient and 1 */
+        double a;       /* angle in degrees */
+        double aout;    /* aspect in degrees from north */
+
+        above = (double *)calloc(ncols + 2, sizeof(double));
+        row = (double *)calloc(ncols + 2, sizeof(double));
+        below = (double *)calloc(ncols + 2, sizeof(double));
+
+#pragma omp for schedule(static)
+        for (r = 0; r < nrows; r++)
+        {
+            PAD_ROW(nrows, ncols, z, r - 1, above);
+            PAD_ROW(nrows, ncols, z, r, row);
+            PAD_ROW(nrows, ncols, z, r + 1, below);
+
+            for (c = 1; c <= ncols; c++)
+            {
+                if (d8)
+                {
+                    dz_dy = ((below[c - 1] + 2 * below[c] + below[c + 1]) -
+                             (above[c - 1] + 2 * above[c] + above[c + 1])) /
+                            (8 * dy);
+                    dz_dx = ((above[c + 1] + 2 * row[c + 1] + below[c + 1]) -
+                             (above[c - 1] + 2 * row[c - 1] + below[c - 1])) /
+                            (8 * dx);
+                }
+                else
+                {
+                    dz_dy = (below[c] - above[c]) / (2 * dy);
+                    dz_dx = (row[c + 1] - row[c - 1]) / (2 * dx);
+                }
+
+                i = r * ncols + c - 1;
+                g = sqrt(dz_dx * dz_dx + dz_dy * dz_dy);
+                h = sqrt(1 + g * g);
+
+                if (slope != NULL)
+                    slope[i] = (REAL)atan(g);
+
+                // sin and cos of atan(g)
+                if (sin_slope != NULL)
+                    sin_slope[i] = (REAL)(g / h);
+
+                if (cos_slope != NULL)
+                    cos_slope[i] = (REAL)(1 / h);
+
+                if (aspect != NULL)
+                {
+                    // degrees clockwise from north, flat is south
+                    a = 180 * atan2(dz_dy, -dz_dx) / M_PI;
+                    if (a > 90)
+                        aout = 360 - a + 90;
+                    else
+                        aout = 90 - a;
+
+                    if (dz_dy == 0 && dz_dx == 0)
+                        aout = 180;
+
+                    aspect[i] = (REAL)(M_PI - aout * M_PI / 180);
+                }
+            }
+        }
+
+        free(above);
+        free(row);
+        free(below);
+    }
+}
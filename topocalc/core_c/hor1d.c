@@ -2,69 +2,167 @@
  * horizon in forward direction for equi-spaced elevation vector
  */
 
+#include <float.h>
 #include <math.h>
 #include <stdlib.h>
 #include <stdbool.h>
+#include <stddef.h>
 #include <stdio.h>
 #include "topo_core.h"
 
-void hor2d(
-    int nrows,    /* rows of elevations array */
-    int ncols,    /* columns of elevations array */
-    double *z,    /* elevations */
-    double delta, /* spacing */
-    bool forward, /* forward function */
-    double *hcos) /* cosines of angles to horizon */
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+
+/*
+ * Exact sum of a and b as s + e (Knuth's two-sum)
+ */
+static inline void two_sum(double a, double b, double *s, double *e)
 {
-    int i, j; /* loop index */
+    double bv, av;
 
-    /*
-    * Allocate an array for the line buffers to populate
-    */
-    int *hbuf;
-    hbuf = (int *)calloc(ncols, sizeof(int));
+    *s = a + b;
+    bv = *s - a;
+    av = *s - bv;
+    *e = (a - av) + (b - bv);
+}
 
-    double *obuf;
-    obuf = (double *)calloc(ncols, sizeof(double));
+/*
+ * Exact product of a and b as p + e
+ */
+static inline void two_product(double a, double b, double *p, double *e)
+{
+    *p = a * b;
+    *e = fma(a, b, -*p);
+}
+
+/*
+ * Sign of (zb - zi) * da - (za - zi) * db without any rounding, from the
+ * exact differences and products summed into a nonoverlapping expansion
+ * (Shewchuk 1997). The sign of the sum is the sign of the largest
+ * nonzero component, which is the last one.
+ */
+static int exact_sign(double zi, double za, double da, double zb, double db)
+{
+    double sa, ea, sb, eb;
+    double t[8];
+    double q, lo;
+    int m, j, k;
 
-    double *zbuf;
-    zbuf = (double *)calloc(ncols, sizeof(double));
+    two_sum(zb, -zi, &sb, &eb);
+    two_sum(za, -zi, &sa, &ea);
+    two_product(sb, da, &t[0], &t[1]);
+    two_product(eb, da, &t[2], &t[3]);
+    two_product(-sa, db, &t[4], &t[5]);
+    two_product(-ea, db, &t[6], &t[7]);
 
-    /*
-     * main loop, read in full line at a time
-     */
-    for (i = 0; i < nrows; i++)
+    for (m = 1; m < 8; m++)
     {
-        // Fill the zbuf with the rows elevation
-        for (j = 0; j < ncols; j++)
+        q = t[m];
+        for (j = 0; j < m; j++)
         {
-            zbuf[j] = z[j + ncols * i];
+            two_sum(q, t[j], &q, &lo);
+            t[j] = lo;
         }
+        t[m] = q;
+    }
 
-        /*
-    	 * find points that form horizons
-    	 */
-        if (forward)
-        {
-            hor1f(ncols, zbuf, hbuf);
-        }
-        else
-        {
-            hor1b(ncols, zbuf, hbuf);
-        }
+    for (k = 7; k >= 0; k--)
+    {
+        if (t[k] != 0.0)
+            return t[k] > 0.0 ? 1 : -1;
+    }
+    return 0;
+}
 
-        /*
-    	 * if not mask output, compute and write horizons along each row
-    	 */
-        horval(ncols, zbuf, delta, hbuf, obuf);
+/*
+ * True if the slope from (0, zi) to (db, zb) is greater than the slope
+ * to (da, za). A distance da of 0 is the point itself, with a slope of
+ * 0. The slopes are compared as (zb - zi) * da > (za - zi) * db, which
+ * is decided in floating point when it's clear of the rounding error
+ * and exactly otherwise. So ties are ties and every search breaks them
+ * the same way, even for collinear points whose slopes round
+ * differently.
+ */
+static inline bool steeper(double zi, double za, int da, double zb, int db)
+{
+    double ta, tb, det, err;
 
-        for (j = 0; j < ncols; j++)
-        {
-            hcos[i * ncols + j] = obuf[j];
-        }
+    if (da == 0)
+        return zb > zi;
+
+    tb = (zb - zi) * (double)da;
+    ta = (za - zi) * (double)db;
+    det = tb - ta;
+    err = 4.0 * DBL_EPSILON * (fabs(ta) + fabs(tb));
+
+    if (det > err)
+        return true;
+    if (det < -err)
+        return false;
+    return exact_sign(zi, za, (double)da, zb, (double)db) > 0;
+}
+
+/*
+ * Find the horizon points of one line with the convex hull or the brute
+ * force search. The search is limited to max_steps points from each
+ * point when max_steps is 0 or more and shorter than the line.
+ */
+static void search_line(
+    int n,         /* length of the line */
+    double *z,     /* elevations */
+    bool forward,  /* forward function */
+    bool hull,     /* use the convex hull search */
+    int max_steps, /* points to search from each point, < 0 for all */
+    int *h)        /* horizon function (return) */
+{
+    if (max_steps >= 0 && max_steps < n - 1)
+    {
+        if (forward)
+            hor1f_bounded(n, z, h, max_steps);
+        else
+            hor1b_bounded(n, z, h, max_steps);
+    }
+    else if (forward)
+    {
+        if (hull)
+            hor1f_hull(n, z, h);
+        else
+            hor1f(n, z, h);
+    }
+    else
+    {
+        if (hull)
+            hor1b_hull(n, z, h);
+        else
+            hor1b(n, z, h);
     }
 }
 
+/*
+ * The 2D functions for double (hor2d, hor2d_skew, shadow2d) and float
+ * (hor2d_f, hor2d_skew_f, shadow2d_f) arrays
+ */
+#define REAL double
+#define HOR2D hor2d
+#define HOR2D_SKEW hor2d_skew
+#define SHADOW2D shadow2d
+#include "hor2d_real.h"
+#undef REAL
+#undef HOR2D
+#undef HOR2D_SKEW
+#undef SHADOW2D
+
+#define REAL float
+#define HOR2D hor2d_f
+#define HOR2D_SKEW hor2d_skew_f
+#define SHADOW2D shadow2d_f
+#include "hor2d_real.h"
+#undef REAL
+#undef HOR2D
+#undef HOR2D_SKEW
+#undef SHADOW2D
+
 /*
 * hor1f from hor1f.c in IPW
 * https://github.com/USDA-ARS-NWRC/ipw/blob/main/src/bin/topocalc/horizon/hor1d/hor1f.c
@@ -74,13 +172,10 @@ int hor1f(
     double *z, /* elevation function */
     int *h)    /* horizon function (return) */
 {
-    double slope_ik;  /* slope i to k */
-    double max_slope; /* max slope value */
     int max_point;    /* point with max horizon */
     double zi;        /* z[i] */
     int i;            /* current point index */
     int k;            /* search point index */
-    double dist;      /* difference between i and k */
 
     /*
     * end point is its own horizon in forward direction; first point is
@@ -98,7 +193,6 @@ int hor1f(
         zi = z[i];
 
         /* assume the point is it's own horizon at first*/
-        max_slope = 0.0;
         max_point = i;
 
         /*
@@ -115,19 +209,13 @@ int hor1f(
 
             if (z[k] > zi)
             {
-                dist = (double)(k - i);
-                slope_ik = (z[k] - zi) / dist;
-
                 /*
                 * Compare each kth point against the maximum slope
                 * already found. If it's slope is greater than the previous
                 * horizon, then it's found a new horizon
                 */
-                if (slope_ik > max_slope)
-                {
-                    max_slope = slope_ik;
+                if (steeper(zi, z[max_point], max_point - i, z[k], k - i))
                     max_point = k;
-                }
             }
         }
 
@@ -145,13 +233,10 @@ int hor1b(
     double *z, /* elevation function */
     int *h)    /* horizon function (return) */
 {
-    double slope_ik;  /* slope i to k */
-    double max_slope; /* max slope value */
     int max_point;    /* point with max horizon */
     double zi;        /* z[i] */
     int i;            /* current point index */
     int k;            /* search point index */
-    double dist;      /* difference between i and k */
 
     /*
     * end point is its own horizon in forward direction; first point is
@@ -169,7 +254,6 @@ int hor1b(
         zi = z[i];
 
         /* assume the point is it's own horizon at first*/
-        max_slope = 0.0;
         max_point = i;
 
         /*
@@ -186,19 +270,13 @@ int hor1b(
             */
             if (z[k] > zi)
             {
-                dist = (double)(i - k);
-                slope_ik = (z[k] - zi) / dist;
-
                 /*
                 * Compare each kth point against the maximum slope
                 * already found. If it's slope is greater than the previous
                 * horizon, then it's found a new horizon
                 */
-                if (slope_ik > max_slope)
-                {
-                    max_slope = slope_ik;
+                if (steeper(zi, z[max_point], i - max_point, z[k], i - k))
                     max_point = k;
-                }
             }
         }
 
@@ -207,6 +285,194 @@ int hor1b(
     return (0);
 }
 
+/*
+* hor1f with the search limited to the r points in front of each point,
+* which is O(n r) instead of O(n^2). Ties go to the closest point like
+* hor1f, so a horizon within r points is the same as hor1f.
+*
+* The search stops once no point further away can have a higher slope,
+* which is when the slope to the highest point in front is no higher.
+* This is the same comparison as the slopes so it is exact.
+*/
+int hor1f_bounded(
+    int n,     /* length of vectors b and h */
+    double *z, /* elevation function */
+    int *h,    /* horizon function (return) */
+    int r)     /* points to search in front of each point */
+{
+    int max_point;    /* point with max horizon */
+    double zi;        /* z[i] */
+    int i;            /* current point index */
+    int k;            /* search point index */
+    int end;          /* one past the last point to search */
+    double zmax;      /* highest point in front of i */
+
+    h[n - 1] = n - 1;
+    zmax = z[n - 1];
+
+    for (i = n - 2; i >= 0; --i)
+    {
+        zi = z[i];
+        max_point = i;
+
+        end = r < n - 1 - i ? i + r + 1 : n;
+        for (k = i + 1; k < end; k++)
+        {
+            if (!steeper(zi, z[max_point], max_point - i, zmax, k - i))
+                break;
+
+            if (z[k] > zi &&
+                steeper(zi, z[max_point], max_point - i, z[k], k - i))
+                max_point = k;
+        }
+
+        h[i] = max_point;
+        if (zi > zmax)
+            zmax = zi;
+    }
+    return (0);
+}
+
+/*
+* hor1b with the search limited to the r points behind each point, see
+* hor1f_bounded
+*/
+int hor1b_bounded(
+    int n,     /* length of vectors b and h */
+    double *z, /* elevation function */
+    int *h,    /* horizon function (return) */
+    int r)     /* points to search behind each point */
+{
+    int max_point;    /* point with max horizon */
+    double zi;        /* z[i] */
+    int i;            /* current point index */
+    int k;            /* search point index */
+    int end;          /* last point to search */
+    double zmax;      /* highest point behind i */
+
+    h[0] = 0;
+    zmax = z[0];
+
+    for (i = 1; i < n; ++i)
+    {
+        zi = z[i];
+        max_point = i;
+
+        end = r < i ? i - r : 0;
+        for (k = i - 1; k >= end; k--)
+        {
+            if (!steeper(zi, z[max_point], i - max_point, zmax, i - k))
+                break;
+
+            if (z[k] > zi &&
+                steeper(zi, z[max_point], i - max_point, z[k], i - k))
+                max_point = k;
+        }
+
+        h[i] = max_point;
+        if (zi > zmax)
+            zmax = zi;
+    }
+    return (0);
+}
+
+/*
+* Convex hull version of hor1f, following the upper convex hull method
+* of Dozier and Frew (1990). The horizon of a point is the point of
+* tangency from that point to the upper convex hull of all points in
+* front of it. The hull is kept as a chain through h, where h[k] is the
+* next hull vertex in front of k, so each point only walks the part of
+* the chain it removes from the hull. This is O(n) for the whole vector
+* instead of the O(n^2) search in hor1f.
+*
+* Ties in slope go to the closest point and only points higher than the
+* starting point can be a horizon, like hor1f. The slopes are compared
+* exactly with steeper, so a tie is a tie in both searches and the
+* horizon indices are the same as hor1f, also on flat and collinear
+* points where the divided slopes round differently.
+*/
+int hor1f_hull(
+    int n,     /* length of vectors b and h */
+    double *z, /* elevation function */
+    int *h)    /* horizon function (return) */
+{
+    double zi; /* z[i] */
+    int i;     /* current point index */
+    int k;     /* hull point index */
+
+    /*
+    * end point is its own horizon and the end of the hull chain
+    */
+    h[n - 1] = n - 1;
+
+    for (i = n - 2; i >= 0; --i)
+    {
+        zi = z[i];
+
+        /*
+        * Walk the hull chain from the adjacent point while the slope
+        * to the next hull vertex is greater than the slope to the
+        * current one. Where the slope stops increasing is the tangent.
+        */
+        k = i + 1;
+        while (h[k] != k && steeper(zi, z[k], k - i, z[h[k]], h[k] - i))
+        {
+            k = h[k];
+        }
+
+        h[i] = k;
+    }
+
+    /*
+    * The hull chain is the horizon only where the tangent point is
+    * higher than the point, otherwise the point is its own horizon
+    */
+    for (i = 0; i < n - 1; i++)
+    {
+        if (!(z[h[i]] > z[i]))
+            h[i] = i;
+    }
+    return (0);
+}
+
+/*
+* Convex hull version of hor1b, see hor1f_hull
+*/
+int hor1b_hull(
+    int n,     /* length of vectors b and h */
+    double *z, /* elevation function */
+    int *h)    /* horizon function (return) */
+{
+    double zi; /* z[i] */
+    int i;     /* current point index */
+    int k;     /* hull point index */
+
+    /*
+    * first point is its own horizon and the end of the hull chain
+    */
+    h[0] = 0;
+
+    for (i = 1; i < n; ++i)
+    {
+        zi = z[i];
+
+        k = i - 1;
+        while (h[k] != k && steeper(zi, z[k], i - k, z[h[k]], i - h[k]))
+        {
+            k = h[k];
+        }
+
+        h[i] = k;
+    }
+
+    for (i = 1; i < n; i++)
+    {
+        if (!(z[h[i]] > z[i]))
+            h[i] = i;
+    }
+    return (0);
+}
+
 /*
 **	Calculate values of cosines of angles to horizons, measured
 **	from zenith, from elevation difference and distance.  Let
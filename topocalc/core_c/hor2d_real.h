@@ -0,0 +1,387 @@
+/*
+ * 2D horizon and shadow functions for elevations of type REAL,
+ * included by hor1d.c once for double and once for float. The lines
+ * are copied to double buffers so the searches are always done in
+ * double precision.
+ */
+
+void HOR2D(
+    ptrdiff_t nrows, /* rows of elevations array */
+    ptrdiff_t ncols, /* columns of elevations array */
+    REAL *z,         /* elevations */
+    int axis,        /* 1 lines along the rows, 0 lines down the columns */
+    double delta,    /* spacing */
+    bool forward,    /* forward function */
+    bool hull,       /* use the convex hull search */
+    int max_steps,   /* points to search from each point, < 0 for all */
+    int nthreads,    /* number of threads, < 1 uses the OpenMP default */
+    REAL *hcos,      /* cosines of angles to horizon */
+    ptrdiff_t *hidx, /* array index of the horizon cells, or NULL */
+    const unsigned char *mask, /* only lines with a cell set, or NULL */
+    volatile int *cancel) /* stop when set to non zero, or NULL */
+{
+    ptrdiff_t nlines;  /* number of lines */
+    ptrdiff_t npoints; /* points in a line */
+    ptrdiff_t sstride; /* array stride along a line */
+    ptrdiff_t cstride; /* array stride between lines */
+
+    /*
+     * sweeping down the columns reads the array in place with a stride
+     * instead of transposing it
+     */
+    if (axis == 0)
+    {
+        nlines = ncols;
+        npoints = nrows;
+        sstride = ncols;
+        cstride = 1;
+    }
+    else
+    {
+        nlines = nrows;
+        npoints = ncols;
+        sstride = 1;
+        cstride = ncols;
+    }
+
+#ifdef _OPENMP
+    if (nthreads < 1)
+        nthreads = omp_get_max_threads();
+#else
+    nthreads = 1;
+#endif
+
+    /*
+     * lines are independent so split them between the threads, each
+     * thread has its own line buffers
+     */
+#pragma omp parallel num_threads(nthreads)
+    {
+        ptrdiff_t i, j; /* loop index */
+
+        /*
+        * Allocate an array for the line buffers to populate
+        */
+        int *hbuf;
+        hbuf = (int *)calloc(npoints, sizeof(int));
+
+        double *obuf;
+        obuf = (double *)calloc(npoints, sizeof(double));
+
+        double *zbuf;
+        zbuf = (double *)calloc(npoints, sizeof(double));
+
+        /*
+         * main loop, read in full line at a time
+         */
+#pragma omp for schedule(static)
+        for (i = 0; i < nlines; i++)
+        {
+            // the remaining lines are skipped once cancelled
+            if (cancel != NULL && *cancel)
+                continue;
+
+            // lines without a cell in the mask are left as they are
+            if (mask != NULL)
+            {
+                for (j = 0; j < npoints; j++)
+                {
+                    if (mask[i * cstride + j * sstride])
+                        break;
+                }
+                if (j == npoints)
+                    continue;
+            }
+
+            // Fill the zbuf with the lines elevation
+            for (j = 0; j < npoints; j++)
+            {
+                zbuf[j] = z[i * cstride + j * sstride];
+            }
+
+            /*
+             * find points that form horizons
+             */
+            search_line((int)npoints, zbuf, forward, hull, max_steps, hbuf);
+
+            /*
+             * if not mask output, compute and write horizons along each line
+             */
+            horval((int)npoints, zbuf, delta, hbuf, obuf);
+
+            for (j = 0; j < npoints; j++)
+            {
+                hcos[i * cstride + j * sstride] = (REAL)obuf[j];
+            }
+
+            if (hidx != NULL)
+            {
+                for (j = 0; j < npoints; j++)
+                {
+                    hidx[i * cstride + j * sstride] =
+                        i * cstride + hbuf[j] * sstride;
+                }
+            }
+        }
+
+        free(hbuf);
+        free(obuf);
+        free(zbuf);
+    }
+}
+
+/*
+* Horizons along skewed lines through the elevation array, this does
+* the skew, horizon and unskew for an oblique direction in one pass.
+* Line k of the skewed array passes through the cell at row
+* (column for axis 1) s and column (row for axis 1) k - offsets[s] for
+* every s where that is inside the array. The skewed array is never
+* made, the fill cells at the ends of the lines are lower than every
+* real cell so they can't be a horizon and are skipped. The cosines
+* are written to the same cell in hcos and the array index of the
+* horizon cell to hidx if given.
+*/
+void HOR2D_SKEW(
+    ptrdiff_t nrows, /* rows of elevations array */
+    ptrdiff_t ncols, /* columns of elevations array */
+    REAL *z,         /* elevations */
+    int axis,        /* 0 lines run down the rows, 1 along the columns */
+    int *offsets,    /* skew offset for each point along the lines */
+    double delta,    /* spacing along the lines */
+    bool forward,    /* forward function */
+    bool hull,       /* use the convex hull search */
+    int max_steps,   /* points to search from each point, < 0 for all */
+    int nthreads,    /* number of threads, < 1 uses the OpenMP default */
+    REAL *hcos,      /* cosines of angles to horizon */
+    ptrdiff_t *hidx, /* array index of the horizon cells, or NULL */
+    const unsigned char *mask, /* only lines with a cell set, or NULL */
+    volatile int *cancel) /* stop when set to non zero, or NULL */
+{
+    ptrdiff_t nsweep;  /* points along a line */
+    ptrdiff_t ncross;  /* lines in the unskewed array */
+    ptrdiff_t nlines;  /* lines in the skewed array */
+    ptrdiff_t sstride; /* array stride along a line */
+    ptrdiff_t cstride; /* array stride across the lines */
+    int max_skew;      /* largest offset */
+    ptrdiff_t i;       /* loop index */
+
+    if (axis == 0)
+    {
+        nsweep = nrows;
+        ncross = ncols;
+        sstride = ncols;
+        cstride = 1;
+    }
+    else
+    {
+        nsweep = ncols;
+        ncross = nrows;
+        sstride = 1;
+        cstride = ncols;
+    }
+
+    max_skew = 0;
+    for (i = 0; i < nsweep; i++)
+    {
+        if (offsets[i] > max_skew)
+            max_skew = offsets[i];
+    }
+    nlines = ncross + max_skew;
+
+#ifdef _OPENMP
+    if (nthreads < 1)
+        nthreads = omp_get_max_threads();
+#else
+    nthreads = 1;
+#endif
+
+#pragma omp parallel num_threads(nthreads)
+    {
+        ptrdiff_t k, s; /* loop index */
+        int j;          /* index in the line */
+        int n;          /* points in the line */
+        ptrdiff_t c;    /* index across the lines */
+        bool masked;    /* line has a cell in the mask */
+
+        int *hbuf;
+        hbuf = (int *)calloc(nsweep, sizeof(int));
+
+        double *obuf;
+        obuf = (double *)calloc(nsweep, sizeof(double));
+
+        double *zbuf;
+        zbuf = (double *)calloc(nsweep, sizeof(double));
+
+        ptrdiff_t *ibuf; /* array index of each point in the line */
+        ibuf = (ptrdiff_t *)calloc(nsweep, sizeof(ptrdiff_t));
+
+        /*
+         * the lines have different lengths so hand them out dynamically
+         */
+#pragma omp for schedule(dynamic, 16)
+        for (k = 0; k < nlines; k++)
+        {
+            if (cancel != NULL && *cancel)
+                continue;
+
+            // Gather the points of the line that are inside the array
+            n = 0;
+            masked = mask == NULL;
+            for (s = 0; s < nsweep; s++)
+            {
+                c = k - offsets[s];
+                if (c >= 0 && c < ncross)
+                {
+                    ibuf[n] = s * sstride + c * cstride;
+                    zbuf[n] = z[ibuf[n]];
+                    masked = masked || mask[ibuf[n]];
+                    n++;
+                }
+            }
+
+            if (n == 0 || !masked)
+                continue;
+
+            search_line(n, zbuf, forward, hull, max_steps, hbuf);
+
+            horval(n, zbuf, delta, hbuf, obuf);
+
+            // Scatter the cosines back to the unskewed cells
+            for (j = 0; j < n; j++)
+            {
+                hcos[ibuf[j]] = (REAL)obuf[j];
+            }
+
+            if (hidx != NULL)
+            {
+                for (j = 0; j < n; j++)
+                {
+                    hidx[ibuf[j]] = ibuf[hbuf[j]];
+                }
+            }
+        }
+
+        free(hbuf);
+        free(obuf);
+        free(zbuf);
+        free(ibuf);
+    }
+}
+
+/*
+* Cast shadows along the lines of hor2d_skew for the sun in the
+* direction of the horizons, setting mu to 0 for the cells in shadow.
+* The horizons are never found, walking toward each cell from the end
+* of the line that faces the sun keeps the highest shadow height
+*
+*     M = max(z[k], M) - tan_elev * delta
+*
+* of the cells already passed, and a cell is in shadow when the shadow
+* height is above it. This is one pass over each line.
+*/
+void SHADOW2D(
+    ptrdiff_t nrows, /* rows of elevations array */
+    ptrdiff_t ncols, /* columns of elevations array */
+    REAL *z,         /* elevations */
+    int axis,        /* 0 lines run down the rows, 1 along the columns */
+    int *offsets,    /* skew offset for each point along the lines */
+    double delta,    /* spacing along the lines */
+    bool forward,    /* the sun is in the forward direction */
+    double tan_elev, /* tangent of the sun elevation angle */
+    int nthreads,    /* number of threads, < 1 uses the OpenMP default */
+    REAL *mu)        /* illumination, set to 0 in shadow */
+{
+    ptrdiff_t nsweep;  /* points along a line */
+    ptrdiff_t ncross;  /* lines in the unskewed array */
+    ptrdiff_t nlines;  /* lines in the skewed array */
+    ptrdiff_t sstride; /* array stride along a line */
+    ptrdiff_t cstride; /* array stride across the lines */
+    int max_skew;      /* largest offset */
+    double drop;       /* drop of the shadow height for each step */
+    ptrdiff_t i;       /* loop index */
+
+    if (axis == 0)
+    {
+        nsweep = nrows;
+        ncross = ncols;
+        sstride = ncols;
+        cstride = 1;
+    }
+    else
+    {
+        nsweep = ncols;
+        ncross = nrows;
+        sstride = 1;
+        cstride = ncols;
+    }
+
+    max_skew = 0;
+    for (i = 0; i < nsweep; i++)
+    {
+        if (offsets[i] > max_skew)
+            max_skew = offsets[i];
+    }
+    nlines = ncross + max_skew;
+    drop = tan_elev * delta;
+
+#ifdef _OPENMP
+    if (nthreads < 1)
+        nthreads = omp_get_max_threads();
+#else
+    nthreads = 1;
+#endif
+
+#pragma omp parallel num_threads(nthreads)
+    {
+        ptrdiff_t k, s; /* loop index */
+        int j;          /* index in the line */
+        int n;          /* points in the line */
+        ptrdiff_t c;    /* index across the lines */
+        double m;       /* shadow height */
+
+        double *zbuf;
+        zbuf = (double *)calloc(nsweep, sizeof(double));
+
+        ptrdiff_t *ibuf; /* array index of each point in the line */
+        ibuf = (ptrdiff_t *)calloc(nsweep, sizeof(ptrdiff_t));
+
+#pragma omp for schedule(dynamic, 16)
+        for (k = 0; k < nlines; k++)
+        {
+            n = 0;
+            for (s = 0; s < nsweep; s++)
+            {
+                c = k - offsets[s];
+                if (c >= 0 && c < ncross)
+                {
+                    ibuf[n] = s * sstride + c * cstride;
+                    zbuf[n] = z[ibuf[n]];
+                    n++;
+                }
+            }
+
+            m = -INFINITY;
+            if (forward)
+            {
+                for (j = n - 1; j >= 0; j--)
+                {
+                    if (m > zbuf[j])
+                        mu[ibuf[j]] = 0;
+                    m = fmax(zbuf[j], m) - drop;
+                }
+            }
+            else
+            {
+                for (j = 0; j < n; j++)
+                {
+                    if (m > zbuf[j])
+                        mu[ibuf[j]] = 0;
+                    m = fmax(zbuf[j], m) - drop;
+                }
+            }
+        }
+
+        free(zbuf);
+        free(ibuf);
+    }
+}
@@ -1,7 +1,31 @@
 #include <stdbool.h>
+#include <stddef.h>
 
-/* From hor1d.c */
+/*
+ * From hor1d.c, the 2D functions index the arrays with ptrdiff_t so
+ * they work on arrays with more than 2^31 cells, a single line is
+ * limited to 2^31 points. The _f functions take float arrays and do
+ * the horizon search in double precision. The horizon functions search
+ * max_steps points from each point (all of them if max_steps < 0), only
+ * search the lines through a cell that is set in mask and skip the
+ * remaining lines once *cancel is set, mask and cancel can be NULL.
+ */
 int hor1f(int n, double *z, int *h);
 int hor1b(int n, double *z, int *h);
+int hor1f_hull(int n, double *z, int *h);
+int hor1b_hull(int n, double *z, int *h);
+int hor1f_bounded(int n, double *z, int *h, int r);
+int hor1b_bounded(int n, double *z, int *h, int r);
 void horval(int n, double *z, double delta, int *h, double *hcos);
-void hor2d(int n, int m, double *z, double delta, bool forward, double *hcos);
\ No newline at end of file
+void hor2d(ptrdiff_t nrows, ptrdiff_t ncols, double *z, int axis, double delta, bool forward, bool hull, int max_steps, int nthreads, double *hcos, ptrdiff_t *hidx, const unsigned char *mask, volatile int *cancel);
+void hor2d_skew(ptrdiff_t nrows, ptrdiff_t ncols, double *z, int axis, int *offsets, double delta, bool forward, bool hull, int max_steps, int nthreads, double *hcos, ptrdiff_t *hidx, const unsigned char *mask, volatile int *cancel);
+void hor2d_f(ptrdiff_t nrows, ptrdiff_t ncols, float *z, int axis, double delta, bool forward, bool hull, int max_steps, int nthreads, float *hcos, ptrdiff_t *hidx, const unsigned char *mask, volatile int *cancel);
+void hor2d_skew_f(ptrdiff_t nrows, ptrdiff_t ncols, float *z, int axis, int *offsets, double delta, bool forward, bool hull, int max_steps, int nthreads, float *hcos, ptrdiff_t *hidx, const unsigned char *mask, volatile int *cancel);
+void shadow2d(ptrdiff_t nrows, ptrdiff_t ncols, double *z, int axis, int *offsets, double delta, bool forward, double tan_elev, int nthreads, double *mu);
+void shadow2d_f(ptrdiff_t nrows, ptrdiff_t ncols, float *z, int axis, int *offsets, double delta, bool forward, double tan_elev, int nthreads, float *mu);
+
+/*
+ * From gradient.c, the arrays need at least 1 row and column
+ */
+void gradient2d(ptrdiff_t nrows, ptrdiff_t ncols, double *z, double dx, double dy, bool d8, int nthreads, double *slope, double *sin_slope, double *cos_slope, double *aspect);
+void gradient2d_f(ptrdiff_t nrows, ptrdiff_t ncols, float *z, double dx, double dy, bool d8, int nthreads, float *slope, float *sin_slope, float *cos_slope, float *aspect);
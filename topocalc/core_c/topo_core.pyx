@@ -17,11 +17,28 @@ import ctypes
 # _always_ do that, or you will have segfaults
 np.import_array()
 
-cdef extern from "topo_core.h":
+cdef extern from "topo_core.h" nogil:
     void hor1f(int n, double *z, int *h);
     void hor1b(int n, double *z, int *h);
+    void hor1f_hull(int n, double *z, int *h);
+    void hor1b_hull(int n, double *z, int *h);
+    void hor1f_bounded(int n, double *z, int *h, int r);
+    void hor1b_bounded(int n, double *z, int *h, int r);
     void horval(int n, double *z, double delta, int *h, double *hcos);
-    void hor2d(int n, int m, double *z, double delta, bint forward, double *hcos);
+    void hor2d(Py_ssize_t nrows, Py_ssize_t ncols, double *z, int axis, double delta, bint forward, bint hull, int max_steps, int nthreads, double *hcos, Py_ssize_t *hidx, const unsigned char *mask, int *cancel);
+    void hor2d_skew(Py_ssize_t nrows, Py_ssize_t ncols, double *z, int axis, int *offsets, double delta, bint forward, bint hull, int max_steps, int nthreads, double *hcos, Py_ssize_t *hidx, const unsigned char *mask, int *cancel);
+    void hor2d_f(Py_ssize_t nrows, Py_ssize_t ncols, float *z, int axis, double delta, bint forward, bint hull, int max_steps, int nthreads, float *hcos, Py_ssize_t *hidx, const unsigned char *mask, int *cancel);
+    void hor2d_skew_f(Py_ssize_t nrows, Py_ssize_t ncols, float *z, int axis, int *offsets, double delta, bint forward, bint hull, int max_steps, int nthreads, float *hcos, Py_ssize_t *hidx, const unsigned char *mask, int *cancel);
+    void shadow2d(Py_ssize_t nrows, Py_ssize_t ncols, double *z, int axis, int *offsets, double delta, bint forward, double tan_elev, int nthreads, double *mu);
+    void shadow2d_f(Py_ssize_t nrows, Py_ssize_t ncols, float *z, int axis, int *offsets, double delta, bint forward, double tan_elev, int nthreads, float *mu);
+    void gradient2d(Py_ssize_t nrows, Py_ssize_t ncols, double *z, double dx, double dy, bint d8, int nthreads, double *slope, double *sin_slope, double *cos_slope, double *aspect);
+    void gradient2d_f(Py_ssize_t nrows, Py_ssize_t ncols, float *z, double dx, double dy, bint d8, int nthreads, float *slope, float *sin_slope, float *cos_slope, float *aspect);
+
+# the 2D functions work on float32 or float64 arrays, the elevations and
+# horizon cosines have the same type
+ctypedef fused real:
+    float
+    double
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
@@ -29,7 +46,10 @@ cdef extern from "topo_core.h":
 def c_hor1d(np.ndarray[double, mode="c", ndim=1] z,
            double spacing,
            bint forward,
-           np.ndarray[double, mode="c", ndim=1] hcos):
+           np.ndarray[double, mode="c", ndim=1] hcos,
+           bint hull=True,
+           np.ndarray[int, mode="c", ndim=1] index=None,
+           int max_steps=-1):
     """
     Call the function hor1f in hor1f.c
 
@@ -38,6 +58,12 @@ def c_hor1d(np.ndarray[double, mode="c", ndim=1] z,
     Args:
         z: elevation array
         spacing: grid spacing
+        forward: horizon in the forward direction
+        hcos: output array for the horizon cosines
+        hull: use the convex hull search instead of the brute force search
+        index: optional output array for the index of the horizon points
+        max_steps: search only the max_steps points in the direction of
+            the horizon from each point, less than 0 searches them all
     
     Returns
         hcos: cosine angle of horizon array changed in place
@@ -54,42 +80,493 @@ def c_hor1d(np.ndarray[double, mode="c", ndim=1] z,
     cdef np.ndarray[int, ndim=1, mode='c'] h = np.empty((n,), dtype = ctypes.c_int)
 
     # call the hor1f C function
-    if forward:
-        hor1f(n, &z_arr[0], &h[0])
+    if 0 <= max_steps < n - 1:
+        if forward:
+            hor1f_bounded(n, &z_arr[0], &h[0], max_steps)
+        else:
+            hor1b_bounded(n, &z_arr[0], &h[0], max_steps)
+    elif forward:
+        if hull:
+            hor1f_hull(n, &z_arr[0], &h[0])
+        else:
+            hor1f(n, &z_arr[0], &h[0])
     else:
-        hor1b(n, &z_arr[0], &h[0])
+        if hull:
+            hor1b_hull(n, &z_arr[0], &h[0])
+        else:
+            hor1b(n, &z_arr[0], &h[0])
     
     # call the horval C function
     horval(n, &z_arr[0], spacing, &h[0], &hcos[0])
 
+    if index is not None:
+        index[:] = h
+
+cdef int *_cancel_ptr(cancel) except? NULL:
+    """Pointer to the flag of a one value int array for the native
+    functions to check, NULL if cancel is None. The array has to be
+    kept alive by the caller while the pointer is used.
+    """
+
+    cdef np.ndarray[int, mode="c", ndim=1] flag
+
+    if cancel is None:
+        return NULL
+
+    flag = cancel
+    if flag.shape[0] != 1:
+        raise ValueError('cancel must be an int array of one value')
+
+    return &flag[0]
+
+
+cdef unsigned char *_mask_ptr(mask, Py_ssize_t nrows,
+                             Py_ssize_t ncols) except? NULL:
+    """Pointer to a uint8 mask the shape of the elevations for the
+    native functions, NULL if mask is None. The array has to be kept
+    alive by the caller while the pointer is used.
+    """
+
+    cdef np.ndarray[np.uint8_t, mode="c", ndim=2] arr
+
+    if mask is None:
+        return NULL
+
+    arr = mask
+    if arr.shape[0] != nrows or arr.shape[1] != ncols:
+        raise ValueError('mask must be the same shape as z')
+
+    return &arr[0,0]
+
+
 @cython.boundscheck(False)
 @cython.wraparound(False)
 # https://github.com/cython/cython/wiki/tutorials-NumpyPointerToC
-def c_hor2d(np.ndarray[double, mode="c", ndim=2] z,
+def c_hor2d(np.ndarray[real, mode="c", ndim=2] z,
            double spacing,
            bint forward,
-           np.ndarray[double, mode="c", ndim=2] hcos):
+           np.ndarray[real, mode="c", ndim=2] hcos,
+           bint hull=True,
+           int nthreads=1,
+           int axis=1,
+           index=None,
+           mask=None,
+           cancel=None,
+           int max_steps=-1):
     """
-    Call the function hor1f in hor1f.c
+    Call the function hor2d in hor1d.c, or hor2d_f for float32 arrays,
+    the GIL is released while the lines are processed
 
     Args:
         z: elevation array
         spacing: grid spacing
+        forward: horizon in the forward direction
+        hcos: output array for the horizon cosines
+        hull: use the convex hull search instead of the brute force search
+        nthreads: number of threads to split the lines over, less than 1
+            uses all available cores
+        axis: array axis the horizon lines run along, 1 for lines along
+            the rows and 0 for lines down the columns, read in place
+        index: optional output array for the flat array index of the
+            horizon cell of each cell
+        mask: optional uint8 array the same shape as z, only the lines
+            through a non zero cell are searched
+        cancel: optional int array of one value, the remaining lines are
+            skipped once it is set to non zero
+        max_steps: search only the max_steps points in the direction of
+            the horizon from each point, less than 0 searches them all
     
     Returns
         hcos: cosine angle of horizon array changed in place
     """
 
-    cdef int nrows = z.shape[0]
-    cdef int ncols = z.shape[1]
+    cdef Py_ssize_t nrows = z.shape[0]
+    cdef Py_ssize_t ncols = z.shape[1]
     cdef double cspacing = spacing
 
     cdef bint fwd = forward
-    
-    # convert the z array to C
-    cdef np.ndarray[double, mode="c", ndim=2] z_arr
-    z_arr = np.ascontiguousarray(z, dtype=np.float64)
+    cdef bint chull = hull
+
+    if axis < 0:
+        axis += 2
+    if axis != 0 and axis != 1:
+        raise ValueError('axis must be 0 or 1')
+
+    if hcos.shape[0] != nrows or hcos.shape[1] != ncols:
+        raise ValueError('hcos must be the same shape as z')
+
+    cdef real *z_ptr = &z[0,0]
+    cdef real *hcos_ptr = &hcos[0,0]
+    cdef Py_ssize_t *index_ptr = NULL
+    cdef np.ndarray[np.intp_t, mode="c", ndim=2] index_arr
+
+    if index is not None:
+        index_arr = index
+        if index_arr.shape[0] != nrows or index_arr.shape[1] != ncols:
+            raise ValueError('index must be the same shape as z')
+        index_ptr = <Py_ssize_t *>&index_arr[0,0]
+
+    cdef int *cancel_ptr = _cancel_ptr(cancel)
+    cdef unsigned char *mask_ptr = _mask_ptr(mask, nrows, ncols)
 
     # call the hor2d C function
-    hor2d(nrows, ncols, &z_arr[0,0], cspacing, fwd, &hcos[0,0])
+    with nogil:
+        if real is float:
+            hor2d_f(nrows, ncols, z_ptr, axis, cspacing, fwd, chull,
+                    max_steps, nthreads, hcos_ptr, index_ptr, mask_ptr,
+                    cancel_ptr)
+        else:
+            hor2d(nrows, ncols, z_ptr, axis, cspacing, fwd, chull,
+                  max_steps, nthreads, hcos_ptr, index_ptr, mask_ptr,
+                  cancel_ptr)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def c_hor2d_skew(np.ndarray[real, mode="c", ndim=2] z,
+                 int axis,
+                 np.ndarray[int, mode="c", ndim=1] offsets,
+                 double spacing,
+                 bint forward,
+                 np.ndarray[real, mode="c", ndim=2] hcos,
+                 bint hull=True,
+                 int nthreads=1,
+                 index=None,
+                 mask=None,
+                 cancel=None,
+                 int max_steps=-1):
+    """
+    Call the function hor2d_skew in hor1d.c to find the horizons along
+    skewed lines without making the skewed array, or hor2d_skew_f for
+    float32 arrays, the GIL is released while the lines are processed
+
+    Args:
+        z: elevation array
+        axis: 0 if the lines run down the rows, 1 along the columns
+        offsets: skew offset for each point along the lines
+        spacing: grid spacing along the lines
+        forward: horizon in the forward direction
+        hcos: output array for the horizon cosines
+        hull: use the convex hull search instead of the brute force search
+        nthreads: number of threads to split the lines over, less than 1
+            uses all available cores
+        index: optional output array for the flat array index of the
+            horizon cell of each cell
+        mask: optional uint8 array the same shape as z, only the lines
+            through a non zero cell are searched
+        cancel: optional int array of one value, the remaining lines are
+            skipped once it is set to non zero
+        max_steps: search only the max_steps points in the direction of
+            the horizon from each point, less than 0 searches them all
+
+    Returns
+        hcos: cosine angle of horizon array changed in place
+    """
+
+    cdef Py_ssize_t nrows = z.shape[0]
+    cdef Py_ssize_t ncols = z.shape[1]
+
+    if axis != 0 and axis != 1:
+        raise ValueError('axis must be 0 or 1')
+
+    if offsets.shape[0] != z.shape[axis]:
+        raise ValueError('offsets must have one value for each line point')
+
+    if hcos.shape[0] != nrows or hcos.shape[1] != ncols:
+        raise ValueError('hcos must be the same shape as z')
+
+    cdef real *z_ptr = &z[0,0]
+    cdef int *offsets_ptr = &offsets[0]
+    cdef real *hcos_ptr = &hcos[0,0]
+    cdef Py_ssize_t *index_ptr = NULL
+    cdef np.ndarray[np.intp_t, mode="c", ndim=2] index_arr
+
+    if index is not None:
+        index_arr = index
+        if index_arr.shape[0] != nrows or index_arr.shape[1] != ncols:
+            raise ValueError('index must be the same shape as z')
+        index_ptr = <Py_ssize_t *>&index_arr[0,0]
+
+    cdef int *cancel_ptr = _cancel_ptr(cancel)
+    cdef unsigned char *mask_ptr = _mask_ptr(mask, nrows, ncols)
+
+    with nogil:
+        if real is float:
+            hor2d_skew_f(nrows, ncols, z_ptr, axis, offsets_ptr, spacing,
+                         forward, hull, max_steps, nthreads, hcos_ptr,
+                         index_ptr, mask_ptr, cancel_ptr)
+        else:
+            hor2d_skew(nrows, ncols, z_ptr, axis, offsets_ptr, spacing,
+                       forward, hull, max_steps, nthreads, hcos_ptr,
+                       index_ptr, mask_ptr, cancel_ptr)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def c_shadow2d(np.ndarray[real, mode="c", ndim=2] z,
+               int axis,
+               np.ndarray[int, mode="c", ndim=1] offsets,
+               double spacing,
+               bint forward,
+               double tan_elev,
+               np.ndarray[real, mode="c", ndim=2] mu,
+               int nthreads=1):
+    """
+    Call the function shadow2d in hor1d.c to set the illumination to 0
+    for the cells in the shadow of the terrain along the lines of
+    hor2d_skew, the GIL is released while the lines are processed
+
+    Args:
+        z: elevation array
+        axis: 0 if the lines run down the rows, 1 along the columns
+        offsets: skew offset for each point along the lines
+        spacing: grid spacing along the lines
+        forward: the sun is in the forward direction of the lines
+        tan_elev: tangent of the sun elevation angle
+        mu: illumination array the same shape as z
+        nthreads: number of threads to split the lines over, less than 1
+            uses all available cores
+
+    Returns
+        mu: illumination array changed in place
+    """
+
+    cdef Py_ssize_t nrows = z.shape[0]
+    cdef Py_ssize_t ncols = z.shape[1]
+
+    if offsets.shape[0] != z.shape[axis]:
+        raise ValueError('offsets must have one value for each line point')
+
+    if mu.shape[0] != nrows or mu.shape[1] != ncols:
+        raise ValueError('mu must be the same shape as z')
+
+    cdef real *z_ptr = &z[0,0]
+    cdef int *offsets_ptr = &offsets[0]
+    cdef real *mu_ptr = &mu[0,0]
+
+    with nogil:
+        if real is float:
+            shadow2d_f(nrows, ncols, z_ptr, axis, offsets_ptr, spacing,
+                       forward, tan_elev, nthreads, mu_ptr)
+        else:
+            shadow2d(nrows, ncols, z_ptr, axis, offsets_ptr, spacing,
+                     forward, tan_elev, nthreads, mu_ptr)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def c_horizons(np.ndarray[real, mode="c", ndim=2] z,
+               np.ndarray[int, mode="c", ndim=1] axes,
+               np.ndarray[int, mode="c", ndim=2] offsets,
+               np.ndarray[double, mode="c", ndim=1] spacings,
+               np.ndarray[np.uint8_t, mode="c", ndim=1] forwards,
+               np.ndarray[real, mode="c", ndim=3] hcos,
+               bint hull=True,
+               int nthreads=1,
+               cancel=None,
+               max_steps=None):
+    """
+    Horizons for many directions, the loop over the directions calls
+    hor2d_skew without the GIL
+
+    Args:
+        z: elevation array
+        axes: axis of the lines for each direction
+        offsets: skew offsets for each direction, with as many columns as
+            the longest line
+        spacings: grid spacing along the lines for each direction
+        forwards: horizon in the forward direction for each direction
+        hcos: output array of shape (directions, rows, columns)
+        hull: use the convex hull search instead of the brute force search
+        nthreads: number of threads to split the lines over, less than 1
+            uses all available cores
+        cancel: optional int array of one value, the remaining lines and
+            directions are skipped once it is set to non zero
+        max_steps: optional int array of the points to search from each
+            point for each direction, less than 0 searches them all
+
+    Returns
+        hcos: cosine angle of horizon array changed in place
+    """
+
+    cdef Py_ssize_t nrows = z.shape[0]
+    cdef Py_ssize_t ncols = z.shape[1]
+    cdef int ndirs = axes.shape[0]
+    cdef int k
+
+    if (hcos.shape[0] != ndirs or hcos.shape[1] != nrows or
+            hcos.shape[2] != ncols):
+        raise ValueError('hcos must have shape (directions, rows, columns)')
+
+    if offsets.shape[0] != ndirs or offsets.shape[1] < max(nrows, ncols):
+        raise ValueError('offsets must have a row for each direction')
+
+    if spacings.shape[0] != ndirs or forwards.shape[0] != ndirs:
+        raise ValueError('spacings and forwards need a value for each direction')
+
+    for k in range(ndirs):
+        if axes[k] != 0 and axes[k] != 1:
+            raise ValueError('axes must be 0 or 1')
+
+    cdef np.ndarray[int, mode="c", ndim=1] steps
+    if max_steps is None:
+        steps = np.full(ndirs, -1, dtype=np.intc)
+    else:
+        steps = max_steps
+        if steps.shape[0] != ndirs:
+            raise ValueError('max_steps needs a value for each direction')
+
+    # directions without a skew don't need the skewed lines
+    cdef np.ndarray[np.uint8_t, mode="c", ndim=1] skewed
+    skewed = np.any(offsets != 0, axis=1).astype(np.uint8)
+
+    cdef real *z_ptr = &z[0,0]
+    cdef int *cancel_ptr = _cancel_ptr(cancel)
+
+    with nogil:
+        for k in range(ndirs):
+            if cancel_ptr != NULL and cancel_ptr[0]:
+                break
+
+            if real is float:
+                if skewed[k]:
+                    hor2d_skew_f(nrows, ncols, z_ptr, axes[k],
+                                 &offsets[k,0], spacings[k], forwards[k],
+                                 hull, steps[k], nthreads, &hcos[k,0,0],
+                                 NULL, NULL, cancel_ptr)
+                else:
+                    hor2d_f(nrows, ncols, z_ptr, axes[k],
+                            spacings[k], forwards[k], hull, steps[k],
+                            nthreads, &hcos[k,0,0], NULL, NULL, cancel_ptr)
+            else:
+                if skewed[k]:
+                    hor2d_skew(nrows, ncols, z_ptr, axes[k], &offsets[k,0],
+                               spacings[k], forwards[k], hull, steps[k],
+                               nthreads, &hcos[k,0,0], NULL, NULL,
+                               cancel_ptr)
+                else:
+                    hor2d(nrows, ncols, z_ptr, axes[k],
+                          spacings[k], forwards[k], hull, steps[k],
+                          nthreads, &hcos[k,0,0], NULL, NULL, cancel_ptr)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def c_gradient2d(real[:, ::1] z,
+                 double dx,
+                 double dy,
+                 bint d8,
+                 real[:, ::1] slope=None,
+                 real[:, ::1] sin_slope=None,
+                 real[:, ::1] cos_slope=None,
+                 real[:, ::1] aspect=None,
+                 int nthreads=1):
+    """
+    Call the function gradient2d in gradient.c, or gradient2d_f for
+    float32 arrays, the GIL is released while the rows are processed
+
+    Args:
+        z: elevation array with at least 1 row and column
+        dx: cell size along the x axis
+        dy: cell size along the y axis
+        d8: use the d8 finite difference, d4 if False
+        slope: optional output array for the slope in radians
+        sin_slope: optional output array for the sine of the slope
+        cos_slope: optional output array for the cosine of the slope
+        aspect: optional output array for the aspect in IPW radians
+        nthreads: number of threads to split the rows over, less than 1
+            uses all available cores
+
+    Returns
+        the outputs are changed in place
+    """
+
+    cdef Py_ssize_t nrows = z.shape[0]
+    cdef Py_ssize_t ncols = z.shape[1]
+    cdef real *ptrs[4]
+    cdef int k
+
+    if nrows < 1 or ncols < 1:
+        raise ValueError('z must have at least 1 row and column')
+
+    for k, out in enumerate((slope, sin_slope, cos_slope, aspect)):
+        ptrs[k] = NULL
+        if out is not None:
+            if out.shape[0] != nrows or out.shape[1] != ncols:
+                raise ValueError('outputs must be the same shape as z')
+
+    if slope is not None:
+        ptrs[0] = &slope[0, 0]
+    if sin_slope is not None:
+        ptrs[1] = &sin_slope[0, 0]
+    if cos_slope is not None:
+        ptrs[2] = &cos_slope[0, 0]
+    if aspect is not None:
+        ptrs[3] = &aspect[0, 0]
+
+    with nogil:
+        if real is float:
+            gradient2d_f(nrows, ncols, &z[0, 0], dx, dy, d8, nthreads,
+                         ptrs[0], ptrs[1], ptrs[2], ptrs[3])
+        else:
+            gradient2d(nrows, ncols, &z[0, 0], dx, dy, d8, nthreads,
+                       ptrs[0], ptrs[1], ptrs[2], ptrs[3])
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def c_skew(const real[:, :] arr,
+           const Py_ssize_t[:] offsets,
+           bint forward,
+           double fill,
+           real[:, :] out):
+    """
+    Skew or unskew the lines of a float32 or float64 array by the offsets
+    of each line, the GIL is released while the lines are copied
+
+    Args:
+        arr: array to skew, can be strided
+        offsets: offset of each line from topocalc.skew.skew_offsets
+        forward: add the skew if True, remove it if False
+        fill: value for the cells outside of the input when adding the skew
+        out: output array with the skewed number of samples
+
+    Returns
+        out: skewed array changed in place
+    """
+
+    cdef Py_ssize_t nlines = arr.shape[0]
+    cdef Py_ssize_t nsamps = arr.shape[1]
+    cdef Py_ssize_t o_nsamps = out.shape[1]
+    cdef Py_ssize_t line, j, offset
+    cdef Py_ssize_t min_offset = 0
+    cdef Py_ssize_t max_offset = 0
+
+    if offsets.shape[0] != nlines or out.shape[0] != nlines:
+        raise ValueError('offsets and out must have a value for each line')
+
+    for line in range(nlines):
+        min_offset = min(min_offset, offsets[line])
+        max_offset = max(max_offset, offsets[line])
+
+    # the skewed lines have to fit in out, or the unskewed lines in arr
+    if min_offset < 0:
+        raise ValueError('offsets must be 0 or greater')
+    if forward and nsamps + max_offset > o_nsamps:
+        raise ValueError('out is too short for the skewed lines')
+    if not forward and o_nsamps + max_offset > nsamps:
+        raise ValueError('out is too long for the unskewed lines')
 
+    with nogil:
+        for line in range(nlines):
+            offset = offsets[line]
+            if forward:
+                for j in range(offset):
+                    out[line, j] = <real>fill
+                for j in range(nsamps):
+                    out[line, offset + j] = arr[line, j]
+                for j in range(offset + nsamps, o_nsamps):
+                    out[line, j] = <real>fill
+            else:
+                for j in range(o_nsamps):
+                    out[line, j] = arr[line, offset + j]
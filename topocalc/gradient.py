@@ -1,7 +1,10 @@
 import numpy as np
 
+from topocalc.core_c import topo_core
 
-def gradient_d4(dem, dx, dy, aspect_rad=False):
+
+def gradient_d4(dem, dx, dy, aspect_rad=False, out=None, block_rows=None,
+                dtype=None):
     """Calculate the slope and aspect for provided dem,
     this will mimic the original IPW gradient method that
     does a finite difference in the x/y direction.
@@ -25,30 +28,36 @@ def gradient_d4(dem, dx, dy, aspect_rad=False):
     slope_radians = arctan ( sqrt ([dz/dx]^2 + [dz/dy]^2) )
 
     Args:
-        dem: array of elevation values
+        dem: array of elevation values, can be a np.memmap
         dx: cell size along the x axis
         dy: cell size along the y axis
         aspect_rad: turn the aspect from degrees to IPW radians
+        out: optional tuple of slope and aspect arrays to write into,
+            like np.memmap arrays
+        block_rows: calculate this many rows at a time to limit the
+            memory used, the result is the same as the whole dem.
+            Defaults to the whole dem, or 1024 rows for a np.memmap
+        dtype: float32 or float64 type to calculate in, defaults to
+            the numpy type of the dem with the spacing
 
     Returns:
         slope in radians
         aspect in degrees or IPW radians
     """
 
-    # Pad the dem
-    dem_pad = np.pad(dem, pad_width=1, mode='edge')
+    if dtype is not None and \
+            np.dtype(dtype) not in (np.float32, np.float64):
+        raise ValueError('gradient dtype must be float32 or float64')
 
-    # top
-    dem_pad[0, :] = dem_pad[1, :] + (dem_pad[1, :] - dem_pad[2, :])
+    if block_rows is None and isinstance(dem, np.memmap):
+        block_rows = 1024
 
-    # bottom
-    dem_pad[-1, :] = dem_pad[-2, :] + (dem_pad[-2, :] - dem_pad[-3, :])
+    return _gradient_blocks(_d4, dem, dx, dy, aspect_rad, out, block_rows,
+                            dtype)
 
-    # left
-    dem_pad[:, 0] = dem_pad[:, 1] + (dem_pad[:, 1] - dem_pad[:, 2])
 
-    # right
-    dem_pad[:, -1] = dem_pad[:, -2] - (dem_pad[:, -3] - dem_pad[:, -2])
+def _d4(dem_pad, dx, dy):
+    """Finite differences in x and y for gradient_d4 from a padded dem"""
 
     # finite difference in the y direction
     dz_dy = (dem_pad[2:, 1:-1] - dem_pad[:-2, 1:-1]) / (2 * dy)
@@ -56,16 +65,11 @@ def gradient_d4(dem, dx, dy, aspect_rad=False):
     # finite difference in the x direction
     dz_dx = (dem_pad[1:-1, 2:] - dem_pad[1:-1, :-2]) / (2 * dx)
 
-    slope = calc_slope(dz_dx, dz_dy)
-    a = aspect(dz_dx, dz_dy)
+    return dz_dx, dz_dy
 
-    if aspect_rad:
-        a = aspect_to_ipw_radians(a)
 
-    return slope, a
-
-
-def gradient_d8(dem, dx, dy, aspect_rad=False):
+def gradient_d8(dem, dx, dy, aspect_rad=False, out=None, block_rows=None,
+                dtype=None):
     """
     Calculate the slope and aspect for provided dem,
     using a 3x3 cell around the center
@@ -89,30 +93,36 @@ def gradient_d8(dem, dx, dy, aspect_rad=False):
     slope_radians = arctan ( sqrt ([dz/dx]^2 + [dz/dy]^2) )
 
     Args:
-        dem: array of elevation values
+        dem: array of elevation values, can be a np.memmap
         dx: cell size along the x axis
         dy: cell size along the y axis
         aspect_rad: turn the aspect from degrees to IPW radians
+        out: optional tuple of slope and aspect arrays to write into,
+            like np.memmap arrays
+        block_rows: calculate this many rows at a time to limit the
+            memory used, the result is the same as the whole dem.
+            Defaults to the whole dem, or 1024 rows for a np.memmap
+        dtype: float32 or float64 type to calculate in, defaults to
+            the numpy type of the dem with the spacing
 
     Returns:
         slope in radians
         aspect in degrees or IPW radians
     """
 
-    # Pad the dem
-    dem_pad = np.pad(dem, pad_width=1, mode='edge')
+    if dtype is not None and \
+            np.dtype(dtype) not in (np.float32, np.float64):
+        raise ValueError('gradient dtype must be float32 or float64')
 
-    # top
-    dem_pad[0, :] = dem_pad[1, :] + (dem_pad[1, :] - dem_pad[2, :])
+    if block_rows is None and isinstance(dem, np.memmap):
+        block_rows = 1024
 
-    # bottom
-    dem_pad[-1, :] = dem_pad[-2, :] + (dem_pad[-2, :] - dem_pad[-3, :])
+    return _gradient_blocks(_d8, dem, dx, dy, aspect_rad, out, block_rows,
+                            dtype)
 
-    # left
-    dem_pad[:, 0] = dem_pad[:, 1] + (dem_pad[:, 1] - dem_pad[:, 2])
 
-    # right
-    dem_pad[:, -1] = dem_pad[:, -2] - (dem_pad[:, -3] - dem_pad[:, -2])
+def _d8(dem_pad, dx, dy):
+    """Finite differences in x and y for gradient_d8 from a padded dem"""
 
     # finite difference in the y direction
     dz_dy = ((dem_pad[2:, :-2] + 2*dem_pad[2:, 1:-1] + dem_pad[2:, 2:]) -
@@ -124,11 +134,246 @@ def gradient_d8(dem, dx, dy, aspect_rad=False):
              (dem_pad[:-2, :-2] + 2*dem_pad[1:-1, :-2] +
               dem_pad[2:, :-2])) / (8 * dx)
 
-    slope = calc_slope(dz_dx, dz_dy)
-    a = aspect(dz_dx, dz_dy)
+    return dz_dx, dz_dy
+
+
+def gradient_c(dem, dx, dy, d8=True, nthreads=1, out=None,
+               dtype=np.float64):
+    """Calculate the slope, sine and cosine of the slope and the IPW
+    aspect in one pass over the dem with a native kernel. The finite
+    differences and the edge extrapolation are the same as gradient_d8
+    (or gradient_d4 with d8=False) without padding the dem.
+
+    The sine and cosine of the slope are calculated from the gradient
+    instead of the slope and are the same as np.sin and np.cos of the
+    slope to rounding.
+
+    Args:
+        dem: array of elevation values
+        dx: cell size along the x axis
+        dy: cell size along the y axis
+        d8: use the d8 finite difference, d4 if False
+        nthreads: number of threads to split the rows over, less
+            than 1 uses all available cores
+        out: optional tuple of four C contiguous arrays of dtype for
+            the outputs, an output that is None is not calculated
+        dtype: float32 or float64 type of the outputs
+
+    Returns:
+        slope in radians
+        sin(slope)
+        cos(slope)
+        aspect in IPW radians
+    """
+
+    if dem.ndim != 2:
+        raise ValueError('gradient input of dem is not a 2D array')
+
+    dtype = np.dtype(dtype)
+    if dtype not in (np.float32, np.float64):
+        raise ValueError('gradient dtype must be float32 or float64')
+
+    dem = np.ascontiguousarray(dem, dtype=dtype)
+
+    if out is None:
+        out = tuple(np.empty(dem.shape, dtype=dtype) for _ in range(4))
+    elif len(out) != 4:
+        raise ValueError(
+            'gradient out must be slope, sin_slope, cos_slope and aspect')
+
+    topo_core.c_gradient2d(dem, float(dx), float(dy), d8, *out,
+                           nthreads=nthreads)
+
+    return out
+
+
+def pad_rows(dem, r0, r1, dtype=None):
+    """Pad rows r0 to r1 of the dem by one cell on each side. Edges of
+    the dem are extrapolated from the two cells inside the edge and
+    the other sides are filled from the neighboring rows, so the
+    padded rows are the same as those rows of the whole padded dem.
+
+    Args:
+        dem: array of elevation values, any 2D array that can be sliced
+        r0: first row
+        r1: end row, not included
+        dtype: convert the rows to this type
+
+    Returns:
+        dem_pad: padded rows with shape (r1 - r0 + 2, columns + 2)
+    """
+
+    nrows = dem.shape[0]
+    top = r0 == 0
+    bottom = r1 == nrows
+
+    rows = np.asarray(dem[max(r0 - 1, 0):min(r1 + 1, nrows)], dtype=dtype)
+
+    return _pad(rows, top, bottom)
+
+
+def _pad(rows, top, bottom):
+    """Pad rows of a dem that have the neighboring row above unless
+    top and the neighboring row below unless bottom, see pad_rows
+    """
+
+    # Pad the dem
+    dem_pad = np.pad(rows, pad_width=((int(top), int(bottom)), (1, 1)),
+                     mode='edge')
+
+    # top
+    if top:
+        dem_pad[0, :] = dem_pad[1, :] + (dem_pad[1, :] - dem_pad[2, :])
+
+    # bottom
+    if bottom:
+        dem_pad[-1, :] = dem_pad[-2, :] + (dem_pad[-2, :] - dem_pad[-3, :])
+
+    # left
+    dem_pad[:, 0] = dem_pad[:, 1] + (dem_pad[:, 1] - dem_pad[:, 2])
+
+    # right
+    dem_pad[:, -1] = dem_pad[:, -2] - (dem_pad[:, -3] - dem_pad[:, -2])
+
+    return dem_pad
+
+
+def _slope_aspect(diff, dem_pad, dx, dy, aspect_rad):
+    """Slope and aspect of padded rows with the finite difference
+    function diff
+    """
+
+    dz_dx, dz_dy = diff(dem_pad, dx, dy)
+
+    s = calc_slope(dz_dx, dz_dy)
+    asp = aspect(dz_dx, dz_dy)
 
     if aspect_rad:
-        a = aspect_to_ipw_radians(a)
+        asp = aspect_to_ipw_radians(asp)
+
+    return s, asp
+
+
+def row_blocks(dem, block_rows=1024, dtype=None):
+    """Read a dem a block of rows at a time
+
+    Args:
+        dem: array of elevation values, any 2D array that can be sliced
+            like a np.memmap or netCDF4 variable
+        block_rows: rows in each block
+        dtype: convert the rows to this type
+
+    Yields:
+        block of rows as a numpy array
+    """
+
+    if block_rows < 1:
+        raise ValueError('block_rows must be 1 or greater')
+
+    for r0 in range(0, dem.shape[0], block_rows):
+        yield np.asarray(dem[r0:r0 + block_rows], dtype=dtype)
+
+
+def iter_gradient(blocks, dx, dy, d8=True, aspect_rad=False, dtype=None):
+    """Calculate the slope and aspect for a dem that comes a block of
+    rows at a time, like from row_blocks, without holding the whole dem.
+    The row above and below each block are carried over from the
+    neighboring blocks so the result is the same as gradient_d8 (or
+    gradient_d4 with d8=False) on the whole dem.
+
+    The slope and aspect of a block are yielded once the first row of
+    the next block is read, or the blocks run out.
+
+    Args:
+        blocks: iterable of 2D arrays of elevations, the rows of the dem
+            in order with the same number of columns
+        dx: cell size along the x axis
+        dy: cell size along the y axis
+        d8: use gradient_d8, gradient_d4 if False
+        aspect_rad: turn the aspect from degrees to IPW radians
+        dtype: float32 or float64 type to calculate in, defaults to
+            the numpy type of the blocks with the spacing
+
+    Yields:
+        slope in radians and aspect in degrees or IPW radians for each
+        block with rows
+    """
+
+    if dtype is not None:
+        if np.dtype(dtype) not in (np.float32, np.float64):
+            raise ValueError('gradient dtype must be float32 or float64')
+
+        # python floats don't change the type of the dem
+        dx, dy = float(dx), float(dy)
+
+    diff = _d8 if d8 else _d4
+
+    above = None
+    pending = None
+    for block in blocks:
+        block = np.asarray(block, dtype=dtype)
+        if block.ndim != 2:
+            raise ValueError('gradient blocks must be 2D arrays')
+        if len(block) == 0:
+            continue
+
+        if pending is not None:
+            rows = [pending, block[:1]]
+            if above is not None:
+                rows.insert(0, above)
+
+            yield _slope_aspect(
+                diff, _pad(np.concatenate(rows), above is None, False),
+                dx, dy, aspect_rad)
+
+            above = pending[-1:]
+
+        pending = block
+
+    if pending is None:
+        return
+
+    rows = pending if above is None else np.concatenate([above, pending])
+
+    yield _slope_aspect(
+        diff, _pad(rows, above is None, True), dx, dy, aspect_rad)
+
+
+def _gradient_blocks(diff, dem, dx, dy, aspect_rad, out, block_rows,
+                     dtype=None):
+    """Calculate the slope and aspect a block of rows at a time with
+    the finite difference function diff. Each block is padded from the
+    neighboring rows so the result is the same as the whole dem.
+    """
+
+    nrows = dem.shape[0]
+    if block_rows is None:
+        block_rows = nrows
+    block_rows = max(int(block_rows), 1)
+
+    # python floats don't change the type of the dem
+    if dtype is not None:
+        dx, dy = float(dx), float(dy)
+
+    slope = a = None
+    if out is not None:
+        slope, a = out
+
+    for r0 in range(0, nrows, block_rows):
+        r1 = min(r0 + block_rows, nrows)
+
+        s, asp = _slope_aspect(
+            diff, pad_rows(dem, r0, r1, dtype), dx, dy, aspect_rad)
+
+        if r0 == 0 and r1 == nrows and out is None:
+            return s, asp
+
+        if slope is None:
+            slope = np.empty(dem.shape, dtype=s.dtype)
+            a = np.empty(dem.shape, dtype=asp.dtype)
+
+        slope[r0:r1] = s
+        a[r0:r1] = asp
 
     return slope, a
 
@@ -1,10 +1,12 @@
 import numpy as np
 
 from topocalc.core_c import topo_core
-from topocalc.skew import adjust_spacing, skew
+from topocalc.progress import check
+from topocalc.skew import adjust_spacing, skew, skew_offsets
+from topocalc.stats import stage
 
 
-def skew_transpose(dem, spacing, angle):
+def skew_transpose(dem, spacing, angle, fill_value=None):
     """Skew and transpose the dem for the given angle.
     Also calculate the new spacing given the skew.
 
@@ -12,6 +14,8 @@ def skew_transpose(dem, spacing, angle):
         dem {array} -- numpy array of dem elevations
         spacing {float} -- grid spacing
         angle {float} -- skew angle
+        fill_value {float} -- fill value for the skew, defaults to the
+            dem minimum
 
     Returns:
         t -- skew and transpose array
@@ -19,12 +23,12 @@ def skew_transpose(dem, spacing, angle):
     """
 
     spacing = adjust_spacing(spacing, np.abs(angle))
-    t = skew(dem, angle, fill_min=True).transpose()
+    t = skew(dem, angle, fill_min=True, fill_value=fill_value).transpose()
 
     return t, spacing
 
 
-def transpose_skew(dem, spacing, angle):
+def transpose_skew(dem, spacing, angle, fill_value=None):
     """Transpose, skew then transpose a dem for the
     given angle. Also calculate the new spacing
 
@@ -32,19 +36,24 @@ def transpose_skew(dem, spacing, angle):
         dem {array} -- numpy array of dem elevations
         spacing {float} -- grid spacing
         angle {float} -- skew angle
+        fill_value {float} -- fill value for the skew, defaults to the
+            dem minimum
 
     Returns:
         t -- skew and transpose array
         spacing -- new spacing adjusted for angle
     """
 
-    t = skew(dem.transpose(), angle, fill_min=True).transpose()
+    t = skew(dem.transpose(), angle, fill_min=True,
+             fill_value=fill_value).transpose()
     spacing = adjust_spacing(spacing, np.abs(angle))
 
     return t, spacing
 
 
-def horizon(azimuth, dem, spacing):
+def horizon(azimuth, dem, spacing, hull=True, nthreads=1, origin=None,
+            grid_shape=None, out=None, dtype=np.float64, stats=None,
+            cancel=None, mask=None, max_distance=None):
     """Calculate horizon angles for one direction. Horizon angles
     are based on Dozier and Frew 1990 and are adapted from the
     IPW C code.
@@ -58,6 +67,40 @@ def horizon(azimuth, dem, spacing):
         azimuth {float} -- find horizon's along this direction
         dem {np.array2d} -- numpy array of dem elevations
         spacing {float} -- grid spacing
+        hull {bool} -- use the O(n) convex hull horizon search, set
+            to False for the original O(n^2) search. Both find the
+            same horizons (default: {True})
+        nthreads {int} -- number of threads to split the horizon lines
+            over, less than 1 uses all available cores (default: {1})
+        origin {tuple} -- row and column of dem[0, 0] when the dem is a
+            window of a larger grid (default: {None})
+        grid_shape {tuple} -- shape of the larger grid, the horizon lines
+            through the window are laid out the same as for the whole
+            grid (default: {None})
+        out {np.array} -- optional array the same shape as the dem to
+            write the horizons into, like a np.memmap (default: {None})
+        dtype {np.dtype} -- float32 or float64, the dem is converted to
+            this type and the horizons are returned as this type. The
+            horizon search is done in double precision for both
+            (default: {np.float64})
+        stats {Stats} -- optional topocalc.stats.Stats to record the
+            time of each stage in (default: {None})
+        cancel {CancelToken} -- optional topocalc.progress.CancelToken
+            to stop the search, Cancelled is raised (default: {None})
+        mask {np.array2d} -- optional bool array the same shape as the
+            dem, only the horizon lines through a True cell are
+            searched. The horizons of the cells on the other lines are
+            not set (default: {None})
+        max_distance {float} -- only search for the horizon within this
+            distance of each cell along the horizon line, in the units
+            of spacing, so terrain further away doesn't block the view.
+            The horizons within max_distance are the same as without
+            it. The bounded search is O(n r) for lines of n cells and r
+            cells in max_distance and replaces the hull search, which
+            is faster for a whole line, so use it to limit the horizon
+            or for tiles with a finite halo (default: {None})
+
+    The dem can be a np.memmap of dtype, which is read in place.
 
     Returns:
         hcos {np.array} -- cosines of angles to the horizon
@@ -69,68 +112,373 @@ def horizon(azimuth, dem, spacing):
     if azimuth > 180 or azimuth < -180:
         raise ValueError('azimuth must be between -180 and 180 degrees')
 
-    if azimuth == 90:
-        # East
-        hcos = hor2d_c(dem, spacing, fwd=True)
+    if out is not None and out.shape != dem.shape:
+        raise ValueError('horizon out must be the same shape as the dem')
 
-    elif azimuth == -90:
-        # West
-        hcos = hor2d_c(dem, spacing, fwd=False)
+    dtype = np.dtype(dtype)
+    if dtype not in (np.float32, np.float64):
+        raise ValueError('horizon dtype must be float32 or float64')
 
-    elif azimuth == 0:
-        # South
-        hcos = hor2d_c(dem.transpose(), spacing, fwd=True)
-        hcos = hcos.transpose()
+    _check_distance(max_distance)
 
-    elif np.abs(azimuth) == 180:
-        # South
-        hcos = hor2d_c(dem.transpose(), spacing, fwd=False)
-        hcos = hcos.transpose()
+    with stage(stats, 'convert', dem.size, azimuth):
+        dem = np.ascontiguousarray(dem, dtype=dtype)
 
-    elif azimuth >= -45 and azimuth <= 45:
+    hcos = _horizon(azimuth, dem, spacing, hull, nthreads, out=out,
+                    origin=origin, grid_shape=grid_shape, stats=stats,
+                    cancel=cancel, mask=mask, max_distance=max_distance)
+
+    # sanity check
+    assert hcos.shape == dem.shape
+
+    return hcos
+
+
+def horizons(dem, spacing, azimuths, out=None, hull=True, nthreads=1,
+             origin=None, grid_shape=None, dtype=np.float64, stats=None,
+             cancel=None, max_distance=None):
+    """Calculate horizon angles for many directions at once. The
+    validation, type conversion and transpose of the dem are done
+    once and shared by all the directions.
+
+    Arguments:
+        dem {np.array2d} -- numpy array of dem elevations
+        spacing {float} -- grid spacing
+        azimuths {array} -- directions on the -180 -> 0 -> 180 range,
+            see horizon for the azimuth convention
+        out {np.array3d} -- optional preallocated array of dtype with
+            shape (n_azimuth, rows, cols) to write the horizons into, can
+            be a np.memmap (default: {None})
+        hull {bool} -- use the convex hull horizon search
+            (default: {True})
+        nthreads {int} -- number of threads to split the horizon lines
+            over, less than 1 uses all available cores (default: {1})
+        origin {tuple} -- row and column of dem[0, 0] in a larger grid,
+            see horizon (default: {None})
+        grid_shape {tuple} -- shape of the larger grid (default: {None})
+        dtype {np.dtype} -- float32 or float64 for the dem and the
+            horizons, see horizon (default: {np.float64})
+        stats {Stats} -- optional topocalc.stats.Stats to record the
+            time of each stage in, the directions are searched in one
+            stage (default: {None})
+        cancel {CancelToken} -- optional topocalc.progress.CancelToken
+            to stop the search, Cancelled is raised (default: {None})
+        max_distance {float} -- only search for the horizon within this
+            distance of each cell, see horizon (default: {None})
+
+    Returns:
+        hcos {np.array3d} -- cosines of angles to the horizon with
+            shape (n_azimuth, rows, cols)
+    """
+
+    if dem.ndim != 2:
+        raise ValueError('horizons input of dem is not a 2D array')
+
+    azimuths = np.atleast_1d(azimuths)
+    if azimuths.ndim != 1:
+        raise ValueError('azimuths must be a 1D array')
+
+    if np.any(azimuths > 180) or np.any(azimuths < -180):
+        raise ValueError('azimuth must be between -180 and 180 degrees')
+
+    dtype = np.dtype(dtype)
+    if dtype not in (np.float32, np.float64):
+        raise ValueError('horizons dtype must be float32 or float64')
+
+    _check_distance(max_distance)
+
+    shape = (len(azimuths),) + dem.shape
+    if out is None:
+        out = np.empty(shape, dtype=dtype)
+    elif out.shape != shape or out.dtype != dtype or \
+            not out.flags.c_contiguous:
+        raise ValueError(
+            'horizons out must be a C contiguous {} array of '
+            'shape {}'.format(dtype, shape))
+
+    with stage(stats, 'convert', dem.size):
+        dem = np.ascontiguousarray(dem, dtype=dtype)
+
+    # the line setup for every direction is made up front so the native
+    # layer can loop over the directions
+    ndirs = len(azimuths)
+    with stage(stats, 'sweep'):
+        axes = np.empty(ndirs, dtype=np.intc)
+        offsets = np.zeros((ndirs, max(dem.shape)), dtype=np.intc)
+        spacings = np.empty(ndirs, dtype=np.float64)
+        forwards = np.empty(ndirs, dtype=np.uint8)
+        steps = np.empty(ndirs, dtype=np.intc)
+
+        for k, azimuth in enumerate(azimuths):
+            axis, o, spacings[k], forwards[k] = sweep(
+                azimuth, spacing, dem.shape, origin, grid_shape)
+            axes[k] = axis
+            offsets[k, :len(o)] = o
+            steps[k] = _max_steps(max_distance, spacings[k])
+
+    with stage(stats, 'hor2d', dem.size * ndirs):
+        topo_core.c_horizons(dem, axes, offsets, spacings, forwards, out,
+                             hull, nthreads, _flag(cancel), steps)
+
+    check(cancel)
+
+    return out
+
+
+def horizon_index(azimuth, dem, spacing, hull=True, nthreads=1,
+                  origin=None, grid_shape=None, dtype=np.float64,
+                  max_distance=None):
+    """Calculate the horizon angles for one direction along with the
+    horizon cell and the distance to it for each cell.
+
+    The horizon cells don't change when the spacing or the elevations
+    are scaled, so the index and distance can be reused with
+    horizon_from_index to find the horizons of the dem at another
+    resolution or vertical exaggeration without another search.
+
+    Arguments:
+        azimuth {float} -- find horizon's along this direction
+        dem {np.array2d} -- numpy array of dem elevations
+        spacing {float} -- grid spacing
+        hull {bool} -- use the convex hull horizon search
+            (default: {True})
+        nthreads {int} -- number of threads to split the horizon lines
+            over, less than 1 uses all available cores (default: {1})
+        origin {tuple} -- row and column of dem[0, 0] in a larger grid,
+            see horizon (default: {None})
+        grid_shape {tuple} -- shape of the larger grid (default: {None})
+        dtype {np.dtype} -- float32 or float64 for the dem and the
+            horizons, see horizon (default: {np.float64})
+        max_distance {float} -- only search for the horizon within this
+            distance of each cell, see horizon (default: {None})
+
+    Returns:
+        hcos {np.array2d} -- cosines of angles to the horizon
+        index {np.array2d} -- flat index in the dem of each cell's
+            horizon cell, a cell that is its own horizon has its own
+            index. Use np.unravel_index for the row and column.
+        distance {np.array2d} -- horizontal distance to the horizon
+            cell along the horizon line, in the units of spacing
+    """
+
+    if dem.ndim != 2:
+        raise ValueError('horizon input of dem is not a 2D array')
+
+    if azimuth > 180 or azimuth < -180:
+        raise ValueError('azimuth must be between -180 and 180 degrees')
+
+    dtype = np.dtype(dtype)
+    if dtype not in (np.float32, np.float64):
+        raise ValueError('horizon dtype must be float32 or float64')
+
+    _check_distance(max_distance)
+
+    dem = dem.astype(dtype, copy=False)
+    index = np.empty(dem.shape, dtype=np.intp)
+    hcos = _horizon(azimuth, dem, spacing, hull, nthreads, origin=origin,
+                    grid_shape=grid_shape, index=index,
+                    max_distance=max_distance)
+
+    # the steps along the horizon lines are the steps along the sweep
+    # axis, each step is the spacing along the line
+    axis, _, line_spacing, _ = sweep(
+        azimuth, spacing, dem.shape, origin, grid_shape)
+    cells = np.arange(index.size, dtype=np.intp).reshape(dem.shape)
+    if axis == 0:
+        steps = index // dem.shape[1] - cells // dem.shape[1]
+    else:
+        steps = index % dem.shape[1] - cells % dem.shape[1]
+
+    distance = np.abs(steps) * line_spacing
+
+    return hcos, index, distance
+
+
+def horizon_from_index(dem, index, distance, scale=1, z_factor=1, out=None):
+    """Calculate the horizon angles from the horizon cells found by
+    horizon_index, for the dem with the horizontal distances scaled by
+    scale and the elevations scaled by z_factor. This is the same as
+    horizon for the scaled dem to rounding, without the horizon search.
+
+    Arguments:
+        dem {np.array2d} -- numpy array of dem elevations
+        index {np.array2d} -- flat index of the horizon cells from
+            horizon_index
+        distance {np.array2d} -- distance to the horizon cells from
+            horizon_index
+        scale {float} -- new spacing divided by the spacing given to
+            horizon_index (default: {1})
+        z_factor {float} -- vertical exaggeration of the elevations
+            (default: {1})
+        out {np.array2d} -- optional array to write the horizons into
+            (default: {None})
+
+    Returns:
+        hcos {np.array2d} -- cosines of angles to the horizon
+    """
+
+    if dem.ndim != 2:
+        raise ValueError('horizon input of dem is not a 2D array')
+
+    if index.shape != dem.shape or distance.shape != dem.shape:
+        raise ValueError(
+            'index and distance must be the same shape as the dem')
+
+    if scale <= 0 or z_factor <= 0:
+        raise ValueError('scale and z_factor must be greater than 0')
+
+    # calculated in double precision like horval
+    dem = np.asarray(dem)
+    diff = np.take(dem, index).astype(np.float64)
+    diff -= dem
+    if z_factor != 1:
+        diff *= z_factor
+
+    d = distance * scale if scale != 1 else distance
+
+    # a cell that is its own horizon has a cosine of 0
+    with np.errstate(invalid='ignore'):
+        hcos = diff / np.hypot(diff, d)
+    hcos[distance == 0] = 0
+
+    if out is None:
+        return hcos.astype(dem.dtype, copy=False)
+
+    out[:] = hcos
+    return out
+
+
+def sweep(azimuth, spacing, shape, origin=None, grid_shape=None):
+    """Lines through the dem that the horizons are found along for an
+    azimuth. The lines are the lines of the skewed and transposed dem
+    used by horizon, without making the skewed dem.
+
+    The skew offsets depend on the number of lines, so a window of a
+    larger grid gives the lines of the larger grid through the window
+    when origin and grid_shape are given.
+
+    Arguments:
+        azimuth {float} -- direction on the -180 -> 0 -> 180 range
+        spacing {float} -- grid spacing
+        shape {tuple} -- shape of the dem
+        origin {tuple} -- row and column of dem[0, 0] in the larger grid
+        grid_shape {tuple} -- shape of the larger grid
+
+    Returns:
+        axis {int} -- 0 if the lines run down the rows, 1 if the lines
+            run along the columns
+        offsets {np.array} -- skew offset for each point along the lines
+        spacing {float} -- grid spacing along the lines
+        fwd {bool} -- search for the horizon in the forward direction
+    """
+
+    if azimuth > 180 or azimuth < -180:
+        raise ValueError('azimuth must be between -180 and 180 degrees')
+
+    if azimuth >= -45 and azimuth <= 45:
         # South west through south east
-        t, spacing = skew_transpose(dem, spacing, azimuth)
-        h = hor2d_c(t, spacing, fwd=True)
-        hcos = skew(h.transpose(), azimuth, fwd=False)
+        axis, angle, fwd = 0, azimuth, True
 
-    elif azimuth <= -135 and azimuth > -180:
+    elif azimuth <= -135:
         # North west
-        a = azimuth + 180
-        t, spacing = skew_transpose(dem, spacing, a)
-        h = hor2d_c(t, spacing, fwd=False)
-        hcos = skew(h.transpose(), a, fwd=False)
+        axis, angle, fwd = 0, azimuth + 180, False
 
-    elif azimuth >= 135 and azimuth < 180:
+    elif azimuth >= 135:
         # North East
-        a = azimuth - 180
-        t, spacing = skew_transpose(dem, spacing, a)
-        h = hor2d_c(t, spacing, fwd=False)
-        hcos = skew(h.transpose(), a, fwd=False)
+        axis, angle, fwd = 0, azimuth - 180, False
 
     elif azimuth > 45 and azimuth < 135:
         # South east through north east
-        a = 90 - azimuth
-        t, spacing = transpose_skew(dem, spacing, a)
-        h = hor2d_c(t, spacing, fwd=True)
-        hcos = skew(h.transpose(), a, fwd=False).transpose()
+        axis, angle, fwd = 1, 90 - azimuth, True
 
-    elif azimuth < -45 and azimuth > -135:
+    else:
         # South west through north west
-        a = -90 - azimuth
-        t, spacing = transpose_skew(dem, spacing, a)
-        h = hor2d_c(t, spacing, fwd=False)
-        hcos = skew(h.transpose(), a, fwd=False).transpose()
+        axis, angle, fwd = 1, -90 - azimuth, False
 
+    if grid_shape is None:
+        offsets, _ = skew_offsets(shape[axis], angle)
     else:
-        ValueError('azimuth not valid')
+        start = 0 if origin is None else origin[axis]
+        offsets, _ = skew_offsets(grid_shape[axis], angle)
+        offsets = offsets[start:start + shape[axis]]
+        offsets = offsets - np.min(offsets)
 
-    # sanity check
-    assert hcos.shape == dem.shape
+    spacing = adjust_spacing(spacing, np.abs(angle))
 
-    return hcos
+    return axis, offsets.astype(np.intc), spacing, fwd
+
+
+def _horizon(azimuth, dem, spacing, hull, nthreads, out=None, origin=None,
+             grid_shape=None, index=None, stats=None, cancel=None,
+             mask=None, max_distance=None):
+    """Horizon for one direction without the input checks, see horizon.
+
+    Arguments:
+        out {np.array2d} -- optional array to write the horizons into
+        origin {tuple} -- row and column of dem[0, 0] in a larger grid
+        grid_shape {tuple} -- shape of the larger grid
+        index {np.array2d} -- optional np.intp array to write the flat
+            index of the horizon cells into
+        stats {Stats} -- optional Stats to record the stages in
+        cancel {CancelToken} -- optional CancelToken to stop the search
+        mask {np.array2d} -- optional bool array of the cells to search
+            the lines through
+        max_distance {float} -- optional distance to search along the
+            lines from each cell
+
+    Returns:
+        hcos {np.array} -- cosines of angles to the horizon, this is out
+            if given
+    """
+
+    check(cancel)
+
+    # write straight into the output if possible
+    h = None
+    if out is not None and out.flags.c_contiguous and \
+            out.dtype == dem.dtype:
+        h = out
+
+    if abs(azimuth) == 90:
+        # East and West along the rows
+        with stage(stats, 'hor2d', dem.size, azimuth):
+            hcos = hor2d_c(dem, spacing, fwd=azimuth == 90, hull=hull,
+                           nthreads=nthreads, out=h, index=index,
+                           mask=mask, cancel=cancel,
+                           max_distance=max_distance)
+
+    elif azimuth == 0 or abs(azimuth) == 180:
+        # South and North down the columns
+        with stage(stats, 'hor2d', dem.size, azimuth):
+            hcos = hor2d_c(dem, spacing, fwd=azimuth == 0, hull=hull,
+                           nthreads=nthreads, out=h, axis=0, index=index,
+                           mask=mask, cancel=cancel,
+                           max_distance=max_distance)
+
+    else:
+        # oblique directions walk the skewed lines through the dem
+        with stage(stats, 'sweep', azimuth=azimuth):
+            axis, offsets, spacing, fwd = sweep(
+                azimuth, spacing, dem.shape, origin, grid_shape)
+
+        with stage(stats, 'hor2d', dem.size, azimuth):
+            hcos = hor2d_skew_c(dem, axis, offsets, spacing, fwd=fwd,
+                                hull=hull, nthreads=nthreads, out=h,
+                                index=index, mask=mask, cancel=cancel,
+                                max_distance=max_distance)
+
+    if out is None:
+        return hcos
+
+    if not np.may_share_memory(hcos, out):
+        with stage(stats, 'copy', out.size, azimuth):
+            out[:] = hcos
 
+    return out
 
-def hor2d_c(z, spacing, fwd=True):
+
+def hor2d_c(z, spacing, fwd=True, hull=True, nthreads=1, out=None,
+            axis=-1, index=None, mask=None, cancel=None, max_distance=None):
     """
     Calculate values of cosines of angles to horizons in 2 dimension,
     measured from zenith, from elevation difference and distance.  Let
@@ -141,8 +489,28 @@ def hor2d_c(z, spacing, fwd=True):
     This result is the same as cos H, where H measured from zenith.
 
     Args:
-        z: elevation array
+        z: float32 or float64 elevation array, the horizons are found
+            in double precision for both
         spacing: spacing of array
+        fwd: calculate the horizon in the forward direction
+        hull: use the convex hull search instead of the brute force search
+        nthreads: number of threads to split the rows over, less
+            than 1 uses all available cores
+        out: optional C contiguous array the same shape and type as z
+            to write the horizons into
+        axis: array axis the horizon lines run along, like a gufunc.
+            The default -1 finds horizons along each row, 0 finds them
+            down each column without transposing z
+        index: optional C contiguous np.intp array the same shape as z
+            to write the flat index in z of each cell's horizon into
+        mask: optional bool array the same shape as z, only the lines
+            through a True cell are searched and the cells of the other
+            lines are left as they are in out
+        cancel: optional topocalc.progress.CancelToken checked before
+            each line, Cancelled is raised if it was cancelled
+        max_distance: optional distance in the units of spacing to
+            search for the horizon from each cell, the cells within
+            max_distance along the line are searched
 
     Returns:
         hcos: cosines of angles to horizon
@@ -151,19 +519,30 @@ def hor2d_c(z, spacing, fwd=True):
     if z.ndim != 2:
         raise ValueError('hor1d input of z is not a 2D array')
 
-    if z.dtype != np.double:
-        raise ValueError('hor1d input of z must be a double')
+    if z.dtype not in (np.float32, np.float64):
+        raise ValueError('hor1d input of z must be float32 or float64')
+
+    if axis not in (-2, -1, 0, 1):
+        raise ValueError('hor1d axis must be 0 or 1')
 
     spacing = np.double(spacing)
 
     z = np.ascontiguousarray(z)
 
-    h = np.zeros_like(z)
-
-    topo_core.c_hor2d(z, spacing, fwd, h)
+    if out is None:
+        h = np.zeros_like(z)
+    elif out.shape != z.shape or out.dtype != z.dtype or \
+            not out.flags.c_contiguous:
+        raise ValueError(
+            'hor2d out must be a C contiguous {} array of '
+            'shape {}'.format(z.dtype, z.shape))
+    else:
+        h = out
 
-    # if not fwd:
-    #     h = np.fliplr(h)
+    topo_core.c_hor2d(z, spacing, fwd, h, hull, nthreads, axis, index,
+                      _mask(mask), _flag(cancel),
+                      _max_steps(max_distance, spacing))
+    check(cancel)
 
     return h
 
@@ -230,3 +609,102 @@ def pyhorizon(dem, dx):
         horizon_index[n, :] = hidx
 
     return hcos, horizon_index
+
+
+def hor2d_skew_c(z, axis, offsets, spacing, fwd=True, hull=True,
+                 nthreads=1, out=None, index=None, mask=None,
+                 cancel=None, max_distance=None):
+    """
+    Calculate values of cosines of angles to horizons along skewed lines
+    through a 2 dimensional array, see sweep for the lines. This is the
+    same as skewing and transposing z, finding the horizons with hor2d_c
+    and unskewing the result, without the intermediate arrays.
+
+    Args:
+        z: float32 or float64 elevation array
+        axis: 0 if the lines run down the rows, 1 along the columns
+        offsets: skew offset for each point along the lines
+        spacing: spacing along the lines
+        fwd: calculate the horizon in the forward direction
+        hull: use the convex hull search instead of the brute force search
+        nthreads: number of threads to split the lines over, less
+            than 1 uses all available cores
+        out: optional C contiguous array the same shape and type as z
+            to write the horizons into
+        index: optional C contiguous np.intp array the same shape as z
+            to write the flat index in z of each cell's horizon into
+        mask: optional bool array the same shape as z, only the lines
+            through a True cell are searched and the cells of the other
+            lines are left as they are in out
+        cancel: optional topocalc.progress.CancelToken checked before
+            each line, Cancelled is raised if it was cancelled
+        max_distance: optional distance in the units of spacing to
+            search for the horizon from each cell, the cells within
+            max_distance along the line are searched
+
+    Returns:
+        hcos: cosines of angles to horizon
+    """
+
+    if z.ndim != 2:
+        raise ValueError('hor1d input of z is not a 2D array')
+
+    if z.dtype not in (np.float32, np.float64):
+        raise ValueError('hor1d input of z must be float32 or float64')
+
+    z = np.ascontiguousarray(z)
+    offsets = np.ascontiguousarray(offsets, dtype=np.intc)
+
+    if out is None:
+        h = np.zeros_like(z)
+    elif out.shape != z.shape or out.dtype != z.dtype or \
+            not out.flags.c_contiguous:
+        raise ValueError(
+            'hor2d out must be a C contiguous {} array of '
+            'shape {}'.format(z.dtype, z.shape))
+    else:
+        h = out
+
+    topo_core.c_hor2d_skew(z, axis, offsets, np.double(spacing), fwd, h,
+                           hull, nthreads, index, _mask(mask), _flag(cancel),
+                           _max_steps(max_distance, spacing))
+    check(cancel)
+
+    return h
+
+
+def _check_distance(max_distance):
+    """Raise a ValueError if max_distance isn't None or 0 or greater"""
+
+    if max_distance is not None and not max_distance >= 0:
+        raise ValueError('max_distance must be 0 or greater')
+
+
+def _max_steps(max_distance, spacing):
+    """Points to search along a line with spacing for the native
+    functions, -1 to search them all if max_distance is None
+    """
+
+    if max_distance is None:
+        return -1
+
+    _check_distance(max_distance)
+
+    # the lines are never longer than an int
+    steps = np.floor(max_distance / spacing)
+    return int(min(steps, np.iinfo(np.intc).max))
+
+
+def _flag(cancel):
+    """Flag array of a CancelToken for the native functions, or None"""
+
+    return None if cancel is None else cancel.flag
+
+
+def _mask(mask):
+    """Bool mask as the uint8 array of the native functions, or None"""
+
+    if mask is None:
+        return None
+
+    return np.ascontiguousarray(mask, dtype=bool).view(np.uint8)
@@ -0,0 +1,49 @@
+import numpy as np
+
+
+class Cancelled(Exception):
+    """Raised by a calculation that was stopped with a CancelToken"""
+
+
+class CancelToken():
+    """Flag to stop a long calculation like viewf from another thread.
+
+    The flag is a numpy int that the native horizon search checks before
+    each line, so a horizon stops within a line per thread of cancel
+    being called. The calculation then raises Cancelled, any output
+    array it was writing into is left part done.
+
+    Example:
+        token = CancelToken()
+        thread = threading.Thread(
+            target=viewf, args=(dem, spacing), kwargs={'cancel': token})
+        thread.start()
+        token.cancel()
+    """
+
+    def __init__(self):
+        self.flag = np.zeros(1, dtype=np.intc)
+
+    def cancel(self):
+        """Ask the calculations using the token to stop"""
+        self.flag[0] = 1
+
+    @property
+    def cancelled(self):
+        """True once cancel has been called"""
+        return bool(self.flag[0])
+
+    def check(self):
+        """Raise Cancelled if cancel has been called"""
+
+        if self.cancelled:
+            raise Cancelled('the calculation was cancelled')
+
+
+def check(cancel):
+    """Raise Cancelled if the CancelToken cancel has been called, does
+    nothing if cancel is None
+    """
+
+    if cancel is not None:
+        cancel.check()
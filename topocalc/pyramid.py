@@ -0,0 +1,219 @@
+import numpy as np
+
+from topocalc.horizon import horizon, horizon_index
+from topocalc.tiles import horizon_tiled, tile_windows
+
+# coarse rows max pooled at a time so a np.memmap is read in strips
+POOL_ROWS = 256
+
+
+def pyramid(dem, levels, factor=2, return_index=False):
+    """Max pooled pyramid of a dem. Each level is the previous level
+    with every factor by factor block of cells replaced by the highest
+    cell, so a coarse level never hides terrain that blocks the sky.
+    The blocks at the bottom and right edges can be smaller.
+
+    Arguments:
+        dem {array} -- dem elevations, any 2D array that can be sliced
+            like a np.memmap or netCDF4 variable
+        levels {int} -- number of coarse levels
+        factor {int} -- decimation factor between levels (default: {2})
+        return_index {bool} -- also return the flat index in the dem of
+            the cell each coarse cell came from (default: {False})
+
+    Returns:
+        pyramid {list} -- the dem followed by the levels arrays, level k
+            has a spacing factor**k times the dem spacing
+        index {list} -- if return_index, None for the dem followed by a
+            np.intp array for each level
+    """
+
+    if len(dem.shape) != 2:
+        raise ValueError('pyramid input of dem is not a 2D array')
+
+    if levels < 0:
+        raise ValueError('pyramid levels must be 0 or greater')
+
+    if factor < 2:
+        raise ValueError('pyramid factor must be 2 or greater')
+
+    levels_out = [dem]
+    index_out = [None]
+    for _ in range(levels):
+        coarse, index = _max_pool(levels_out[-1], factor)
+        if index_out[-1] is not None:
+            index = index_out[-1].flat[index]
+
+        levels_out.append(coarse)
+        index_out.append(index)
+
+    if return_index:
+        return levels_out, index_out
+
+    return levels_out
+
+
+def horizon_multires(azimuth, dem, spacing, near_distance, levels=2,
+                     factor=4, tile_size=None, out=None, **kwargs):
+    """Calculate the horizon for one direction with the near field on the
+    dem and the far field on a max pooled pyramid of the dem.
+
+    The horizon within near_distance is found on the dem with the
+    max_distance search of horizon. Level k of the pyramid is searched
+    out to near_distance * factor**k, the last level out to the edge of
+    the dem, so every level searches about the same number of cells
+    along each line. The horizon cell of a level is used for the cells
+    of the dem in each coarse cell, where it is further away than the
+    previous level's search. The angle is from each dem cell's own
+    elevation to the highest dem cell of the coarse horizon cell. The
+    horizon is the highest of the near and far horizons.
+
+    The far field is approximate. The coarse horizon cell is found
+    from the highest cell of each block, so it can be a different cell
+    than the dem cell's own horizon, and the highest cell of the
+    coarse horizon cell can be off the horizon line by up to a coarse
+    cell. The near field is the same as horizon with max_distance.
+    When near_distance covers the dem the result is the same as
+    horizon.
+
+    The hull search of horizon is already O(n) on the whole dem, so
+    this isn't faster than horizon for a dem that fits in memory. It is
+    for a large domain that doesn't. With tile_size the near field is
+    calculated with horizon_tiled, so only a tile with a halo of
+    near_distance and the levels, which are factor**2 times smaller
+    each, are in memory, where horizon_tiled alone needs a halo that
+    covers the whole far field.
+
+    Arguments:
+        azimuth {float} -- find horizon's along this direction
+        dem {array} -- dem elevations, any 2D array that can be sliced
+            like a np.memmap or netCDF4 variable
+        spacing {float} -- grid spacing
+        near_distance {float} -- distance in the units of spacing to
+            search on the dem
+        levels {int} -- number of coarse levels (default: {2})
+        factor {int} -- decimation factor between levels (default: {4})
+        tile_size {int or tuple} -- calculate the near field in tiles of
+            this size, see horizon_tiled (default: {None})
+        out {array} -- output store for the horizons, like a np.memmap.
+            A new array is made if not given (default: {None})
+        **kwargs -- passed to horizon, like nthreads or dtype
+
+    Returns:
+        hcos {np.array} -- cosines of angles to the horizon
+    """
+
+    if len(dem.shape) != 2:
+        raise ValueError('horizon input of dem is not a 2D array')
+
+    if levels < 1:
+        raise ValueError('horizon_multires levels must be 1 or greater')
+
+    if not near_distance > 0:
+        raise ValueError('near_distance must be greater than 0')
+
+    dtype = np.dtype(kwargs.get('dtype', np.float64))
+
+    # the horizon cells of the levels, the far field is added to the
+    # near field a block of rows at a time
+    pyr, cells = pyramid(dem, levels, factor, return_index=True)
+    far = []
+    for k in range(1, levels + 1):
+        scale = factor ** k
+        max_distance = near_distance * scale if k < levels else None
+        _, index, distance = horizon_index(
+            azimuth, pyr[k], spacing * scale,
+            nthreads=kwargs.get('nthreads', 1), dtype=dtype,
+            max_distance=max_distance)
+
+        # the elevation, row and column of the dem cell of each coarse
+        # cell's horizon, the cells that are their own horizon are
+        # never used
+        zq = np.asarray(pyr[k], dtype=np.float64).flat[index]
+        zq[distance == 0] = -np.inf
+        qr, qc = np.unravel_index(cells[k].flat[index], dem.shape)
+        far.append((zq, qr, qc, scale, near_distance * scale / factor))
+
+    if tile_size is None:
+        z = np.asarray(dem[:], dtype=dtype)
+        hcos = horizon(azimuth, z, spacing, max_distance=near_distance,
+                       **kwargs)
+        if out is None:
+            out = hcos
+        else:
+            out[:] = hcos
+    else:
+        out = horizon_tiled(azimuth, dem, spacing, near_distance,
+                            tile_size=tile_size, out=out, **kwargs)
+
+    block = POOL_ROWS * factor ** levels
+    for tile, _, _ in tile_windows(dem.shape, (block, dem.shape[1]), 0):
+        z = np.asarray(dem[tile], dtype=np.float64)
+        hcos = np.asarray(out[tile], dtype=np.float64)
+
+        rows = np.arange(tile[0].start, tile[0].stop)
+        cols = np.arange(dem.shape[1])
+        for zq, qr, qc, scale, min_distance in far:
+            hcos = np.maximum(hcos, _far_horizon(
+                z, rows, cols, spacing, zq, qr, qc, scale, min_distance))
+
+        out[tile] = hcos
+
+    return out
+
+
+def _far_horizon(z, rows, cols, spacing, zq, qr, qc, scale, min_distance):
+    """Cosines of the angles from the dem cells z at rows and cols to the
+    horizon cells zq at qr and qc of their coarse cells, 0 where the
+    horizon cell is within min_distance or below the cell
+    """
+
+    # the coarse cell of each dem cell
+    pr = (rows // scale)[:, None]
+    pc = (cols // scale)[None, :]
+
+    # squared distances in place of hypot, which is a lot slower
+    dr = qr[pr, pc] - rows[:, None]
+    dc = qc[pr, pc] - cols[None, :]
+    d2 = (dr * dr + dc * dc) * float(spacing) ** 2
+
+    diff = zq[pr, pc] - z
+    with np.errstate(invalid='ignore'):
+        hcos = diff / np.sqrt(diff * diff + d2)
+
+    return np.where((diff > 0) & (d2 > min_distance ** 2), hcos, 0)
+
+
+def _max_pool(dem, factor):
+    """Highest cell of each factor by factor block of the dem and its
+    flat index in the dem, the first in the block if there is a tie
+    """
+
+    nrows, ncols = dem.shape
+    shape = (-(-nrows // factor), -(-ncols // factor))
+    coarse = np.empty(shape, dtype=np.asarray(dem[:1, :1]).dtype)
+    index = np.empty(shape, dtype=np.intp)
+
+    # the edge cells are repeated to fill the blocks at the edges
+    pad = shape[1] * factor - ncols
+    for r0 in range(0, shape[0], POOL_ROWS):
+        r1 = min(r0 + POOL_ROWS, shape[0])
+        block = np.asarray(dem[r0 * factor:r1 * factor])
+        block = np.pad(block, ((0, (r1 - r0) * factor - len(block)),
+                               (0, pad)), mode='edge')
+
+        # the cells of each block along the last axis
+        block = block.reshape(r1 - r0, factor, shape[1], factor)
+        block = block.transpose(0, 2, 1, 3).reshape(
+            r1 - r0, shape[1], factor * factor)
+        k = np.argmax(block, axis=2)
+        coarse[r0:r1] = np.take_along_axis(block, k[..., None], 2)[..., 0]
+
+        # the repeated edge cells are clipped back onto the edge
+        rows = np.arange(r0, r1)[:, None] * factor + k // factor
+        cols = np.arange(shape[1]) * factor + k % factor
+        index[r0:r1] = np.ravel_multi_index(
+            (np.minimum(rows, nrows - 1), np.minimum(cols, ncols - 1)),
+            (nrows, ncols))
+
+    return coarse, index
@@ -1,7 +1,8 @@
 import numpy as np
 
 
-def shade(slope, aspect, azimuth, cosz=None, zenith=None):
+def shade(slope, aspect, azimuth, cosz=None, zenith=None, dtype=None,
+          out=None):
     """
     Calculate the cosize of the local illumination angle over a DEM
     Solves the following equation
@@ -26,10 +27,16 @@ def shade(slope, aspect, azimuth, cosz=None, zenith=None):
         azimuth: azimuth in degrees to the sun -180..180 (comes from sunang)
         cosz: cosize of the zeinith angle 0..1 (comes from sunang)
         zenith: the solar zenith angle 0..90 degrees
+        dtype: float32 or float64 type to calculate mu in, defaults to
+            the numpy type of slope and aspect
+        out: optional array to write mu into
 
     At least one of the cosz or zenith must be specified.  If both are
     specified the zenith is ignored
 
+    The azimuth and cosz or zenith can be arrays of sun positions for a
+    time series, see shade_series. mu is then a (time, rows, cols) array.
+
     Returns:
         mu: numpy matrix of the cosize of the local illumination angle cos(ts)
 
@@ -40,6 +47,10 @@ def shade(slope, aspect, azimuth, cosz=None, zenith=None):
 
     """
 
+    if np.ndim(azimuth) > 0 or np.ndim(cosz) > 0 or np.ndim(zenith) > 0:
+        return shade_series(slope, aspect, azimuth, cosz=cosz, zenith=zenith,
+                            dtype=dtype, out=out)
+
     # process the options
     if cosz is not None:
         if (cosz <= 0) or (cosz > 1):
@@ -60,6 +71,16 @@ def shade(slope, aspect, azimuth, cosz=None, zenith=None):
     else:
         raise Exception('Must specify either cosz or zenith')
 
+    if dtype is not None:
+        if np.dtype(dtype) not in (np.float32, np.float64):
+            raise Exception('dtype must be float32 or float64')
+
+        # python floats don't change the type of the arrays
+        slope = np.asarray(slope, dtype=dtype)
+        aspect = np.asarray(aspect, dtype=dtype)
+        ctheta, stheta = float(ctheta), float(stheta)
+        azimuth = float(azimuth)
+
     if np.max(np.abs(aspect)) > np.pi:
         raise Exception('Aspect is not in radians from south')
 
@@ -77,4 +98,161 @@ def shade(slope, aspect, azimuth, cosz=None, zenith=None):
     mu[mu < 0] = 0
     mu[mu > 1] = 1
 
+    if out is not None:
+        out[...] = mu
+        return out
+
     return mu
+
+
+def shade_series(slope, aspect, azimuth, cosz=None, zenith=None, dtype=None,
+                 out=None):
+    """
+    Calculate the cosine of the local illumination angle over a DEM for
+    a time series of sun positions, see shade. The slope and aspect
+    terms are calculated once for all the sun positions.
+
+    Args:
+        slope: numpy array of sine of slope angles sin(S)
+        aspect: numpy array of aspect in radians from south
+        azimuth: array of azimuths in degrees to the sun -180..180
+        cosz: array of cosines of the zenith angle 0..1
+        zenith: array of solar zenith angles 0..90 degrees
+        dtype: float32 or float64 type to calculate mu in, defaults to
+            the numpy type of slope and aspect
+        out: optional array of shape (time, rows, cols) to write mu
+            into, like a np.memmap
+
+    Returns:
+        mu: (time, rows, cols) array of the cosine of the local
+            illumination angle cos(ts) for each sun position
+    """
+
+    slope = np.asarray(slope)
+    if dtype is None:
+        dtype = np.result_type(slope, np.asarray(aspect), np.float32)
+
+    ntimes = len(_sun_positions(azimuth, cosz, zenith)[0])
+    shape = (ntimes,) + slope.shape
+    if out is None:
+        out = np.empty(shape, dtype=dtype)
+    elif out.shape != shape:
+        raise Exception('out must have shape {}'.format(shape))
+
+    for _ in iter_shade(slope, aspect, azimuth, cosz=cosz, zenith=zenith,
+                        dtype=dtype, out=out):
+        pass
+
+    return out
+
+
+def iter_shade(slope, aspect, azimuth, cosz=None, zenith=None, dtype=None,
+               out=None):
+    """
+    Generate the cosine of the local illumination angle over a DEM for
+    each sun position in a time series, see shade. This streams the
+    time series without holding the whole (time, rows, cols) array.
+
+    The cosine of the difference of the sun azimuth and the aspect is
+    expanded so the slope and aspect terms are calculated once, each sun
+    position is then a few multiply and adds into the output buffer.
+    The results are the same as shade to rounding.
+
+    Args:
+        slope: numpy array of sine of slope angles sin(S)
+        aspect: numpy array of aspect in radians from south
+        azimuth: array of azimuths in degrees to the sun -180..180
+        cosz: array of cosines of the zenith angle 0..1
+        zenith: array of solar zenith angles 0..90 degrees
+        dtype: float32 or float64 type to calculate mu in, defaults to
+            the numpy type of slope and aspect
+        out: optional array of shape (time, rows, cols) to write mu into,
+            otherwise one buffer is reused for every sun position so
+            copy mu to keep it
+
+    Yields:
+        mu: numpy array of the cosine of the local illumination angle
+            for each sun position
+    """
+
+    azimuth, ctheta, stheta = _sun_positions(azimuth, cosz, zenith)
+
+    slope = np.asarray(slope)
+    aspect = np.asarray(aspect)
+    if dtype is None:
+        dtype = np.result_type(slope, aspect, np.float32)
+    elif np.dtype(dtype) not in (np.float32, np.float64):
+        raise Exception('dtype must be float32 or float64')
+
+    slope = slope.astype(dtype, copy=False)
+    aspect = aspect.astype(dtype, copy=False)
+
+    if np.max(np.abs(aspect)) > np.pi:
+        raise Exception('Aspect is not in radians from south')
+
+    # terms that don't depend on the sun, from
+    # cos(phi0 - A) = cos(phi0) cos(A) + sin(phi0) sin(A)
+    costbl = np.sqrt((1 - slope) * (1 + slope))
+    slope_cos = slope * np.cos(aspect)
+    slope_sin = slope * np.sin(aspect)
+
+    buf = None
+    if out is None:
+        buf = np.empty(slope.shape, dtype=dtype)
+    tmp = np.empty(slope.shape, dtype=dtype)
+
+    for k in range(len(azimuth)):
+        mu = buf if out is None else out[k]
+
+        # python floats don't change the type of the arrays
+        np.multiply(costbl, float(ctheta[k]), out=mu)
+        np.multiply(slope_cos, float(stheta[k] * np.cos(azimuth[k])),
+                    out=tmp)
+        mu += tmp
+        np.multiply(slope_sin, float(stheta[k] * np.sin(azimuth[k])),
+                    out=tmp)
+        mu += tmp
+
+        np.clip(mu, 0, 1, out=mu)
+
+        yield mu
+
+
+def _sun_positions(azimuth, cosz, zenith):
+    """Check a time series of sun positions and convert them to the
+    azimuth in radians and the cosine and sine of the zenith angle
+    """
+
+    azimuth = np.atleast_1d(np.asarray(azimuth, dtype=np.float64))
+
+    if cosz is not None:
+        ctheta = np.atleast_1d(np.asarray(cosz, dtype=np.float64))
+        if np.any(ctheta <= 0) or np.any(ctheta > 1):
+            raise Exception('cosz must be > 0 and <= 1')
+
+        stheta = np.sin(np.arccos(ctheta))
+
+    elif zenith is not None:
+        zenith = np.atleast_1d(np.asarray(zenith, dtype=np.float64))
+        if np.any(zenith < 0) or np.any(zenith >= 90):
+            raise Exception('Zenith must be >= 0 and < 90')
+
+        zenith = zenith * np.pi/180.0  # in radians
+        ctheta = np.cos(zenith)
+        stheta = np.sin(zenith)
+
+    else:
+        raise Exception('Must specify either cosz or zenith')
+
+    if np.any(azimuth > 180) or np.any(azimuth < -180):
+        raise Exception('Azimuth must be between -180 and 180 degrees')
+
+    if azimuth.ndim != 1:
+        raise Exception('Sun positions must be 1D arrays')
+
+    try:
+        azimuth, ctheta, stheta = np.broadcast_arrays(azimuth, ctheta, stheta)
+    except ValueError:
+        raise Exception('azimuth and cosz or zenith must be the same length')
+
+    return azimuth * np.pi/180, ctheta, stheta
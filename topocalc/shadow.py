@@ -0,0 +1,230 @@
+import numpy as np
+
+from topocalc.core_c import topo_core
+from topocalc.gradient import gradient_c
+from topocalc.horizon import horizons, sweep
+from topocalc.shade import shade
+
+
+class HorizonLUT():
+    """Horizon lookup table for cast shadows at any sun position.
+
+    The horizons for a fixed set of azimuths are calculated once for the
+    dem. The horizon for any other azimuth is interpolated between the
+    two stored azimuths on either side, so a shadow mask is a table
+    lookup instead of a horizon sweep.
+
+    The interpolated horizon is an estimate, cells where the sun is
+    close to the horizon can be wrong between the stored azimuths. More
+    azimuths make the estimate better for more memory.
+
+    Arguments:
+        dem {np.array2d} -- numpy array of dem elevations
+        spacing {float} -- grid spacing
+        nangles {int} -- number of azimuths spaced evenly from -180
+            degrees to store (default: {72})
+        dtype {np.dtype} -- float32 or float64 for the stored horizons,
+            float32 halves the memory (default: {np.float64})
+        **kwargs -- passed to horizons, like nthreads
+    """
+
+    def __init__(self, dem, spacing, nangles=72, dtype=np.float64,
+                 **kwargs):
+
+        if nangles < 4:
+            raise ValueError('HorizonLUT nangles must be 4 or greater')
+
+        self.azimuths = np.linspace(-180, 180, num=nangles, endpoint=False)
+        self.step = 360 / nangles
+        self.hcos = horizons(dem, spacing, self.azimuths, dtype=dtype,
+                             **kwargs)
+
+    @property
+    def shape(self):
+        """Shape of the dem"""
+        return self.hcos.shape[1:]
+
+    def _weights(self, azimuth):
+        """Stored azimuths on either side of the azimuth and the weight
+        of the second one
+        """
+
+        if azimuth > 180 or azimuth < -180:
+            raise ValueError('azimuth must be between -180 and 180 degrees')
+
+        position = (azimuth + 180) / self.step
+        k0 = int(np.floor(position)) % len(self.azimuths)
+        k1 = (k0 + 1) % len(self.azimuths)
+
+        return k0, k1, position - np.floor(position)
+
+    def horizon(self, azimuth, out=None):
+        """Cosines of the horizon angles for an azimuth, interpolated
+        linearly between the stored azimuths
+
+        Arguments:
+            azimuth {float} -- direction on the -180 -> 0 -> 180 range
+            out {np.array2d} -- optional array to write into
+                (default: {None})
+
+        Returns:
+            hcos {np.array2d} -- cosines of angles to the horizon
+        """
+
+        k0, k1, w = self._weights(azimuth)
+
+        if out is None:
+            out = np.empty(self.shape, dtype=self.hcos.dtype)
+
+        if w == 0:
+            out[...] = self.hcos[k0]
+            return out
+
+        # python floats don't change the type of the table
+        np.multiply(self.hcos[k0], float(1 - w), out=out)
+        out += float(w) * self.hcos[k1]
+
+        return out
+
+    def sunlit(self, azimuth, cosz=None, zenith=None, out=None):
+        """Cells that the sun can see, where the sun is above the
+        horizon in the direction of the sun
+
+        Arguments:
+            azimuth {float} -- azimuth to the sun -180..180 degrees
+            cosz {float} -- cosine of the solar zenith angle
+            zenith {float} -- solar zenith angle in degrees, ignored if
+                cosz is given
+            out {np.array2d} -- optional bool array to write into
+                (default: {None})
+
+        Returns:
+            mask {np.array2d} -- True for the cells in the sun
+        """
+
+        if cosz is None:
+            if zenith is None:
+                raise ValueError('Must specify either cosz or zenith')
+            cosz = np.cos(zenith * np.pi / 180)
+
+        if out is None:
+            out = np.empty(self.shape, dtype=bool)
+
+        # the sun is below the horizon for every cell
+        if cosz <= 0:
+            out[...] = False
+            return out
+
+        # cos of the sun zenith greater than the horizon cosine is the
+        # sun above the horizon
+        return np.greater(cosz, self.horizon(azimuth), out=out)
+
+    def sunlit_series(self, azimuth, cosz=None, zenith=None, out=None):
+        """Shadow masks for a time series of sun positions, see sunlit
+
+        Arguments:
+            azimuth {array} -- azimuths to the sun -180..180 degrees
+            cosz {array} -- cosines of the solar zenith angles
+            zenith {array} -- solar zenith angles in degrees
+            out {np.array3d} -- optional bool array of shape (time, rows,
+                cols) to write into, like a np.memmap (default: {None})
+
+        Returns:
+            mask {np.array3d} -- True for the cells in the sun
+        """
+
+        if cosz is None:
+            if zenith is None:
+                raise ValueError('Must specify either cosz or zenith')
+            cosz = np.cos(np.asarray(zenith) * np.pi / 180)
+
+        azimuth, cosz = np.broadcast_arrays(
+            np.atleast_1d(azimuth), np.atleast_1d(cosz))
+
+        shape = (len(azimuth),) + self.shape
+        if out is None:
+            out = np.empty(shape, dtype=bool)
+        elif out.shape != shape:
+            raise ValueError('sunlit out must have shape {}'.format(shape))
+
+        hcos = np.empty(self.shape, dtype=self.hcos.dtype)
+        for k in range(len(azimuth)):
+            if cosz[k] <= 0:
+                out[k] = False
+            else:
+                out[k] = np.greater(cosz[k], self.horizon(azimuth[k], hcos))
+
+        return out
+
+
+def illumination(dem, spacing, azimuth, zenith=None, cosz=None,
+                 sin_slope=None, aspect=None, nthreads=1, dtype=np.float64,
+                 out=None):
+    """Cosine of the local illumination angle with the cast shadows of
+    the terrain, the result of shade set to 0 for the cells that can't
+    see the sun.
+
+    The shadows are found in one sweep along the lines through the dem
+    toward the sun, keeping the height of the shadow from the cells
+    already passed, so the horizons are never calculated.
+
+    Arguments:
+        dem {np.array2d} -- numpy array of dem elevations
+        spacing {float} -- grid spacing
+        azimuth {float} -- azimuth to the sun -180..180 degrees
+        zenith {float} -- solar zenith angle 0..90 degrees
+        cosz {float} -- cosine of the solar zenith angle, the zenith is
+            ignored if given
+        sin_slope {np.array2d} -- optional sin(slope), calculated with
+            gradient_c if not given
+        aspect {np.array2d} -- optional aspect in radians from south,
+            given together with sin_slope
+        nthreads {int} -- number of threads to split the lines over,
+            less than 1 uses all available cores (default: {1})
+        dtype {np.dtype} -- float32 or float64 for the dem and the
+            result (default: {np.float64})
+        out {np.array2d} -- optional array to write into
+            (default: {None})
+
+    Returns:
+        mu {np.array2d} -- cosine of the local illumination angle, 0 in
+            the shadows
+    """
+
+    if dem.ndim != 2:
+        raise ValueError('illumination input of dem is not a 2D array')
+
+    dtype = np.dtype(dtype)
+    if dtype not in (np.float32, np.float64):
+        raise ValueError('illumination dtype must be float32 or float64')
+
+    if (sin_slope is None) != (aspect is None):
+        raise ValueError('illumination needs both sin_slope and aspect')
+
+    dem = np.ascontiguousarray(dem, dtype=dtype)
+
+    if sin_slope is None:
+        sin_slope, aspect = (
+            np.empty(dem.shape, dtype=dtype) for _ in range(2))
+        gradient_c(dem, spacing, spacing, dtype=dtype,
+                   out=(None, sin_slope, None, aspect))
+
+    # shade checks the sun position
+    mu = shade(sin_slope, aspect, azimuth, cosz=cosz, zenith=zenith,
+               dtype=dtype)
+    mu = np.ascontiguousarray(mu)
+
+    if cosz is None:
+        cosz = np.cos(zenith * np.pi / 180)
+    sinz = np.sqrt((1 - cosz) * (1 + cosz))
+    tan_elev = cosz / sinz if sinz > 0 else np.inf
+
+    axis, offsets, line_spacing, fwd = sweep(azimuth, spacing, dem.shape)
+    topo_core.c_shadow2d(dem, axis, offsets, line_spacing, fwd,
+                         float(tan_elev), mu, nthreads)
+
+    if out is None:
+        return mu
+
+    out[...] = mu
+    return out
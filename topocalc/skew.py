@@ -1,5 +1,9 @@
+from functools import lru_cache
+
 import numpy as np
 
+from topocalc.core_c import topo_core
+
 
 def adjust_spacing(spacing, skew_angle):
     """Adjust the grid spacing if a skew angle is present
@@ -15,7 +19,43 @@ def adjust_spacing(spacing, skew_angle):
     return spacing / np.cos(skew_angle * np.arctan(1.) / 45)
 
 
-def skew(arr, angle, fwd=True, fill_min=True):
+@lru_cache(maxsize=128)
+def skew_offsets(nlines, angle):
+    """Offset of the origin of each line for a skew angle, using the
+    same rounding as IPW skew. The tables are cached and returned read
+    only so they can be shared between calls.
+
+    Args:
+        nlines: number of lines in the array to skew
+        angle: angle between -45 and 45 to skew by
+
+    Returns:
+        offsets: integer offset of each line
+        max_skew: largest offset
+    """
+
+    if angle > 45 or angle < -45:
+        raise ValueError('skew angle must be between -45 and 45 degrees')
+
+    negflag = angle < 0.0
+    angle = abs(angle)
+
+    slope = np.tan(angle * np.pi / 180.0)
+    max_skew = int((nlines - 1) * slope + 0.5)
+
+    o = np.arange(nlines)
+    if not negflag:
+        o = o[::-1]
+
+    # truncating the positive values is the same as int()
+    offsets = (o * slope + 0.5).astype(np.intp)
+    offsets.flags.writeable = False
+
+    return offsets, max_skew
+
+
+def skew(arr, angle, fwd=True, fill_min=True, fill_value=None, out=None,
+         dtype=None):
     """
     Skew the origin of successive lines by a specified angle
     A skew with angle of 30 degrees causes the following transformation:
@@ -38,28 +78,33 @@ def skew(arr, angle, fwd=True, fill_min=True):
         fwd: add skew to image if True, unskew image if False
         fill_min: While IPW skew says it fills with zeros, the output
             image is filled with the minimum value
+        fill_value: value to fill with, saves finding the minimum
+            if it's already known
+        out: optional array of dtype to write the output into
+        dtype: float32 or float64 type of the output, defaults to
+            float64. An angle of 0 returns arr unchanged without a dtype.
 
     Returns:
         skewed array
 
     """
 
+    if dtype is not None and np.dtype(dtype) not in (np.float32, np.float64):
+        raise ValueError('skew dtype must be float32 or float64')
+
     if angle == 0:
-        return arr
+        if out is not None:
+            out[:] = arr
+            return out
+        return arr if dtype is None else arr.astype(dtype, copy=False)
+
+    dtype = np.dtype(np.float64 if dtype is None else dtype)
 
     if angle > 45 or angle < -45:
         raise ValueError('skew angle must be between -45 and 45 degrees')
 
     nlines, nsamps = arr.shape
-
-    if angle >= 0.0:
-        negflag = False
-    else:
-        negflag = True
-        angle = -angle
-
-    slope = np.tan(angle * np.pi / 180.0)
-    max_skew = int((nlines - 1) * slope + 0.5)
+    offsets, max_skew = skew_offsets(nlines, angle)
 
     o_nsamps = nsamps
     if fwd:
@@ -67,17 +112,16 @@ def skew(arr, angle, fwd=True, fill_min=True):
     else:
         o_nsamps -= max_skew
 
-    b = np.zeros((nlines, o_nsamps))
-    if fill_min:
-        b += np.min(arr)
+    if out is None:
+        out = np.empty((nlines, o_nsamps), dtype=dtype)
+    elif out.shape != (nlines, o_nsamps) or out.dtype != dtype:
+        raise ValueError('skew out must be a {} array of shape {}'.format(
+            dtype, (nlines, o_nsamps)))
 
-    for line in range(nlines):
-        o = line if negflag else nlines - line - 1
-        offset = int(o * slope + 0.5)
+    if fill_value is None:
+        fill_value = np.min(arr) if fill_min and fwd else 0
 
-        if fwd:
-            b[line, offset:offset+nsamps] = arr[line, :]
-        else:
-            b[line, :] = arr[line, offset:offset+o_nsamps]
+    topo_core.c_skew(np.asarray(arr, dtype=dtype),
+                     offsets, fwd, fill_value, out)
 
-    return b
+    return out
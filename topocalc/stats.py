@@ -0,0 +1,184 @@
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+class Stats():
+    """Wall time, calls, memory and throughput for each stage of a
+    calculation, passed to horizon, horizons or viewf with stats=.
+
+    Each time a stage runs a record is kept with the stage name, the
+    azimuth it ran for, the seconds, the cells it calculated and the
+    bytes it allocated. The stages are:
+
+        gradient -- sin(slope), cos(slope) and aspect in viewf
+        convert -- the type conversion and contiguity copy of the dem
+        sweep -- the lines through the dem for an azimuth
+        hor2d -- the native horizon search
+        copy -- copying the horizons into an out array that the search
+            can't write into directly
+        integral -- the integrand for an azimuth in viewf
+        sum -- adding the integrand to the sky view factor
+
+    With workers the stages of different azimuths run at the same time,
+    so the seconds of all the stages add up to more than the wall time.
+
+    Arguments:
+        callback {callable} -- optional function called with the dict of
+            each record as it is made, like to feed a job monitor. It
+            is called from the worker threads with workers
+            (default: {None})
+        trace_memory {bool} -- record the peak bytes allocated by each
+            stage with tracemalloc. If it isn't tracing it is started
+            for the stages and stopped again once no stage is running.
+            This slows down the stages, and stages running at the same
+            time share the peak (default: {False})
+    """
+
+    def __init__(self, callback=None, trace_memory=False):
+
+        if trace_memory and not hasattr(tracemalloc, 'reset_peak'):
+            raise ValueError('Stats trace_memory requires Python 3.9')
+
+        self.callback = callback
+        self.trace_memory = trace_memory
+        self.records = []
+        self._lock = threading.Lock()
+
+        # stages running and if they started tracemalloc
+        self._running = 0
+        self._tracing = False
+
+    @contextmanager
+    def stage(self, name, cells=0, azimuth=None):
+        """Record the code in a with block as a stage
+
+        Arguments:
+            name {str} -- name of the stage
+            cells {int} -- cells calculated by the stage (default: {0})
+            azimuth {float} -- azimuth the stage ran for (default: {None})
+        """
+
+        if self.trace_memory:
+            with self._lock:
+                if self._running == 0 and not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    self._tracing = True
+                self._running += 1
+
+            start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+        # a stage stopped by an error, like Cancelled, is still recorded
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - t0
+
+            nbytes = 0
+            if self.trace_memory:
+                nbytes = max(tracemalloc.get_traced_memory()[1] - start, 0)
+
+                # stop tracing at the end of the outermost stage
+                with self._lock:
+                    self._running -= 1
+                    if self._running == 0 and self._tracing:
+                        tracemalloc.stop()
+                        self._tracing = False
+
+            self.record(name, seconds, cells=cells, nbytes=nbytes,
+                        azimuth=azimuth)
+
+    def record(self, name, seconds, cells=0, nbytes=0, azimuth=None):
+        """Add a record for a stage
+
+        Arguments:
+            name {str} -- name of the stage
+            seconds {float} -- wall time of the stage
+            cells {int} -- cells calculated by the stage (default: {0})
+            nbytes {int} -- bytes allocated by the stage (default: {0})
+            azimuth {float} -- azimuth the stage ran for (default: {None})
+        """
+
+        record = {
+            'stage': name,
+            'azimuth': azimuth,
+            'seconds': seconds,
+            'cells': cells,
+            'bytes': nbytes,
+            'cells_per_second': cells / seconds if seconds > 0 else 0.0
+        }
+
+        with self._lock:
+            self.records.append(record)
+
+        if self.callback is not None:
+            self.callback(record)
+
+    def summary(self):
+        """Totals for each stage, in the order the stages first ran
+
+        Returns:
+            summary {dict} -- stage name to a dict of the calls, seconds,
+                cells, bytes summed over the calls, max_bytes of one
+                call and cells_per_second
+        """
+
+        with self._lock:
+            records = list(self.records)
+
+        summary = {}
+        for record in records:
+            s = summary.setdefault(record['stage'], {
+                'calls': 0,
+                'seconds': 0.0,
+                'cells': 0,
+                'bytes': 0,
+                'max_bytes': 0
+            })
+            s['calls'] += 1
+            s['seconds'] += record['seconds']
+            s['cells'] += record['cells']
+            s['bytes'] += record['bytes']
+            s['max_bytes'] = max(s['max_bytes'], record['bytes'])
+
+        for s in summary.values():
+            s['cells_per_second'] = \
+                s['cells'] / s['seconds'] if s['seconds'] > 0 else 0.0
+
+        return summary
+
+    def by_azimuth(self):
+        """Seconds in each stage for each azimuth
+
+        Returns:
+            seconds {dict} -- azimuth to a dict of stage name to seconds
+        """
+
+        with self._lock:
+            records = list(self.records)
+
+        seconds = {}
+        for record in records:
+            if record['azimuth'] is None:
+                continue
+
+            stages = seconds.setdefault(record['azimuth'], {})
+            stages[record['stage']] = \
+                stages.get(record['stage'], 0.0) + record['seconds']
+
+        return seconds
+
+
+@contextmanager
+def stage(stats, name, cells=0, azimuth=None):
+    """Record a stage with stats, or just run it if stats is None"""
+
+    if stats is None:
+        yield
+        return
+
+    with stats.stage(name, cells=cells, azimuth=azimuth):
+        yield
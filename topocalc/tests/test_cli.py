@@ -0,0 +1,163 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+from click.testing import CliRunner
+from netCDF4 import Dataset
+
+from topocalc.cli import main
+from topocalc.gradient import gradient_c
+from topocalc.horizon import horizon
+from topocalc.shade import shade_series
+from topocalc.shadow import illumination
+from topocalc.viewf import viewf
+
+
+class TestCli(unittest.TestCase):
+
+    rng = np.random.RandomState(42)
+    dem = 10 * np.cumsum(np.cumsum(rng.randn(45, 50), axis=0), axis=1)
+    spacing = 30
+
+    def setUp(self):
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dem_file = os.path.join(self.tmp.name, 'topo.nc')
+        self.out_file = os.path.join(self.tmp.name, 'out.nc')
+
+        with Dataset(self.dem_file, 'w') as ds:
+            ds.createDimension('y', self.dem.shape[0])
+            ds.createDimension('x', self.dem.shape[1])
+            ds.createVariable('y', 'f8', ('y',))[:] = \
+                -self.spacing * np.arange(self.dem.shape[0])
+            ds.createVariable('x', 'f8', ('x',))[:] = \
+                self.spacing * np.arange(self.dem.shape[1])
+            ds.createVariable('dem', 'f4', ('y', 'x'))[:] = self.dem
+
+        # the dem as it is read back
+        self.z = self.dem.astype(np.float32).astype(np.float64)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def invoke(self, *args):
+
+        result = CliRunner().invoke(
+            main, list(args[:1]) + [self.dem_file, self.out_file] +
+            [str(a) for a in args[1:]])
+        self.assertEqual(result.exit_code, 0, result.output)
+
+        return Dataset(self.out_file, 'r')
+
+    def test_gradient(self):
+
+        slope, _, _, aspect = gradient_c(self.z, self.spacing, self.spacing)
+
+        # blocks of rows are the same as the whole dem
+        with self.invoke('gradient', '--tile-size', 7) as out:
+            np.testing.assert_array_equal(out['slope'][:], slope)
+            np.testing.assert_array_equal(out['aspect'][:], aspect)
+
+            # chunked and compressed
+            self.assertTrue(out['slope'].filters()['zlib'])
+            self.assertEqual(out['slope'].chunking(), [45, 50])
+            np.testing.assert_array_equal(
+                out['x'][:], self.spacing * np.arange(50))
+
+    def test_horizon(self):
+
+        with self.invoke('horizon', '--azimuth', 45,
+                         '--azimuth', -90) as out:
+            self.assertEqual(out['hcos'].shape, (2, 45, 50))
+            np.testing.assert_array_equal(out['azimuth'][:], [45, -90])
+            np.testing.assert_array_equal(
+                out['hcos'][1], horizon(-90, self.z, self.spacing))
+
+        # tiles with a halo covering every horizon
+        with self.invoke('horizon', '--azimuth', 45, '--tile-size', 20,
+                         '--max-distance', 3000) as out:
+            np.testing.assert_array_equal(
+                out['hcos'][0], horizon(45, self.z, self.spacing))
+
+    def test_horizon_float32(self):
+
+        with self.invoke('horizon', '--azimuth', 45,
+                         '--dtype', 'float32') as out:
+            self.assertEqual(out['hcos'].dtype, np.float32)
+            np.testing.assert_array_equal(
+                out['hcos'][0],
+                horizon(45, self.z, self.spacing, dtype=np.float32))
+
+    def test_viewf(self):
+
+        svf, tcf = viewf(self.z, self.spacing, nangles=16)
+
+        with self.invoke('viewf', '--nangles', 16, '--workers', 2) as out:
+            np.testing.assert_array_equal(out['sky_view_factor'][:], svf)
+            np.testing.assert_array_equal(
+                out['terrain_configuration_factor'][:], tcf)
+
+        # the halo of 50 cells covers the dem
+        with self.invoke('viewf', '--nangles', 16, '--max-distance', 1500,
+                         '--max-memory', '2M') as out:
+            np.testing.assert_allclose(
+                out['sky_view_factor'][:], svf, atol=1e-12)
+
+    def test_viewf_all_cores(self):
+
+        svf, _ = viewf(self.z, self.spacing, nangles=16)
+
+        with mock.patch('topocalc.cli.viewf', wraps=viewf) as viewf_mock:
+            with self.invoke('viewf', '--nangles', 16, '--workers', 0) as out:
+                np.testing.assert_array_equal(out['sky_view_factor'][:], svf)
+
+        self.assertEqual(viewf_mock.call_args[1]['workers'], os.cpu_count())
+
+    def test_shade(self):
+
+        _, sin_slope, _, aspect = gradient_c(
+            self.z, self.spacing, self.spacing)
+        mu = shade_series(sin_slope, aspect, [-45, 30], zenith=[60, 40])
+
+        with self.invoke('shade', '--azimuth', -45, '--zenith', 60,
+                         '--azimuth', 30, '--zenith', 40,
+                         '--tile-size', 10) as out:
+            np.testing.assert_allclose(
+                out['illumination'][:], mu, atol=1e-12)
+            np.testing.assert_array_equal(out['zenith'][:], [60, 40])
+
+        with self.invoke('shade', '--azimuth', 30, '--zenith', 80,
+                         '--cast-shadows') as out:
+            np.testing.assert_array_equal(
+                out['illumination'][0],
+                illumination(self.z, self.spacing, 30, zenith=80))
+
+    def test_errors(self):
+
+        runner = CliRunner()
+        args = [self.dem_file, self.out_file]
+
+        # the tiles need a halo
+        result = runner.invoke(
+            main, ['horizon'] + args + ['--azimuth', '0', '--tile-size', '8'])
+        self.assertEqual(result.exit_code, 2)
+
+        # the whole dem doesn't fit
+        result = runner.invoke(
+            main, ['viewf'] + args + ['--max-memory', '1K'])
+        self.assertEqual(result.exit_code, 2)
+
+        result = runner.invoke(
+            main, ['gradient'] + args + ['--max-memory', '4Q'])
+        self.assertEqual(result.exit_code, 2)
+
+        result = runner.invoke(
+            main, ['gradient'] + args + ['--variable', 'elevation'])
+        self.assertEqual(result.exit_code, 2)
+
+        result = runner.invoke(
+            main, ['shade'] + args + ['--azimuth', '0', '--azimuth', '10',
+                                      '--zenith', '40'])
+        self.assertEqual(result.exit_code, 2)
@@ -1,3 +1,5 @@
+import os
+import tempfile
 import unittest
 
 import numpy as np
@@ -266,3 +268,156 @@ class TestGradientD8(TestGradient):
         self.assertTrue(np.all(py_slope == 0))
         self.assertTrue(np.all(asp == 180))
         self.assertTrue(np.all(ipw_a == 0))
+
+
+class TestGradientBlocks(unittest.TestCase):
+    """Row blocks and memmap arrays must match the whole dem"""
+
+    rng = np.random.RandomState(42)
+    dem = 10 * np.cumsum(np.cumsum(rng.randn(37, 23), axis=0), axis=1)
+
+    def test_gradient_blocks(self):
+
+        for func in (gradient.gradient_d4, gradient.gradient_d8):
+            slope, asp = func(self.dem, 30, 30, aspect_rad=True)
+
+            for block_rows in (1, 2, 5, 36, 100):
+                s, a = func(self.dem, 30, 30, aspect_rad=True,
+                            block_rows=block_rows)
+                np.testing.assert_array_equal(s, slope)
+                np.testing.assert_array_equal(a, asp)
+
+    def test_iter_gradient(self):
+
+        for d8, func in ((True, gradient.gradient_d8),
+                         (False, gradient.gradient_d4)):
+            slope, asp = func(self.dem, 30, 30, aspect_rad=True)
+
+            for block_rows in (1, 2, 5, 36, 100):
+                blocks = list(gradient.iter_gradient(
+                    gradient.row_blocks(self.dem, block_rows), 30, 30,
+                    d8=d8, aspect_rad=True))
+
+                np.testing.assert_array_equal(
+                    np.concatenate([b[0] for b in blocks]), slope)
+                np.testing.assert_array_equal(
+                    np.concatenate([b[1] for b in blocks]), asp)
+
+    def test_iter_gradient_uneven(self):
+        """Blocks of any size, empty blocks are skipped"""
+
+        slope, asp = gradient.gradient_d8(self.dem, 30, 30)
+        blocks = np.split(self.dem, [1, 5, 5, 7, 14, 15])
+
+        out = list(gradient.iter_gradient(blocks, 30, 30))
+
+        self.assertEqual([len(s) for s, _ in out], [1, 4, 2, 7, 1, 22])
+        np.testing.assert_array_equal(
+            np.concatenate([s for s, _ in out]), slope)
+        np.testing.assert_array_equal(
+            np.concatenate([a for _, a in out]), asp)
+
+    def test_gradient_memmap(self):
+
+        slope, asp = gradient.gradient_d8(self.dem, 30, 30)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            dem = np.memmap(os.path.join(tmp, 'dem'), dtype=np.float64,
+                            mode='w+', shape=self.dem.shape)
+            dem[:] = self.dem
+            out = tuple(
+                np.memmap(os.path.join(tmp, name), dtype=np.float64,
+                          mode='w+', shape=self.dem.shape)
+                for name in ('slope', 'aspect'))
+
+            s, a = gradient.gradient_d8(dem, 30, 30, out=out, block_rows=8)
+
+            self.assertTrue(s is out[0])
+            self.assertTrue(a is out[1])
+            np.testing.assert_array_equal(s, slope)
+            np.testing.assert_array_equal(a, asp)
+            del dem, out, s, a
+
+    def test_gradient_float32(self):
+
+        for func in (gradient.gradient_d4, gradient.gradient_d8):
+            slope, asp = func(self.dem, 30, 30)
+            s, a = func(self.dem, 30, 30, dtype=np.float32)
+
+            self.assertEqual(s.dtype, np.float32)
+            self.assertEqual(a.dtype, np.float32)
+            np.testing.assert_allclose(s, slope, rtol=0, atol=1e-5)
+            np.testing.assert_allclose(a, asp, rtol=0, atol=1e-3)
+
+        self.assertRaises(ValueError, gradient.gradient_d8, self.dem, 30,
+                          30, dtype=np.int32)
+
+
+class TestGradientC(unittest.TestCase):
+    """The native gradient is the same as the numpy gradient to
+    rounding
+    """
+
+    rng = np.random.RandomState(42)
+    dem = 10 * np.cumsum(np.cumsum(rng.randn(37, 23), axis=0), axis=1)
+
+    def test_gradient_c(self):
+
+        for d8, func in ((True, gradient.gradient_d8),
+                         (False, gradient.gradient_d4)):
+            slope, asp = func(self.dem, 30, 20, aspect_rad=True)
+            s, sin_s, cos_s, a = gradient.gradient_c(self.dem, 30, 20, d8=d8)
+
+            np.testing.assert_allclose(s, slope, rtol=0, atol=1e-14)
+            np.testing.assert_allclose(sin_s, np.sin(slope), rtol=0,
+                                       atol=1e-14)
+            np.testing.assert_allclose(cos_s, np.cos(slope), rtol=0,
+                                       atol=1e-14)
+            np.testing.assert_allclose(a, asp, rtol=0, atol=1e-13)
+
+    def test_gradient_c_flat(self):
+
+        slope, sin_s, cos_s, a = gradient.gradient_c(np.ones((10, 10)), 1, 1)
+
+        self.assertTrue(np.all(slope == 0))
+        self.assertTrue(np.all(sin_s == 0))
+        self.assertTrue(np.all(cos_s == 1))
+        self.assertTrue(np.all(a == 0))
+
+    def test_gradient_c_out(self):
+
+        out = (None, np.zeros((37, 23)), None, np.zeros((37, 23)))
+        _, sin_s, _, a = gradient.gradient_c(self.dem, 30, 30, out=out)
+        _, sin_slope, _, asp = gradient.gradient_c(self.dem, 30, 30)
+
+        self.assertTrue(sin_s is out[1])
+        np.testing.assert_array_equal(sin_s, sin_slope)
+        np.testing.assert_array_equal(a, asp)
+
+    def test_gradient_c_float32(self):
+
+        slope, _, _, asp = gradient.gradient_c(self.dem, 30, 30)
+        s, _, _, a = gradient.gradient_c(self.dem, 30, 30, dtype=np.float32)
+
+        self.assertEqual(s.dtype, np.float32)
+        np.testing.assert_allclose(s, slope, rtol=0, atol=1e-6)
+
+    def test_gradient_c_single_line(self):
+        """A single row or column is padded like gradient_d8"""
+
+        for dem in (self.dem[:1], self.dem[:, :1], self.dem[:1, :1]):
+            for d8, func in ((True, gradient.gradient_d8),
+                             (False, gradient.gradient_d4)):
+                slope, asp = func(dem, 30, 20, aspect_rad=True)
+                s, _, _, a = gradient.gradient_c(dem, 30, 20, d8=d8)
+
+                np.testing.assert_allclose(s, slope, rtol=0, atol=1e-14)
+                np.testing.assert_allclose(a, asp, rtol=0, atol=1e-13)
+
+    def test_gradient_c_errors(self):
+
+        self.assertRaises(ValueError, gradient.gradient_c, np.ones(10), 1, 1)
+        self.assertRaises(ValueError, gradient.gradient_c, np.ones((0, 10)),
+                          1, 1)
+        self.assertRaises(ValueError, gradient.gradient_c, self.dem, 1, 1,
+                          out=(None, None))
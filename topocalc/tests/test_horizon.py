@@ -1,8 +1,14 @@
+import os
 import unittest
 
 import numpy as np
+from spatialnc import ipw
 
-from topocalc.horizon import hor2d_c, horizon
+from topocalc.core_c import topo_core
+from topocalc.horizon import (hor2d_c, hor2d_skew_c, horizon,
+                              horizon_from_index, horizon_index, horizons,
+                              skew_transpose, sweep, transpose_skew)
+from topocalc.skew import skew
 
 
 class TestHorizon(unittest.TestCase):
@@ -43,16 +49,56 @@ class TestHorizon(unittest.TestCase):
         self.assertTrue("hor1d input of z is not a 2D array"
                         in str(context.exception))
 
+    def test_hor2dc_axis_errors(self):
+        """Test the hor2dc axis errors
+        """
+
+        dem = np.ones((10, 1))
+
+        with self.assertRaises(ValueError) as context:
+            hor2d_c(dem, 1, axis=2)
+
+        self.assertTrue("hor1d axis must be 0 or 1"
+                        in str(context.exception))
+
+    def test_hor2dc_axis(self):
+        """Sweeping down the columns is the same as transposing
+        """
+
+        rng = np.random.RandomState(42)
+        dem = 10 * np.cumsum(rng.randn(30, 40), axis=0)
+
+        for fwd in [True, False]:
+            np.testing.assert_array_equal(
+                hor2d_c(dem, 30, fwd=fwd, axis=0),
+                hor2d_c(dem.transpose(), 30, fwd=fwd).transpose()
+            )
+
+    def test_hor2dc_out_errors(self):
+        """An out that doesn't match z is rejected before the native
+        function writes into it
+        """
+
+        dem = np.ones((50, 60))
+        outs = [np.zeros((2, 2)), np.zeros((50, 60), dtype=np.float32),
+                np.zeros((60, 50)).transpose()]
+
+        for out in outs:
+            self.assertRaises(ValueError, hor2d_c, dem, 30, out=out)
+
+        self.assertRaises(ValueError, topo_core.c_hor2d, dem, 30.0, True,
+                          np.zeros((2, 2)))
+
     def test_hor2dc_type_errors(self):
         """Test the hor2dc function errors
         """
 
-        dem = np.float32(np.ones((10, 1)))
+        dem = np.int32(np.ones((10, 1)))
 
         with self.assertRaises(ValueError) as context:
             hor2d_c(dem, 1)
 
-        self.assertTrue("hor1d input of z must be a double"
+        self.assertTrue("hor1d input of z must be float32 or float64"
                         in str(context.exception))
 
 
@@ -75,14 +121,15 @@ class TestHorizonGold(unittest.TestCase):
         # calculate the gold horizon
         hcos_gold = self.calc_gold_horizon(surf, gold_index)
 
-        # calculate the horizon
-        hcos = horizon(90, surf.reshape(1, -1), self.DX)
+        # calculate the horizon with both search methods
+        for hull in [True, False]:
+            hcos = horizon(90, surf.reshape(1, -1), self.DX, hull=hull)
 
-        np.testing.assert_array_almost_equal(
-            hcos_gold.reshape(1, -1),
-            hcos,
-            decimal=6
-        )
+            np.testing.assert_array_almost_equal(
+                hcos_gold.reshape(1, -1),
+                hcos,
+                decimal=6
+            )
 
     def test_horizon1(self):
 
@@ -104,3 +151,371 @@ class TestHorizonGold(unittest.TestCase):
         gold_index = np.array([3, 3, 3, 5, 5, 7, 7, 7, 9, 9])
 
         self.assert_horizon(surf, gold_index)
+
+
+class TestHorizonHull(unittest.TestCase):
+    """The convex hull search must find the same horizons as
+    the brute force search"""
+
+    def test_hull_lakes(self):
+
+        test_dir = os.path.dirname(os.path.abspath(__file__))
+        d = ipw.IPW(os.path.join(test_dir, 'Lakes/gold_ipw/gold_dem.ipw'))
+        dem = d.bands[0].data.astype(np.float64)
+
+        for azimuth in range(-180, 181, 15):
+            np.testing.assert_array_equal(
+                horizon(azimuth, dem, 50, hull=True),
+                horizon(azimuth, dem, 50, hull=False)
+            )
+
+    def test_hull_random(self):
+
+        rng = np.random.RandomState(42)
+
+        surfaces = [
+            rng.randint(0, 5, 100).astype(np.float64),
+            1000 * rng.rand(100),
+            10 * np.cumsum(rng.randn(100))
+        ]
+
+        for surf in surfaces:
+            for forward in [True, False]:
+                hcos_hull = np.zeros_like(surf)
+                hcos = np.zeros_like(surf)
+                topo_core.c_hor1d(surf, 30, forward, hcos_hull, True)
+                topo_core.c_hor1d(surf, 30, forward, hcos, False)
+
+                np.testing.assert_array_equal(hcos_hull, hcos)
+
+    def test_hull_collinear_index(self):
+        """Ties on flat and collinear points, where the divided slopes
+        round differently, go to the same point in both searches"""
+
+        rng = np.random.RandomState(42)
+        x = np.arange(200, dtype=np.float64)
+
+        surfaces = [np.full(200, 0.3), 0.1 * x + 2, 0.7 * x + 0.1]
+        for _ in range(20):
+            surf = rng.rand() * x + rng.rand()
+            surf[rng.randint(0, 200, 3)] += rng.rand(3)
+            surfaces.append(surf)
+
+        for surf in surfaces:
+            for forward in [True, False]:
+                index_hull = np.zeros(len(surf), dtype=np.intc)
+                index = np.zeros(len(surf), dtype=np.intc)
+                topo_core.c_hor1d(surf, 30, forward, np.zeros_like(surf),
+                                  True, index_hull)
+                topo_core.c_hor1d(surf, 30, forward, np.zeros_like(surf),
+                                  False, index)
+
+                np.testing.assert_array_equal(index_hull, index)
+
+        # a tilted plane is collinear along every line
+        dem = 0.37 * x[:50, None] + 0.11 * x[None, :60]
+        for azimuth in [-90, 0, 30, 120, 180]:
+            _, index_hull, _ = horizon_index(azimuth, dem, 30, hull=True)
+            _, index, _ = horizon_index(azimuth, dem, 30, hull=False)
+            np.testing.assert_array_equal(index_hull, index)
+
+    def test_horizon_nthreads(self):
+
+        rng = np.random.RandomState(42)
+        dem = 10 * np.cumsum(rng.randn(50, 60), axis=1)
+
+        for azimuth in [-90, 0, 30, 120]:
+            np.testing.assert_array_equal(
+                horizon(azimuth, dem, 30, nthreads=1),
+                horizon(azimuth, dem, 30, nthreads=4)
+            )
+
+
+class TestHorizons(unittest.TestCase):
+
+    rng = np.random.RandomState(42)
+    dem = 10 * np.cumsum(np.cumsum(rng.randn(30, 40), axis=0), axis=1)
+    azimuths = np.linspace(-180, 180, 24, endpoint=False)
+
+    def test_horizons(self):
+
+        hcos = horizons(self.dem, 30, self.azimuths)
+        self.assertEqual(hcos.shape, (24, 30, 40))
+
+        for k, azimuth in enumerate(self.azimuths):
+            np.testing.assert_array_equal(
+                hcos[k], horizon(azimuth, self.dem, 30))
+
+    def test_horizons_out(self):
+
+        out = np.zeros((24, 30, 40))
+        hcos = horizons(self.dem, 30, self.azimuths, out=out)
+
+        self.assertTrue(hcos is out)
+        np.testing.assert_array_equal(
+            out, horizons(self.dem, 30, self.azimuths))
+
+    def test_horizon_out(self):
+
+        out = np.zeros((30, 40))
+        hcos = horizon(60, self.dem, 30, out=out)
+
+        self.assertTrue(hcos is out)
+        np.testing.assert_array_equal(out, horizon(60, self.dem, 30))
+        self.assertRaises(ValueError, horizon, 60, self.dem, 30,
+                          out=np.zeros((40, 30)))
+
+    def test_horizons_errors(self):
+
+        self.assertRaises(ValueError, horizons, np.ones(10), 30, [0])
+        self.assertRaises(ValueError, horizons, self.dem, 30, [0, 200])
+        self.assertRaises(ValueError, horizons, self.dem, 30, [0],
+                          out=np.zeros((2, 30, 40)))
+
+
+class TestHorizonSkew(unittest.TestCase):
+    """The oblique directions walk the skewed lines through the dem,
+    which must be the same as skewing the dem"""
+
+    rng = np.random.RandomState(42)
+    dem = 10 * np.cumsum(np.cumsum(rng.randn(30, 40), axis=0), axis=1)
+
+    def skew_horizon(self, azimuth):
+
+        if azimuth >= -45 and azimuth <= 45:
+            t, spacing = skew_transpose(self.dem, 30, azimuth)
+            h = hor2d_c(t, spacing, fwd=True)
+            return skew(h.transpose(), azimuth, fwd=False)
+
+        elif azimuth > 45 and azimuth < 135:
+            a = 90 - azimuth
+            t, spacing = transpose_skew(self.dem, 30, a)
+            h = hor2d_c(t, spacing, fwd=True)
+            return skew(h.transpose(), a, fwd=False).transpose()
+
+        elif azimuth < -45 and azimuth > -135:
+            a = -90 - azimuth
+            t, spacing = transpose_skew(self.dem, 30, a)
+            h = hor2d_c(t, spacing, fwd=False)
+            return skew(h.transpose(), a, fwd=False).transpose()
+
+        a = azimuth + 180 if azimuth < 0 else azimuth - 180
+        t, spacing = skew_transpose(self.dem, 30, a)
+        h = hor2d_c(t, spacing, fwd=False)
+        return skew(h.transpose(), a, fwd=False)
+
+    def test_horizon_skew(self):
+
+        for azimuth in [-170, -135, -100, -45, -10, 25, 45, 60, 135, 160]:
+            np.testing.assert_array_equal(
+                horizon(azimuth, self.dem, 30),
+                self.skew_horizon(azimuth)
+            )
+
+    def test_horizon_mask(self):
+        """Only the lines through the mask are searched"""
+
+        mask = np.zeros(self.dem.shape, dtype=bool)
+        mask[10, 12] = mask[20, 30] = True
+
+        for azimuth in [-135, -90, 0, 25, 60, 180]:
+            hcos = horizon(azimuth, self.dem, 30)
+            hcos_mask = horizon(azimuth, self.dem, 30, mask=mask)
+
+            np.testing.assert_array_equal(hcos_mask[mask], hcos[mask])
+            self.assertLess(np.count_nonzero(hcos_mask),
+                            np.count_nonzero(hcos))
+
+        self.assertRaises(ValueError, horizon, 45, self.dem, 30,
+                          mask=mask[1:])
+
+    def test_hor2d_skew_out_errors(self):
+        """An out that doesn't match z is rejected before the native
+        function writes into it
+        """
+
+        z = np.ones((45, 50))
+        axis, offsets, spacing, _ = sweep(30, 30, z.shape)
+        outs = [np.zeros((3, 3)), np.zeros((45, 50), dtype=np.float32),
+                np.zeros((50, 45)).transpose()]
+
+        for out in outs:
+            self.assertRaises(ValueError, hor2d_skew_c, z, axis, offsets,
+                              spacing, out=out)
+
+        self.assertRaises(
+            ValueError, topo_core.c_hor2d_skew, z, axis,
+            np.ascontiguousarray(offsets, dtype=np.intc), spacing, True,
+            np.zeros((3, 3)))
+
+    def test_sweep_window(self):
+        """A window of a grid has the lines of the grid"""
+
+        for azimuth in [-150, -60, 20, 100]:
+            axis, offsets, spacing, fwd = sweep(azimuth, 30, (45, 50))
+            w_axis, w_offsets, w_spacing, w_fwd = sweep(
+                azimuth, 30, (20, 25), origin=(10, 5), grid_shape=(45, 50))
+
+            start = (10, 5)[axis]
+            window = offsets[start:start + (20, 25)[axis]]
+
+            self.assertEqual((axis, spacing, fwd),
+                             (w_axis, w_spacing, w_fwd))
+            np.testing.assert_array_equal(
+                w_offsets, window - np.min(window))
+
+
+class TestHorizonFloat32(unittest.TestCase):
+    """float32 horizons are the float64 horizons rounded"""
+
+    rng = np.random.RandomState(42)
+    dem = 10 * np.cumsum(np.cumsum(rng.randn(30, 40), axis=0), axis=1)
+    azimuths = [-180, -135, -90, -60, 0, 25, 90, 160]
+
+    def test_horizon_float32(self):
+
+        for azimuth in self.azimuths:
+            h64 = horizon(azimuth, self.dem, 30)
+            h32 = horizon(azimuth, self.dem.astype(np.float32), 30,
+                          dtype=np.float32)
+
+            self.assertEqual(h32.dtype, np.float32)
+            np.testing.assert_allclose(h32, h64, rtol=0, atol=1e-6)
+
+    def test_horizons_float32(self):
+
+        hcos = horizons(self.dem, 30, self.azimuths, dtype=np.float32)
+        self.assertEqual(hcos.dtype, np.float32)
+
+        for k, azimuth in enumerate(self.azimuths):
+            np.testing.assert_array_equal(
+                hcos[k], horizon(azimuth, self.dem, 30, dtype=np.float32))
+
+    def test_float32_errors(self):
+
+        self.assertRaises(ValueError, horizon, 30, self.dem, 30,
+                          dtype=np.int32)
+        self.assertRaises(ValueError, horizons, self.dem, 30, [30],
+                          dtype=np.float16)
+        self.assertRaises(ValueError, horizons, self.dem, 30, [30],
+                          out=np.zeros((1, 30, 40)), dtype=np.float32)
+
+
+class TestHorizonMaxDistance(unittest.TestCase):
+
+    rng = np.random.RandomState(42)
+    dem = 10 * np.cumsum(np.cumsum(rng.randn(30, 40), axis=0), axis=1)
+    azimuths = [-180, -135, -90, -60, 0, 25, 45, 90, 160]
+
+    def test_bounded_1d(self):
+
+        rng = np.random.RandomState(42)
+        surf = 10 * np.cumsum(rng.randn(100))
+        n = len(surf)
+
+        for r in [0, 1, 7, 50]:
+            for forward in [True, False]:
+                index = np.zeros(n, dtype=np.intc)
+                topo_core.c_hor1d(surf, 30, forward, np.zeros(n), True,
+                                  index, max_steps=r)
+
+                # the highest slope up to r points away, ties to the
+                # closest point
+                for i in range(n):
+                    step = 1 if forward else -1
+                    best, point = 0, i
+                    for k in range(i + step, i + step * (r + 1), step):
+                        if k < 0 or k >= n or surf[k] <= surf[i]:
+                            continue
+                        slope = (surf[k] - surf[i]) / abs(k - i)
+                        if slope > best:
+                            best, point = slope, k
+
+                    self.assertEqual(index[i], point)
+
+    def test_max_distance(self):
+
+        for azimuth in self.azimuths:
+            hcos, _, distance = horizon_index(azimuth, self.dem, 30)
+
+            for max_distance in [0, 100, 250]:
+                hcos_d, _, distance_d = horizon_index(
+                    azimuth, self.dem, 30, max_distance=max_distance)
+                np.testing.assert_array_equal(
+                    hcos_d, horizon(azimuth, self.dem, 30,
+                                    max_distance=max_distance))
+
+                # the horizons within max_distance don't change
+                self.assertTrue(np.all(distance_d <= max_distance))
+                near = distance <= max_distance
+                np.testing.assert_array_equal(hcos_d[near], hcos[near])
+
+            np.testing.assert_array_equal(
+                horizon(azimuth, self.dem, 30, max_distance=1e6), hcos)
+
+    def test_horizons_max_distance(self):
+
+        hcos = horizons(self.dem, 30, self.azimuths, max_distance=100)
+        for k, azimuth in enumerate(self.azimuths):
+            np.testing.assert_array_equal(
+                hcos[k], horizon(azimuth, self.dem, 30, max_distance=100))
+
+    def test_max_distance_errors(self):
+
+        self.assertRaises(ValueError, horizon, 0, self.dem, 30,
+                          max_distance=-1)
+        self.assertRaises(ValueError, horizons, self.dem, 30, [0],
+                          max_distance=np.nan)
+
+
+class TestHorizonIndex(unittest.TestCase):
+
+    rng = np.random.RandomState(42)
+    dem = 10 * np.cumsum(np.cumsum(rng.randn(30, 40), axis=0), axis=1)
+    azimuths = [-180, -135, -90, -60, 0, 25, 45, 90, 160]
+
+    def test_horizon_index(self):
+
+        for azimuth in self.azimuths:
+            hcos, index, distance = horizon_index(azimuth, self.dem, 30)
+
+            np.testing.assert_array_equal(
+                hcos, horizon(azimuth, self.dem, 30))
+            np.testing.assert_array_equal(
+                hcos, horizon_from_index(self.dem, index, distance))
+
+            # cells that are their own horizon
+            own = index == np.arange(self.dem.size).reshape(self.dem.shape)
+            np.testing.assert_array_equal(own, distance == 0)
+            self.assertTrue(np.all(hcos[own] == 0))
+
+    def test_horizon_index_distance(self):
+
+        # east along the rows, the horizons are in front on the same row
+        _, index, distance = horizon_index(90, self.dem, 30)
+
+        rows, cols = np.unravel_index(index, self.dem.shape)
+        np.testing.assert_array_equal(rows, np.indices(self.dem.shape)[0])
+        self.assertTrue(np.all(cols >= np.arange(40)))
+        np.testing.assert_array_equal(distance, 30 * (cols - np.arange(40)))
+
+    def test_horizon_from_index_scaled(self):
+
+        for azimuth in self.azimuths:
+            _, index, distance = horizon_index(azimuth, self.dem, 30)
+
+            np.testing.assert_allclose(
+                horizon_from_index(self.dem, index, distance, scale=1/3),
+                horizon(azimuth, self.dem, 10), rtol=0, atol=1e-12)
+            np.testing.assert_allclose(
+                horizon_from_index(self.dem, index, distance, z_factor=2),
+                horizon(azimuth, 2 * self.dem, 30), rtol=0, atol=1e-12)
+
+    def test_horizon_from_index_errors(self):
+
+        _, index, distance = horizon_index(30, self.dem, 30)
+
+        self.assertRaises(ValueError, horizon_from_index, self.dem,
+                          index[1:], distance)
+        self.assertRaises(ValueError, horizon_from_index, self.dem,
+                          index, distance, scale=0)
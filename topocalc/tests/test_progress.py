@@ -0,0 +1,72 @@
+import unittest
+
+import numpy as np
+
+from topocalc.horizon import hor2d_c, horizon, horizons
+from topocalc.progress import CancelToken, Cancelled
+from topocalc.viewf import viewf
+
+
+class TestProgress(unittest.TestCase):
+
+    rng = np.random.RandomState(42)
+    dem = 10 * np.cumsum(np.cumsum(rng.randn(45, 50), axis=0), axis=1)
+
+    def test_progress(self):
+
+        calls = []
+        svf, tcf = viewf(self.dem, 30, nangles=16,
+                         progress=lambda *args: calls.append(args))
+
+        self.assertEqual(len(calls), 16)
+        np.testing.assert_allclose(
+            [done for done, _ in calls], np.arange(1, 17) / 16)
+        self.assertTrue(all(eta >= 0 for _, eta in calls))
+        self.assertEqual(calls[-1][1], 0)
+
+        # the result doesn't change
+        svf_ref, _ = viewf(self.dem, 30, nangles=16)
+        np.testing.assert_array_equal(svf, svf_ref)
+
+    def test_cancel_token(self):
+
+        token = CancelToken()
+        self.assertFalse(token.cancelled)
+        token.check()
+
+        token.cancel()
+        self.assertTrue(token.cancelled)
+        self.assertRaises(Cancelled, token.check)
+
+    def test_cancel_native(self):
+
+        token = CancelToken()
+        token.cancel()
+
+        # every line is skipped by the native search
+        hcos = np.zeros_like(self.dem)
+        self.assertRaises(Cancelled, hor2d_c, self.dem, 30, out=hcos,
+                          cancel=token)
+        np.testing.assert_array_equal(hcos, 0)
+
+        self.assertRaises(Cancelled, horizon, 45, self.dem, 30,
+                          cancel=token)
+        self.assertRaises(Cancelled, horizons, self.dem, 30, [-45, 45],
+                          cancel=token)
+
+    def test_cancel_viewf(self):
+
+        for workers in (1, 4):
+            token = CancelToken()
+            calls = []
+
+            def progress(done, eta):
+                calls.append(done)
+                if len(calls) == 3:
+                    token.cancel()
+
+            with self.assertRaises(Cancelled):
+                viewf(self.dem, 30, nangles=16, workers=workers,
+                      progress=progress, cancel=token)
+
+            self.assertEqual(len(calls), 3)
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from spatialnc import ipw
+
+from topocalc.horizon import horizon
+from topocalc.pyramid import horizon_multires, pyramid
+
+
+class TestPyramid(unittest.TestCase):
+
+    rng = np.random.RandomState(42)
+    dem = 10 * np.cumsum(np.cumsum(rng.randn(45, 50), axis=0), axis=1)
+
+    def test_pyramid(self):
+
+        levels, index = pyramid(self.dem, 2, factor=3, return_index=True)
+
+        self.assertTrue(levels[0] is self.dem)
+        self.assertEqual(levels[1].shape, (15, 17))
+        self.assertEqual(levels[2].shape, (5, 6))
+
+        # the highest cell of each block, the last column is a smaller
+        # block
+        for r in range(15):
+            for c in range(17):
+                block = self.dem[3 * r:3 * r + 3, 3 * c:3 * c + 3]
+                self.assertEqual(levels[1][r, c], block.max())
+
+        # the dem cell each coarse cell came from
+        for k in (1, 2):
+            np.testing.assert_array_equal(
+                self.dem.flat[index[k]], levels[k])
+
+        np.testing.assert_array_equal(
+            levels[2], pyramid(levels[1], 1, factor=3)[1])
+
+    def test_pyramid_errors(self):
+
+        self.assertRaises(ValueError, pyramid, self.dem[0], 1)
+        self.assertRaises(ValueError, pyramid, self.dem, -1)
+        self.assertRaises(ValueError, pyramid, self.dem, 1, factor=1)
+
+
+class TestHorizonMultires(unittest.TestCase):
+
+    test_dir = os.path.dirname(os.path.abspath(__file__))
+    dem = ipw.IPW(os.path.join(
+        test_dir, 'Lakes/gold_ipw/gold_dem.ipw')).bands[0].data.astype(
+            np.float64)
+
+    def test_near_covers_dem(self):
+
+        for azimuth in [-135, 0, 30, 90]:
+            np.testing.assert_array_equal(
+                horizon_multires(azimuth, self.dem, 50, 20000),
+                horizon(azimuth, self.dem, 50))
+
+    def test_multires_lakes(self):
+
+        for azimuth in [-135, -45, 0, 30, 90]:
+            full = np.arcsin(horizon(azimuth, self.dem, 50))
+            near = np.arcsin(horizon(azimuth, self.dem, 50,
+                                     max_distance=1000))
+            multires = np.arcsin(horizon_multires(
+                azimuth, self.dem, 50, 1000, levels=3, factor=2))
+
+            # the far field is within a quarter of a degree on average,
+            # the near field alone is off by over half a degree
+            error = np.degrees(np.abs(multires - full))
+            self.assertLess(error.mean(), 0.25)
+            self.assertLess(error.mean(),
+                            np.degrees(np.abs(near - full)).mean() / 4)
+
+    def test_multires_tiled(self):
+
+        hcos = horizon_multires(30, self.dem, 50, 500)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            out = np.memmap(os.path.join(tmp, 'hcos.dat'), mode='w+',
+                            dtype=np.float64, shape=self.dem.shape)
+            hcos_t = horizon_multires(30, self.dem, 50, 500, tile_size=40,
+                                      out=out)
+
+            self.assertTrue(hcos_t is out)
+            np.testing.assert_array_equal(hcos_t, hcos)
+            del out, hcos_t
+
+    def test_multires_errors(self):
+
+        self.assertRaises(ValueError, horizon_multires, 0, self.dem, 50, 0)
+        self.assertRaises(ValueError, horizon_multires, 0, self.dem, 50,
+                          500, levels=0)
@@ -3,7 +3,7 @@ import unittest
 import numpy as np
 
 from topocalc.gradient import gradient_d8
-from topocalc.shade import shade
+from topocalc.shade import iter_shade, shade, shade_series
 
 
 class TestShade(unittest.TestCase):
@@ -115,3 +115,69 @@ class TestShade(unittest.TestCase):
 
         self.assertAlmostEqual(np.mean(mu), 0.9930530248115434, places=7)
         np.testing.assert_allclose(mu, mu_cos)
+
+    def test_shade_float32(self):
+
+        dem = np.flipud(np.tile(range(10), (10, 1)).transpose())
+        slope, asp = self.calc_slope(dem)
+
+        mu = shade(slope, asp, 30, zenith=45)
+        mu32 = shade(slope, asp, 30, zenith=45, dtype=np.float32)
+
+        self.assertEqual(mu32.dtype, np.float32)
+        np.testing.assert_allclose(mu32, mu, rtol=0, atol=1e-6)
+
+
+class TestShadeSeries(unittest.TestCase):
+
+    rng = np.random.RandomState(42)
+    dem = 10 * np.cumsum(np.cumsum(rng.randn(20, 30), axis=0), axis=1)
+    azimuth = np.linspace(-170, 170, 12)
+    zenith = np.linspace(5, 85, 12)
+
+    def setUp(self):
+        slope, self.aspect = gradient_d8(self.dem, 30, 30, aspect_rad=True)
+        self.slope = np.sin(slope)
+
+        self.mu = np.stack([
+            shade(self.slope, self.aspect, a, zenith=z)
+            for a, z in zip(self.azimuth, self.zenith)
+        ])
+
+    def test_shade_series(self):
+
+        mu = shade(self.slope, self.aspect, self.azimuth, zenith=self.zenith)
+
+        self.assertEqual(mu.shape, (12, 20, 30))
+        np.testing.assert_allclose(mu, self.mu, rtol=0, atol=1e-14)
+
+        mu_cos = shade_series(self.slope, self.aspect, self.azimuth,
+                              cosz=np.cos(self.zenith * np.pi / 180))
+        np.testing.assert_allclose(mu_cos, self.mu, rtol=0, atol=1e-14)
+
+    def test_shade_series_out(self):
+
+        out = np.zeros((12, 20, 30))
+        mu = shade_series(self.slope, self.aspect, self.azimuth,
+                          zenith=self.zenith, out=out)
+
+        self.assertTrue(mu is out)
+        np.testing.assert_allclose(out, self.mu, rtol=0, atol=1e-14)
+
+    def test_iter_shade(self):
+
+        for k, mu in enumerate(iter_shade(self.slope, self.aspect,
+                                          self.azimuth, zenith=self.zenith)):
+            np.testing.assert_allclose(mu, self.mu[k], rtol=0, atol=1e-14)
+
+        self.assertEqual(k, 11)
+
+    def test_shade_series_errors(self):
+
+        self.assertRaises(Exception, shade_series, self.slope, self.aspect,
+                          self.azimuth, zenith=self.zenith[:5])
+        self.assertRaises(Exception, shade_series, self.slope, self.aspect,
+                          self.azimuth, cosz=np.zeros(12))
+        self.assertRaises(Exception, shade_series, self.slope, self.aspect,
+                          self.azimuth, zenith=self.zenith,
+                          out=np.zeros((11, 20, 30)))
@@ -0,0 +1,126 @@
+import unittest
+
+import numpy as np
+
+from topocalc.gradient import gradient_c, gradient_d8
+from topocalc.horizon import horizon
+from topocalc.shade import shade
+from topocalc.shadow import HorizonLUT, illumination
+
+
+class TestHorizonLUT(unittest.TestCase):
+
+    rng = np.random.RandomState(42)
+    dem = 10 * np.cumsum(np.cumsum(rng.randn(30, 40), axis=0), axis=1)
+    lut = HorizonLUT(dem, 30, nangles=36)
+
+    def test_lut_stored_azimuths(self):
+
+        for azimuth in [-180, -90, -10, 0, 50, 170, 180]:
+            hcos = horizon(azimuth, self.dem, 30)
+            np.testing.assert_array_equal(self.lut.horizon(azimuth), hcos)
+
+            cosz = np.cos(60 * np.pi / 180)
+            np.testing.assert_array_equal(
+                self.lut.sunlit(azimuth, zenith=60), cosz > hcos)
+
+    def test_lut_interpolate(self):
+
+        h0 = horizon(10, self.dem, 30)
+        h1 = horizon(20, self.dem, 30)
+
+        np.testing.assert_allclose(
+            self.lut.horizon(12.5), 0.75 * h0 + 0.25 * h1,
+            rtol=0, atol=1e-15)
+
+        # wraps around north
+        h0 = horizon(170, self.dem, 30)
+        h1 = horizon(-180, self.dem, 30)
+        np.testing.assert_allclose(
+            self.lut.horizon(175), 0.5 * h0 + 0.5 * h1, rtol=0, atol=1e-15)
+
+    def test_lut_sunlit_series(self):
+
+        azimuth = np.array([-120, -33, 12.5, 95])
+        zenith = np.array([80, 45, 30, 95])
+
+        mask = self.lut.sunlit_series(azimuth, zenith=zenith)
+        self.assertEqual(mask.shape, (4, 30, 40))
+
+        for k in range(4):
+            np.testing.assert_array_equal(
+                mask[k], self.lut.sunlit(azimuth[k], zenith=zenith[k]))
+
+        # sun below the horizontal
+        self.assertFalse(np.any(mask[3]))
+
+    def test_lut_errors(self):
+
+        self.assertRaises(ValueError, HorizonLUT, self.dem, 30, nangles=2)
+        self.assertRaises(ValueError, self.lut.horizon, 200)
+        self.assertRaises(ValueError, self.lut.sunlit, 10)
+        self.assertRaises(ValueError, self.lut.sunlit_series, [10, 20],
+                          zenith=[10, 20], out=np.zeros((3, 30, 40)))
+
+
+class TestIllumination(unittest.TestCase):
+
+    rng = np.random.RandomState(42)
+    dem = 10 * np.cumsum(np.cumsum(rng.randn(30, 40), axis=0), axis=1)
+
+    def test_illumination(self):
+        """Same as shade with the horizon shadow mask"""
+
+        _, sin_slope, _, aspect = gradient_c(self.dem, 30, 30)
+
+        for azimuth in [-180, -150, -90, -20, 0, 33, 45, 90, 135]:
+            for zenith in [20, 60, 85]:
+                mask = np.cos(zenith * np.pi / 180) > \
+                    horizon(azimuth, self.dem, 30)
+                mu = shade(sin_slope, aspect, azimuth, zenith=zenith)
+
+                np.testing.assert_array_equal(
+                    illumination(self.dem, 30, azimuth, zenith=zenith),
+                    mu * mask)
+
+    def test_illumination_float32(self):
+
+        mu = illumination(self.dem, 30, 60, cosz=0.4)
+        mu32 = illumination(self.dem, 30, 60, cosz=0.4, dtype=np.float32)
+
+        self.assertEqual(mu32.dtype, np.float32)
+        np.testing.assert_allclose(mu32, mu, rtol=0, atol=1e-5)
+
+    def test_illumination_overhead(self):
+        """No shadows with the sun overhead"""
+
+        _, sin_slope, _, aspect = gradient_c(self.dem, 30, 30)
+
+        np.testing.assert_array_equal(
+            illumination(self.dem, 30, 0, zenith=0),
+            shade(sin_slope, aspect, 0, zenith=0))
+
+    def test_illumination_one_row(self):
+
+        dem = self.dem[:1]
+        slope, aspect = gradient_d8(dem, 30, 30, aspect_rad=True)
+        mask = np.cos(np.pi / 3) > horizon(45, dem, 30)
+        mu = shade(np.sin(slope), aspect, 45, zenith=60)
+
+        np.testing.assert_allclose(
+            illumination(dem, 30, 45, zenith=60), mu * mask,
+            rtol=0, atol=1e-14)
+
+    def test_illumination_errors(self):
+
+        self.assertRaises(ValueError, illumination, np.ones(10), 30, 0,
+                          zenith=10)
+        self.assertRaises(Exception, illumination, self.dem, 30, 0,
+                          zenith=95)
+
+        # sin_slope and aspect are given together
+        ones = np.ones(self.dem.shape)
+        self.assertRaises(ValueError, illumination, self.dem, 30, 0,
+                          zenith=10, sin_slope=ones)
+        self.assertRaises(ValueError, illumination, self.dem, 30, 0,
+                          zenith=10, aspect=ones)
@@ -4,7 +4,8 @@ import unittest
 import numpy as np
 from spatialnc import ipw
 
-from topocalc.skew import adjust_spacing, skew
+from topocalc.core_c import topo_core
+from topocalc.skew import adjust_spacing, skew, skew_offsets
 
 
 class TestSkew(unittest.TestCase):
@@ -42,6 +43,86 @@ class TestSkew(unittest.TestCase):
             sbarr = skew(sarr, angle=angle, fwd=False)
             self.assertTrue(np.array_equal(sbarr, gold_dem))
 
+    def test_skew_out(self):
+        """ Test the skew into a preallocated array """
+
+        arr = np.arange(60, dtype=np.float64).reshape(6, 10)
+
+        for angle in [-30, 20]:
+            _, max_skew = skew_offsets(6, angle)
+
+            out = np.zeros((6, 10 + max_skew))
+            sarr = skew(arr, angle, fill_value=-1, out=out)
+            self.assertTrue(sarr is out)
+            self.assertEqual(np.sum(out == -1), 6 * max_skew)
+
+            # skew back into a strided array
+            out_t = np.zeros((10, 6)).transpose()
+            skew(sarr, angle, fwd=False, out=out_t)
+            np.testing.assert_array_equal(out_t, arr)
+
+    def test_skew_float32(self):
+        """ Test the skew of a float32 array """
+
+        arr = np.arange(60, dtype=np.float64).reshape(6, 10)
+
+        for angle in [-30, 0, 20]:
+            sarr = skew(arr, angle, dtype=np.float32)
+            self.assertEqual(sarr.dtype, np.float32)
+            np.testing.assert_array_equal(sarr, skew(arr, angle))
+
+            sbarr = skew(sarr, angle, fwd=False, dtype=np.float32)
+            np.testing.assert_array_equal(sbarr, arr)
+
+        self.assertRaises(ValueError, skew, arr, 20, dtype=np.int32)
+        self.assertRaises(ValueError, skew, arr, 20,
+                          out=np.zeros((6, 10 + skew_offsets(6, 20)[1])),
+                          dtype=np.float32)
+
+    def test_skew_zero_angle(self):
+        """ An angle of 0 returns the input unless a dtype is given """
+
+        arr = np.arange(60, dtype=np.int16).reshape(6, 10)
+
+        self.assertIs(skew(arr, 0), arr)
+        self.assertIs(skew(arr, 0, fwd=False), arr)
+
+        sarr = skew(arr, 0, dtype=np.float32)
+        self.assertEqual(sarr.dtype, np.float32)
+        np.testing.assert_array_equal(sarr, arr)
+
+        self.assertEqual(skew(arr, 30).dtype, np.float64)
+
+    def test_c_skew_errors(self):
+        """ The native skew checks the sizes before copying the lines """
+
+        arr = np.arange(60, dtype=np.float64).reshape(6, 10)
+        offsets, max_skew = skew_offsets(6, 30)
+        out = np.zeros((6, 10 + max_skew))
+
+        for args in [(arr, offsets[:3], True, 0, out),
+                     (arr, offsets, True, 0, out[:3]),
+                     (arr, offsets, True, 0, out[:, :-1]),
+                     (arr, -offsets, True, 0, out),
+                     (out, offsets, False, 0, np.zeros((6, 11)))]:
+            self.assertRaises(ValueError, topo_core.c_skew, *args)
+
+        topo_core.c_skew(arr, offsets, True, 0, out)
+        np.testing.assert_array_equal(out, skew(arr, 30, fill_min=False))
+
+    def test_skew_offsets(self):
+        """ Test the offsets match the IPW rounding """
+
+        for angle in [-45, -17, 0, 3, 30, 45]:
+            slope = np.tan(abs(angle) * np.pi / 180.0)
+            offsets, max_skew = skew_offsets(20, angle)
+
+            for line in range(20):
+                o = line if angle < 0 else 20 - line - 1
+                self.assertEqual(offsets[line], int(o * slope + 0.5))
+
+            self.assertEqual(max_skew, int(19 * slope + 0.5))
+
     def test_skew_error(self):
         """Test error with angle"""
         self.assertRaises(ValueError, skew, np.ones(10), -100)
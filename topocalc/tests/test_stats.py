@@ -0,0 +1,112 @@
+import tracemalloc
+import unittest
+
+import numpy as np
+
+from topocalc.horizon import horizon, horizons
+from topocalc.progress import Cancelled
+from topocalc.stats import Stats
+from topocalc.viewf import viewf
+
+
+class TestStats(unittest.TestCase):
+
+    rng = np.random.RandomState(42)
+    dem = 10 * np.cumsum(np.cumsum(rng.randn(45, 50), axis=0), axis=1)
+
+    def test_viewf_stats(self):
+
+        records = []
+        stats = Stats(callback=records.append)
+        svf, tcf = viewf(self.dem, 30, nangles=16, stats=stats)
+
+        # the result doesn't change
+        svf_ref, tcf_ref = viewf(self.dem, 30, nangles=16)
+        np.testing.assert_array_equal(svf, svf_ref)
+        np.testing.assert_array_equal(tcf, tcf_ref)
+
+        summary = stats.summary()
+        self.assertEqual(
+            list(summary),
+            ['gradient', 'convert', 'hor2d', 'integral', 'sum', 'sweep'])
+        self.assertEqual(summary['gradient']['calls'], 1)
+        self.assertEqual(summary['hor2d']['calls'], 16)
+        self.assertEqual(summary['hor2d']['cells'], 16 * self.dem.size)
+        self.assertGreater(summary['hor2d']['cells_per_second'], 0)
+
+        # 4 of the azimuths are along the grid without a sweep
+        self.assertEqual(summary['sweep']['calls'], 12)
+
+        azimuths = stats.by_azimuth()
+        self.assertEqual(len(azimuths), 16)
+        self.assertEqual(
+            set(azimuths[-180]), {'convert', 'hor2d', 'integral', 'sum'})
+
+        self.assertEqual(records, stats.records)
+
+    def test_viewf_stats_workers(self):
+
+        stats = Stats()
+        viewf(self.dem, 30, nangles=16, workers=4, stats=stats)
+        self.assertEqual(stats.summary()['integral']['calls'], 16)
+
+        self.assertRaises(ValueError, viewf, self.dem, 30, nangles=16,
+                          workers=2, pool='process', stats=stats)
+
+    def test_horizons_stats(self):
+
+        stats = Stats()
+        horizons(self.dem, 30, [-45, 0, 45], stats=stats)
+
+        summary = stats.summary()
+        self.assertEqual(summary['hor2d']['calls'], 1)
+        self.assertEqual(summary['hor2d']['cells'], 3 * self.dem.size)
+
+    def test_stage_cancelled(self):
+        """A stage stopped by an error is still recorded"""
+
+        stats = Stats()
+        with self.assertRaises(Cancelled):
+            with stats.stage('hor2d', cells=10, azimuth=45):
+                raise Cancelled()
+
+        self.assertEqual(len(stats.records), 1)
+        self.assertEqual(stats.records[0]['stage'], 'hor2d')
+        self.assertEqual(stats.records[0]['azimuth'], 45)
+        self.assertGreaterEqual(stats.records[0]['seconds'], 0)
+
+    @unittest.skipUnless(hasattr(tracemalloc, 'reset_peak'),
+                         'requires Python 3.9')
+    def test_trace_memory(self):
+
+        tracing = tracemalloc.is_tracing()
+        try:
+            stats = Stats(trace_memory=True)
+            horizon(45, self.dem, 30, stats=stats)
+
+            # tracing started by the stages is stopped after them
+            self.assertEqual(tracemalloc.is_tracing(), tracing)
+        finally:
+            if not tracing:
+                tracemalloc.stop()
+
+        # the horizons are a new array the size of the dem
+        summary = stats.summary()
+        self.assertGreaterEqual(summary['hor2d']['bytes'], self.dem.nbytes)
+        self.assertEqual(
+            summary['hor2d']['max_bytes'], summary['hor2d']['bytes'])
+
+    @unittest.skipUnless(hasattr(tracemalloc, 'reset_peak'),
+                         'requires Python 3.9')
+    def test_trace_memory_already_tracing(self):
+        """Tracing started by the caller is left running"""
+
+        tracing = tracemalloc.is_tracing()
+        tracemalloc.start()
+        try:
+            stats = Stats(trace_memory=True)
+            horizon(45, self.dem, 30, stats=stats)
+            self.assertTrue(tracemalloc.is_tracing())
+        finally:
+            if not tracing:
+                tracemalloc.stop()
@@ -0,0 +1,104 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from topocalc.gradient import gradient_d4
+from topocalc.horizon import horizon
+from topocalc.tiles import (halo_size, horizon_tiled, tile_windows,
+                            viewf_tiled)
+from topocalc.viewf import viewf
+
+
+class TestTiles(unittest.TestCase):
+
+    rng = np.random.RandomState(42)
+    dem = 10 * np.cumsum(np.cumsum(rng.randn(45, 50), axis=0), axis=1)
+
+    # larger than the dem so the halo covers every horizon
+    max_distance = 30 * 100
+
+    def test_halo_size(self):
+
+        self.assertEqual(halo_size(100, 30), 4)
+        self.assertEqual(halo_size(0, 30), 1)
+        self.assertRaises(ValueError, halo_size, -1, 30)
+
+    def test_tile_windows(self):
+
+        count = np.zeros((45, 50))
+        for tile, window, inner in tile_windows((45, 50), (20, 15), 3):
+            count[tile] += 1
+
+            # the tile is in the same place in the window
+            np.testing.assert_array_equal(
+                self.dem[tile], self.dem[window][inner])
+
+        np.testing.assert_array_equal(count, np.ones((45, 50)))
+
+    def test_horizon_tiled(self):
+
+        for azimuth in [-180, -120, -45, 0, 30, 90, 150]:
+            np.testing.assert_array_equal(
+                horizon_tiled(azimuth, self.dem, 30, self.max_distance,
+                              tile_size=16),
+                horizon(azimuth, self.dem, 30)
+            )
+
+    def test_viewf_tiled(self):
+
+        svf, tcf = viewf(self.dem, 30, nangles=16)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            svf_out = np.memmap(os.path.join(tmp, 'svf.dat'), mode='w+',
+                                dtype=np.float64, shape=self.dem.shape)
+            tcf_out = np.memmap(os.path.join(tmp, 'tcf.dat'), mode='w+',
+                                dtype=np.float64, shape=self.dem.shape)
+
+            svf_t, tcf_t = viewf_tiled(
+                self.dem, 30, self.max_distance, tile_size=(20, 30),
+                svf=svf_out, tcf=tcf_out, nangles=16)
+
+            self.assertTrue(svf_t is svf_out)
+            np.testing.assert_array_equal(svf, svf_t)
+            np.testing.assert_array_equal(tcf, tcf_t)
+
+            del svf_out, tcf_out, svf_t, tcf_t
+
+    def test_viewf_tiled_gradient(self):
+        """The sin_slope and aspect of the grid are sliced for each
+        tile"""
+
+        slope, aspect = gradient_d4(self.dem, 30, 30, aspect_rad=True)
+        sin_slope = np.sin(slope)
+
+        svf, tcf = viewf(self.dem, 30, nangles=16, sin_slope=sin_slope,
+                         aspect=aspect)
+        svf_t, tcf_t = viewf_tiled(
+            self.dem, 30, self.max_distance, tile_size=(20, 30), nangles=16,
+            sin_slope=sin_slope, aspect=aspect)
+
+        np.testing.assert_array_equal(svf, svf_t)
+        np.testing.assert_array_equal(tcf, tcf_t)
+
+        self.assertRaises(ValueError, viewf_tiled, self.dem, 30, 100,
+                          sin_slope=sin_slope)
+        self.assertRaises(ValueError, viewf_tiled, self.dem, 30, 100,
+                          sin_slope=sin_slope[:10], aspect=aspect[:10])
+
+    def test_tiled_max_distance(self):
+
+        # the horizon search stays inside the halo, so the tiles are the
+        # same as the whole grid with the same max_distance
+        for azimuth in [-180, -120, -45, 0, 30, 90, 150]:
+            np.testing.assert_array_equal(
+                horizon_tiled(azimuth, self.dem, 30, 100, tile_size=8),
+                horizon(azimuth, self.dem, 30, max_distance=100)
+            )
+
+        svf, tcf = viewf(self.dem, 30, nangles=16, max_distance=100)
+        svf_t, tcf_t = viewf_tiled(self.dem, 30, 100, tile_size=(8, 12),
+                                   nangles=16)
+        np.testing.assert_array_equal(svf, svf_t)
+        np.testing.assert_array_equal(tcf, tcf_t)
@@ -1,11 +1,17 @@
 #!/usr/bin/env python
 
+import sys
 import unittest
 from sys import platform
 
 import numpy as np
 
-from topocalc.viewf import viewf
+from topocalc.gradient import gradient_d8
+from topocalc.horizon import horizon
+from topocalc.progress import CancelToken, Cancelled
+from topocalc.stats import Stats
+from topocalc.viewf import (ViewfAccumulator, interleaved_azimuths, viewf,
+                            viewf_adaptive)
 
 
 class TestViewf(unittest.TestCase):
@@ -49,6 +55,20 @@ class TestViewf(unittest.TestCase):
                 atol=1e-3
             )
 
+    def test_viewf_one_row(self):
+        """A one row or column dem with the gradient of gradient_d8"""
+
+        rng = np.random.RandomState(42)
+        for dem in (100 * rng.rand(1, 30), 100 * rng.rand(30, 1)):
+            slope, aspect = gradient_d8(dem, 30, 30, aspect_rad=True)
+
+            svf, tcf = viewf(dem, 30, nangles=16)
+            svf_d8, tcf_d8 = viewf(dem, 30, nangles=16,
+                                   sin_slope=np.sin(slope), aspect=aspect)
+
+            np.testing.assert_allclose(svf, svf_d8, rtol=0, atol=1e-14)
+            np.testing.assert_allclose(tcf, tcf_d8, rtol=0, atol=1e-14)
+
     def test_viewf_errors_dem(self):
         """Test viewf dem errors"""
 
@@ -65,3 +85,215 @@ class TestViewf(unittest.TestCase):
 
         self.assertRaises(ValueError, viewf, np.ones(
             (10, 1)), 10, sin_slope=10*np.ones((10, 1)))
+
+    def test_viewf_errors_pool(self):
+        """Test viewf pool errors"""
+
+        self.assertRaises(ValueError, viewf, np.ones(
+            (10, 1)), 10, pool='cluster')
+
+
+class TestViewfWorkers(unittest.TestCase):
+    """Results must not depend on the number of workers"""
+
+    rng = np.random.RandomState(42)
+    dem = np.cumsum(np.cumsum(rng.randn(40, 50), axis=0), axis=1)
+
+    def assert_workers(self, **kwargs):
+
+        svf, tcf = viewf(self.dem, spacing=30, nangles=32)
+        svf_w, tcf_w = viewf(self.dem, spacing=30, nangles=32, **kwargs)
+
+        np.testing.assert_array_equal(svf, svf_w)
+        np.testing.assert_array_equal(tcf, tcf_w)
+
+    def test_viewf_thread_workers(self):
+        self.assert_workers(workers=3, pool='thread')
+
+    @unittest.skipIf(sys.version_info < (3, 8),
+                     'process workers require Python 3.8')
+    def test_viewf_process_workers(self):
+        self.assert_workers(workers=2, pool='process')
+
+    @unittest.skipIf(sys.version_info < (3, 8),
+                     'process workers require Python 3.8')
+    def test_viewf_process_workers_after_threads(self):
+        """A forked worker deadlocks after OpenMP threads have run"""
+
+        horizon(45, self.dem, 30, nthreads=4)
+        self.assert_workers(workers=2, pool='process', nthreads=2)
+
+    @unittest.skipIf(sys.version_info >= (3, 8),
+                     'process workers require Python 3.8')
+    def test_viewf_process_python37(self):
+        self.assertRaises(ValueError, viewf, self.dem, 30, workers=2,
+                          pool='process')
+
+    def test_viewf_out(self):
+
+        svf, tcf = viewf(self.dem, spacing=30, nangles=32)
+
+        svf_out = np.ones_like(self.dem)
+        tcf_out = np.ones_like(self.dem)
+        svf_o, tcf_o = viewf(self.dem, spacing=30, nangles=32,
+                             svf=svf_out, tcf=tcf_out)
+
+        self.assertTrue(svf_o is svf_out)
+        self.assertTrue(tcf_o is tcf_out)
+        np.testing.assert_array_equal(svf, svf_out)
+        np.testing.assert_array_equal(tcf, tcf_out)
+
+    def test_viewf_float32(self):
+
+        svf, tcf = viewf(self.dem, spacing=30, nangles=32)
+        svf32, tcf32 = viewf(self.dem.astype(np.float32), spacing=30,
+                             nangles=32, dtype=np.float32)
+
+        self.assertEqual(svf32.dtype, np.float32)
+        self.assertEqual(tcf32.dtype, np.float32)
+        np.testing.assert_allclose(svf32, svf, rtol=0, atol=1e-5)
+        np.testing.assert_allclose(tcf32, tcf, rtol=0, atol=1e-5)
+
+
+class TestViewfAccumulator(unittest.TestCase):
+
+    rng = np.random.RandomState(42)
+    dem = np.cumsum(np.cumsum(rng.randn(40, 50), axis=0), axis=1)
+
+    def test_interleaved_azimuths(self):
+
+        azimuths = interleaved_azimuths(72)
+
+        # every azimuth once with the even spacings first
+        np.testing.assert_array_equal(
+            np.sort(azimuths), np.linspace(-180, 180, 72, endpoint=False))
+        np.testing.assert_array_equal(
+            azimuths[:9], np.linspace(-180, 180, 9, endpoint=False))
+        np.testing.assert_array_equal(
+            np.sort(azimuths[:18]),
+            np.linspace(-180, 180, 18, endpoint=False))
+
+    def test_accumulator_viewf(self):
+
+        svf, tcf = viewf(self.dem, spacing=30, nangles=16)
+
+        acc = ViewfAccumulator(self.dem, spacing=30)
+        self.assertEqual(
+            acc.add(np.linspace(-180, 180, 16, endpoint=False)), 16)
+
+        # the same bit for bit in the order of viewf
+        np.testing.assert_array_equal(acc.svf, svf)
+        np.testing.assert_array_equal(acc.tcf, tcf)
+
+        # nothing new
+        self.assertEqual(acc.refine(16), 0)
+
+    def test_accumulator_refine(self):
+
+        acc = ViewfAccumulator(self.dem, spacing=30)
+        acc.refine(16)
+
+        # only the new azimuths are calculated
+        stats = Stats()
+        self.assertEqual(acc.refine(32, stats=stats), 16)
+        self.assertEqual(stats.summary()['hor2d']['calls'], 16)
+        self.assertEqual(acc.nangles, 32)
+
+        svf, tcf = viewf(self.dem, spacing=30, nangles=32)
+        np.testing.assert_allclose(acc.svf, svf, rtol=0, atol=1e-14)
+        np.testing.assert_allclose(acc.tcf, tcf, rtol=0, atol=1e-14)
+
+    def test_accumulator_cancel(self):
+
+        token = CancelToken()
+
+        def progress(done, eta):
+            if done >= 0.5:
+                token.cancel()
+
+        acc = ViewfAccumulator(self.dem, spacing=30)
+        with self.assertRaises(Cancelled):
+            acc.refine(32, progress=progress, cancel=token)
+
+        # the azimuths added before the cancel are kept
+        self.assertEqual(acc.nangles, 16)
+        np.testing.assert_array_equal(
+            np.sort(acc.azimuths), np.linspace(-180, 180, 16, endpoint=False))
+
+        # and the run resumes where it stopped
+        self.assertEqual(acc.refine(32), 16)
+        svf, _ = viewf(self.dem, spacing=30, nangles=32)
+        np.testing.assert_allclose(acc.svf, svf, rtol=0, atol=1e-14)
+
+    def test_accumulator_errors(self):
+
+        acc = ViewfAccumulator(self.dem, spacing=30)
+        with self.assertRaises(ValueError):
+            acc.svf
+
+        self.assertRaises(ValueError, acc.add, 200)
+        self.assertRaises(ValueError, acc.refine, 8)
+
+    def test_accumulator_refine_not_nested(self):
+        """The azimuths of 16 aren't azimuths of 24, the mean of both
+        wouldn't be evenly spaced
+        """
+
+        acc = ViewfAccumulator(self.dem, spacing=30)
+        acc.refine(16)
+
+        self.assertRaises(ValueError, acc.refine, 24)
+        self.assertEqual(acc.nangles, 16)
+
+        # a multiple of 16 is fine
+        self.assertEqual(acc.refine(48), 32)
+        svf, _ = viewf(self.dem, spacing=30, nangles=48)
+        np.testing.assert_allclose(acc.svf, svf, rtol=0, atol=1e-14)
+
+
+class TestViewfAdaptive(unittest.TestCase):
+
+    rng = np.random.RandomState(42)
+    dem = np.cumsum(np.cumsum(rng.randn(40, 50), axis=0), axis=1)
+
+    def test_viewf_adaptive_all(self):
+
+        # no cell converges with tol=0
+        svf, tcf, error, nangles = viewf_adaptive(
+            self.dem, spacing=30, tol=0, max_angles=64)
+
+        svf_ref, tcf_ref = viewf(self.dem, spacing=30, nangles=64)
+        np.testing.assert_allclose(svf, svf_ref, rtol=0, atol=1e-14)
+        np.testing.assert_allclose(tcf, tcf_ref, rtol=0, atol=1e-14)
+        np.testing.assert_array_equal(nangles, 64)
+
+    def test_viewf_adaptive_tol(self):
+
+        stats = Stats()
+        svf, tcf, error, nangles = viewf_adaptive(
+            self.dem, spacing=30, tol=1e-3, max_angles=128, workers=2,
+            stats=stats)
+
+        # the converged cells are within tol of the last doubling
+        converged = nangles < 128
+        self.assertTrue(np.all(error[converged] <= 1e-3))
+        self.assertTrue(np.any(converged))
+        self.assertTrue(np.all(nangles >= 32))
+
+        # only the integrands of the cells that weren't converged
+        self.assertEqual(
+            stats.summary()['integral']['cells'], np.sum(nangles))
+
+        svf_ref, _ = viewf(self.dem, spacing=30, nangles=128)
+        self.assertLess(np.max(np.abs(svf - svf_ref)), 0.02)
+
+    def test_viewf_adaptive_errors(self):
+
+        self.assertRaises(ValueError, viewf_adaptive, self.dem, 30,
+                          min_angles=8)
+        self.assertRaises(ValueError, viewf_adaptive, self.dem, 30,
+                          max_angles=48)
+        self.assertRaises(ValueError, viewf_adaptive, self.dem, 30,
+                          max_angles=16)
+        self.assertRaises(ValueError, viewf_adaptive, self.dem, 30,
+                          tol=-1)
@@ -0,0 +1,127 @@
+import unittest
+
+import numpy as np
+
+from topocalc.gradient import gradient_c, gradient_d8
+from topocalc.horizon import horizon
+from topocalc.shade import shade
+from topocalc.viewf import viewf
+
+try:
+    import xarray as xr
+except ImportError:
+    xr = None
+
+try:
+    import dask.array as dsa
+except ImportError:
+    dsa = None
+
+if xr is not None:
+    from topocalc import xr as txr
+
+
+@unittest.skipIf(xr is None, 'requires xarray')
+class TestXarray(unittest.TestCase):
+
+    rng = np.random.RandomState(42)
+    z = 10 * np.cumsum(np.cumsum(rng.randn(45, 50), axis=0), axis=1)
+
+    def setUp(self):
+
+        self.dem = xr.DataArray(
+            self.z, dims=('y', 'x'),
+            coords={'y': -30.0 * np.arange(45), 'x': 30.0 * np.arange(50)},
+            attrs={'units': 'm', 'grid_mapping': 'crs'}, name='dem')
+
+    def like(self, data):
+        return self.dem.copy(data=data)
+
+    def check_like(self, da, ref):
+
+        np.testing.assert_array_equal(da.values, ref)
+        self.assertEqual(da.dims, ('y', 'x'))
+        np.testing.assert_array_equal(da['x'], self.dem['x'])
+        self.assertEqual(da.attrs['grid_mapping'], 'crs')
+
+    def test_gradient(self):
+
+        slope, aspect = gradient_d8(self.z, 30, 30)
+        ds = txr.gradient_d8(self.dem)
+
+        self.check_like(ds['slope'], slope)
+        self.check_like(ds['aspect'], aspect)
+        self.assertEqual(ds['slope'].attrs['units'], 'radians')
+
+    def test_shade(self):
+
+        _, sin_slope, _, aspect = gradient_c(self.z, 30, 30)
+        mu = txr.shade(self.like(sin_slope), self.like(aspect), 30,
+                       zenith=40)
+
+        self.check_like(mu, shade(sin_slope, aspect, 30, zenith=40))
+        self.assertEqual(mu.name, 'illumination')
+        self.assertRaises(ValueError, txr.shade, mu, mu, [0, 10], zenith=40)
+
+    def test_horizon(self):
+
+        self.check_like(txr.horizon(45, self.dem),
+                        horizon(45, self.z, 30))
+        self.check_like(txr.horizon(45, self.dem, max_distance=300),
+                        horizon(45, self.z, 30, max_distance=300))
+
+    def test_viewf(self):
+
+        svf, tcf = viewf(self.z, 30, nangles=16)
+        ds = txr.viewf(self.dem, nangles=16)
+
+        self.check_like(ds['sky_view_factor'], svf)
+        self.check_like(ds['terrain_configuration_factor'], tcf)
+
+    def test_errors(self):
+
+        self.assertRaises(ValueError, txr.gradient_d8, self.z)
+        self.assertRaises(ValueError, txr.horizon, 0, self.dem[0])
+
+        # the horizons need square cells
+        dem = self.dem.assign_coords(x=10.0 * np.arange(50))
+        self.assertRaises(ValueError, txr.horizon, 0, dem)
+
+
+@unittest.skipIf(xr is None or dsa is None, 'requires xarray and dask')
+class TestDask(TestXarray):
+
+    def setUp(self):
+
+        super().setUp()
+        self.dem = self.dem.chunk({'y': 20, 'x': 15})
+
+    def like(self, data):
+        return super().like(data).chunk({'y': 20, 'x': 15})
+
+    def check_like(self, da, ref):
+
+        self.assertTrue(isinstance(da.data, dsa.Array))
+        super().check_like(da.compute(), ref)
+
+    def test_horizon(self):
+
+        # the chunks are the same as the whole dem with max_distance
+        for azimuth in [-180, -120, -45, 0, 30, 90, 150]:
+            self.check_like(
+                txr.horizon(azimuth, self.dem, max_distance=300),
+                horizon(azimuth, self.z, 30, max_distance=300))
+
+        # an overlap larger than the chunks
+        self.check_like(txr.horizon(45, self.dem, max_distance=900),
+                        horizon(45, self.z, 30, max_distance=900))
+
+        self.assertRaises(ValueError, txr.horizon, 45, self.dem)
+
+    def test_viewf(self):
+
+        svf, tcf = viewf(self.z, 30, nangles=16, max_distance=300)
+        ds = txr.viewf(self.dem, max_distance=300, nangles=16)
+
+        self.check_like(ds['sky_view_factor'], svf)
+        self.check_like(ds['terrain_configuration_factor'], tcf)
@@ -0,0 +1,193 @@
+import numpy as np
+
+from topocalc.horizon import horizon
+from topocalc.viewf import viewf
+
+
+def halo_size(max_distance, spacing):
+    """Number of cells needed around a tile to cover a horizon
+    search distance
+
+    Arguments:
+        max_distance {float} -- maximum horizon search distance in the
+            units of spacing
+        spacing {float} -- grid spacing
+
+    Returns:
+        halo {int} -- cells around each tile
+    """
+
+    if max_distance < 0:
+        raise ValueError('max_distance must be positive')
+
+    # the gradient needs at least the neighboring cells
+    return max(int(np.ceil(max_distance / spacing)), 1)
+
+
+def tile_windows(shape, tile_size, halo):
+    """Split a grid into tiles with a halo around each tile. The halo
+    is clipped at the edges of the grid.
+
+    Arguments:
+        shape {tuple} -- shape of the grid
+        tile_size {int or tuple} -- rows and columns of each tile
+        halo {int} -- cells around each tile
+
+    Yields:
+        tile {tuple} -- slices of the tile in the grid
+        window {tuple} -- slices of the tile and the halo in the grid
+        inner {tuple} -- slices of the tile in the window
+    """
+
+    if np.isscalar(tile_size):
+        tile_size = (tile_size, tile_size)
+
+    if tile_size[0] < 1 or tile_size[1] < 1:
+        raise ValueError('tile_size must be 1 or greater')
+
+    nrows, ncols = shape
+
+    for r0 in range(0, nrows, tile_size[0]):
+        r1 = min(r0 + tile_size[0], nrows)
+        wr0 = max(r0 - halo, 0)
+        wr1 = min(r1 + halo, nrows)
+
+        for c0 in range(0, ncols, tile_size[1]):
+            c1 = min(c0 + tile_size[1], ncols)
+            wc0 = max(c0 - halo, 0)
+            wc1 = min(c1 + halo, ncols)
+
+            yield (
+                (slice(r0, r1), slice(c0, c1)),
+                (slice(wr0, wr1), slice(wc0, wc1)),
+                (slice(r0 - wr0, r1 - wr0), slice(c0 - wc0, c1 - wc0))
+            )
+
+
+def horizon_tiled(azimuth, dem, spacing, max_distance, tile_size=1024,
+                  out=None, **kwargs):
+    """Calculate the horizon for one direction a tile at a time so
+    only a tile and its halo is in memory.
+
+    The horizon lines through each tile are the lines through the whole
+    grid and the horizon search is limited to max_distance, which the
+    halo covers, so the horizons are the same as horizon on the whole
+    grid with max_distance.
+
+    Arguments:
+        azimuth {float} -- find horizon's along this direction
+        dem {array} -- dem elevations, any 2D array that can be sliced
+            like a np.memmap or netCDF4 variable
+        spacing {float} -- grid spacing
+        max_distance {float} -- maximum horizon search distance in the
+            units of spacing, sets the halo around each tile and is
+            passed to horizon
+        tile_size {int or tuple} -- rows and columns of each tile
+            (default: {1024})
+        out {array} -- output store that tiles are written to with slice
+            assignment, like a np.memmap or netCDF4 variable. A new
+            array is made if not given (default: {None})
+        **kwargs -- passed to horizon, dtype also sets the type the
+            tiles are read as
+
+    Returns:
+        out {array} -- cosines of angles to the horizon
+    """
+
+    if len(dem.shape) != 2:
+        raise ValueError('horizon_tiled input of dem is not a 2D array')
+
+    dtype = kwargs.get('dtype', np.float64)
+    if out is None:
+        out = np.empty(dem.shape, dtype=dtype)
+
+    halo = halo_size(max_distance, spacing)
+
+    for tile, window, inner in tile_windows(dem.shape, tile_size, halo):
+        block = np.asarray(dem[window], dtype=dtype)
+
+        hcos = horizon(
+            azimuth, block, spacing,
+            origin=(window[0].start, window[1].start),
+            grid_shape=dem.shape, max_distance=max_distance, **kwargs)
+
+        out[tile] = hcos[inner]
+
+    return out
+
+
+def viewf_tiled(dem, spacing, max_distance, tile_size=1024, svf=None,
+                tcf=None, sin_slope=None, aspect=None, **kwargs):
+    """Calculate the sky view factor a tile at a time so only a tile and
+    its halo is in memory. Peak memory depends on the tile size and
+    max_distance instead of the size of the dem.
+
+    The slope and aspect for each tile are calculated from the tile and
+    its halo, which is the same as for the whole grid, or sliced from
+    sin_slope and aspect of the whole grid if they are given. The horizon
+    search is limited to max_distance, so the sky view factor is the
+    same as viewf on the whole grid with max_distance.
+
+    Arguments:
+        dem {array} -- dem elevations, any 2D array that can be sliced
+            like a np.memmap or netCDF4 variable
+        spacing {float} -- grid spacing
+        max_distance {float} -- maximum horizon search distance in the
+            units of spacing, sets the halo around each tile and is
+            passed to viewf
+        tile_size {int or tuple} -- rows and columns of each tile
+            (default: {1024})
+        svf {array} -- output store for the sky view factor that tiles
+            are written to with slice assignment. A new array is made
+            if not given (default: {None})
+        tcf {array} -- output store for the terrain configuration factor
+            (default: {None})
+        sin_slope {array} -- optional sin(slope) of the whole grid, see
+            viewf (default: {None})
+        aspect {array} -- optional aspect of the whole grid, given with
+            sin_slope (default: {None})
+        **kwargs -- passed to viewf, like nangles, workers or dtype
+
+    Returns:
+        svf {array} -- sky view factor
+        tcf {array} -- terrain configuration factor
+    """
+
+    if len(dem.shape) != 2:
+        raise ValueError('viewf_tiled input of dem is not a 2D array')
+
+    if (sin_slope is None) != (aspect is None):
+        raise ValueError('viewf_tiled needs both sin_slope and aspect')
+
+    if sin_slope is not None and \
+            (sin_slope.shape != dem.shape or aspect.shape != dem.shape):
+        raise ValueError(
+            'viewf_tiled sin_slope and aspect must be the same shape as '
+            'the dem')
+
+    dtype = kwargs.get('dtype', np.float64)
+    if svf is None:
+        svf = np.empty(dem.shape, dtype=dtype)
+
+    if tcf is None:
+        tcf = np.empty(dem.shape, dtype=dtype)
+
+    halo = halo_size(max_distance, spacing)
+
+    for tile, window, inner in tile_windows(dem.shape, tile_size, halo):
+        block = np.asarray(dem[window], dtype=dtype)
+
+        # the gradient of the cells of the tile and its halo
+        if sin_slope is not None:
+            kwargs['sin_slope'] = np.asarray(sin_slope[window], dtype=dtype)
+            kwargs['aspect'] = np.asarray(aspect[window], dtype=dtype)
+
+        svf_block, tcf_block = viewf(
+            block, spacing,
+            origin=(window[0].start, window[1].start),
+            grid_shape=dem.shape, max_distance=max_distance, **kwargs)
+
+        svf[tile] = svf_block[inner]
+        tcf[tile] = tcf_block[inner]
+
+    return svf, tcf
@@ -1,7 +1,15 @@
+import multiprocessing
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 import numpy as np
 
-from topocalc.gradient import gradient_d8
+from topocalc.gradient import gradient_c
 from topocalc.horizon import horizon
+from topocalc.progress import check
+from topocalc.stats import stage
 
 
 def d2r(a):
@@ -18,7 +26,14 @@ def d2r(a):
     return v
 
 
-def viewf(dem, spacing, nangles=72, sin_slope=None, aspect=None):
+# arrays shared with the process pool workers, set by _attach_shared
+_SHARED = {}
+
+
+def viewf(dem, spacing, nangles=72, sin_slope=None, aspect=None, nthreads=1,
+          workers=1, pool='thread', origin=None, grid_shape=None, svf=None,
+          tcf=None, dtype=np.float64, stats=None, progress=None,
+          cancel=None, max_distance=None):
     """
     Calculate the sky view factor of a dem.
 
@@ -49,6 +64,43 @@ def viewf(dem, spacing, nangles=72, sin_slope=None, aspect=None):
                 Aspect as radians from south (aspect 0 is toward
                 the south) with range from -pi to pi, with negative
                 values to the west and positive values to the east.
+        nthreads: number of threads for each horizon calculation, less
+                than 1 uses all available cores
+        workers: number of azimuths to calculate at the same time,
+                defaults to 1 which runs the azimuths serially. The
+                result is the same for any number of workers.
+        pool: 'thread' or 'process' pool for the workers. Process
+                workers are started with spawn, so they don't inherit
+                the OpenMP threads of the caller, read the DEM,
+                sin_slope and aspect from shared memory and require
+                Python 3.8 or newer.
+        origin: row and column of dem[0, 0] when the dem is a window of a
+                larger grid, see horizon
+        grid_shape: shape of the larger grid
+        svf: optional array to write the sky view factor into, like a
+                np.memmap
+        tcf: optional array to write the terrain configuration factor
+                into
+        dtype: float32 or float64 type for the dem, gradient, horizons
+                and integral. float32 halves the memory, the horizon
+                search is still done in double precision.
+        stats: optional topocalc.stats.Stats to record the time, memory
+                and cells per second of each stage and each azimuth
+                in. Not supported with process workers.
+        progress: optional function called after each azimuth with the
+                fraction of the azimuths done and the estimated seconds
+                left
+        cancel: optional topocalc.progress.CancelToken to stop the
+                calculation, Cancelled is raised. It is checked between
+                azimuths and between the lines of the horizon search,
+                process workers finish the azimuths they have started.
+        max_distance: optional distance in the units of spacing to
+                search for the horizons, see horizon. Terrain further
+                away than max_distance doesn't block the sky, and the
+                horizon search is faster for a short distance.
+
+    The dem can be a np.memmap of dtype, which is read in place by the
+    horizon calculation.
 
     Returns:
         svf: sky view factor
@@ -66,25 +118,453 @@ def viewf(dem, spacing, nangles=72, sin_slope=None, aspect=None):
         if np.max(sin_slope) > 1:
             raise ValueError('slope must be sin(slope) with range from 0 to 1')
 
-    # calculate the gradient if not provided
-    # The slope is returned as radians so convert to sin(S)
-    if sin_slope is None:
-        slope, aspect = gradient_d8(
-            dem, dx=spacing, dy=spacing, aspect_rad=True)
-        sin_slope = np.sin(slope)
+    _check_pool(pool)
+
+    if stats is not None and pool == 'process' and workers > 1:
+        raise ValueError('viewf stats can not be used with process workers')
+
+    dtype = np.dtype(dtype)
+    if dtype not in (np.float32, np.float64):
+        raise ValueError('viewf dtype must be float32 or float64')
+
+    dem = dem.astype(dtype, copy=False)
+    sin_slope, cos_slope, aspect = _gradient(
+        dem, spacing, sin_slope, aspect, dtype, stats)
 
     # -180 is North
     angles = np.linspace(-180, 180, num=nangles, endpoint=False)
 
     # perform the integral
-    cos_slope = np.sqrt((1 - sin_slope) * (1 + sin_slope))
-    svf = np.zeros_like(sin_slope)
-    for angle in angles:
+    if svf is None:
+        svf = np.zeros_like(sin_slope)
+    else:
+        svf[:] = 0
+
+    for _ in _accumulate(svf, angles, dem, spacing, sin_slope, cos_slope,
+                         aspect, nthreads, workers, pool,
+                         (origin, grid_shape), max_distance, stats,
+                         progress, cancel):
+        pass
+
+    svf /= len(angles)
+
+    if tcf is None:
+        tcf = (1 + cos_slope)/2 - svf
+    else:
+        tcf[:] = (1 + cos_slope)/2 - svf
+
+    return svf, tcf
+
+
+class ViewfAccumulator():
+    """Sky view factor that is refined by adding azimuths, keeping the
+    sum of the integrands of the azimuths added so far. The sky view
+    factor can be read at any time, and going from 72 to 144 azimuths
+    only calculates the 72 new horizons.
+
+    The azimuths of interleaved_azimuths add the coarser even spacings
+    first, so a run can be stopped or cancelled part way and still have
+    an estimate. Once every azimuth of viewf for nangles is added the
+    result is the same as viewf to rounding, and the same bit for bit
+    when they were added in the order of viewf. The accumulator can be
+    pickled to resume later.
+
+    Args:
+        dem: numpy array for the DEM
+        spacing: grid spacing of the DEM
+        sin_slope: optional sin(slope), see viewf
+        aspect: optional aspect in radians from south, see viewf
+        nthreads: number of threads for each horizon calculation
+        workers: number of azimuths to calculate at the same time
+        pool: 'thread' or 'process' pool for the workers
+        origin: row and column of dem[0, 0] in a larger grid
+        grid_shape: shape of the larger grid
+        dtype: float32 or float64 type for the dem, gradient, horizons
+            and sum
+        max_distance: optional distance to search for the horizons
+    """
+
+    def __init__(self, dem, spacing, sin_slope=None, aspect=None,
+                 nthreads=1, workers=1, pool='thread', origin=None,
+                 grid_shape=None, dtype=np.float64, max_distance=None):
+
+        if dem.ndim != 2:
+            raise ValueError('viewf input of dem is not a 2D array')
+
+        _check_pool(pool)
+
+        dtype = np.dtype(dtype)
+        if dtype not in (np.float32, np.float64):
+            raise ValueError('viewf dtype must be float32 or float64')
+
+        self.dem = dem.astype(dtype, copy=False)
+        self.spacing = spacing
+        self.nthreads = nthreads
+        self.workers = workers
+        self.pool = pool
+        self.grid = (origin, grid_shape)
+        self.max_distance = max_distance
+
+        self.sin_slope, self.cos_slope, self.aspect = _gradient(
+            self.dem, spacing, sin_slope, aspect, dtype, None)
+
+        self.total = np.zeros_like(self.sin_slope)
+        self.azimuths = []
+
+    @property
+    def nangles(self):
+        """Number of azimuths added"""
+        return len(self.azimuths)
+
+    def add(self, azimuths, stats=None, progress=None, cancel=None):
+        """Add the integrands of the azimuths that haven't been added
+
+        Args:
+            azimuths: azimuths in degrees on the -180 -> 0 -> 180 range
+            stats: optional Stats to record the stages in
+            progress: optional function called after each azimuth with
+                the fraction of the new azimuths done and the estimated
+                seconds left
+            cancel: optional CancelToken, the azimuths added before it
+                was cancelled are kept
+
+        Returns:
+            the number of azimuths added
+        """
+
+        azimuths = np.atleast_1d(np.asarray(azimuths, dtype=np.float64))
+        if np.any(azimuths > 180) or np.any(azimuths < -180):
+            raise ValueError('azimuth must be between -180 and 180 degrees')
+
+        # azimuths from different spacings can differ by rounding
+        done = {round(a, 9) for a in self.azimuths}
+        angles = []
+        for a in azimuths:
+            if round(a, 9) not in done:
+                done.add(round(a, 9))
+                angles.append(float(a))
+
+        if self.pool == 'process' and self.workers > 1 and \
+                stats is not None:
+            raise ValueError(
+                'viewf stats can not be used with process workers')
+
+        for angle in _accumulate(
+                self.total, angles, self.dem, self.spacing, self.sin_slope,
+                self.cos_slope, self.aspect, self.nthreads, self.workers,
+                self.pool, self.grid, self.max_distance, stats, progress,
+                cancel):
+            self.azimuths.append(angle)
+
+        return len(angles)
 
-        # horizon angles
-        hcos = horizon(angle, dem, spacing)
-        azimuth = d2r(angle)
+    def refine(self, nangles, **kwargs):
+        """Add the azimuths of viewf for nangles that are missing, in
+        the order of interleaved_azimuths. The sky view factor is the
+        mean of the integrands, so the azimuths already added must be
+        azimuths of nangles, like refining 24 to 48 or 72 but not 32,
+        or they wouldn't be evenly spaced.
 
+        Args:
+            nangles: number of azimuths
+            **kwargs: passed to add
+
+        Returns:
+            the number of azimuths added
+        """
+
+        if nangles < 16:
+            raise ValueError('viewf number of angles should be 16 or greater')
+
+        azimuths = interleaved_azimuths(nangles)
+        if not {round(a, 9) for a in self.azimuths} <= \
+                {round(a, 9) for a in azimuths}:
+            raise ValueError(
+                'refine nangles must be a multiple of the azimuths '
+                'already added')
+
+        return self.add(azimuths, **kwargs)
+
+    @property
+    def svf(self):
+        """Sky view factor, the mean of the integrands added"""
+
+        if not self.azimuths:
+            raise ValueError('no azimuths have been added')
+
+        return self.total / len(self.azimuths)
+
+    @property
+    def tcf(self):
+        """Terrain configuration factor"""
+        return (1 + self.cos_slope)/2 - self.svf
+
+
+def interleaved_azimuths(nangles):
+    """The azimuths of viewf for nangles, ordered so the azimuths of
+    every coarser even spacing come first. When nangles is divisible by
+    2**j the first nangles / 2**j azimuths are evenly spaced, each level
+    adds the azimuths halfway between the ones before it.
+
+    Args:
+        nangles: number of azimuths
+
+    Returns:
+        azimuths in degrees
+    """
+
+    angles = np.linspace(-180, 180, num=nangles, endpoint=False)
+
+    # the power of 2 that divides each index, up to the largest power of
+    # 2 that divides nangles
+    k = np.arange(nangles)
+    cap = nangles & -nangles
+    level = np.where(k == 0, cap, np.minimum(k & -k, cap))
+
+    return angles[np.lexsort((k, -level))]
+
+
+def viewf_adaptive(dem, spacing, tol=1e-3, min_angles=16, max_angles=256,
+                   sin_slope=None, aspect=None, nthreads=1, workers=1,
+                   dtype=np.float64, stats=None, cancel=None,
+                   max_distance=None):
+    """Calculate the sky view factor with the number of angles adapted
+    to each cell, see viewf.
+
+    The sky view factor starts with min_angles azimuths for every cell
+    and the number of azimuths is doubled, adding the azimuths halfway
+    between the ones before, until the change from doubling is less than
+    tol. Each doubling only searches the horizon lines through the cells
+    that haven't converged, and only calculates their integrands, so
+    flat cells stop early and steep terrain gets more azimuths.
+
+    The change from the last doubling is reported as the error of each
+    cell. This is an estimate and not a strict bound, the horizons
+    change unevenly with the azimuth. On the Lakes DEM the difference
+    from 512 azimuths is within the error for about 60% of the cells
+    and within 3 times the error for about 85%. With tol=0 every cell
+    gets max_angles azimuths and the result is viewf with max_angles to
+    rounding.
+
+    Args:
+        dem: numpy array for the DEM
+        spacing: grid spacing of the DEM
+        tol: largest change of the sky view factor from doubling the
+            azimuths for a cell to be converged
+        min_angles: number of azimuths for every cell, 16 or greater
+        max_angles: largest number of azimuths, min_angles times a
+            power of 2
+        sin_slope: optional sin(slope), see viewf
+        aspect: optional aspect in radians from south, see viewf
+        nthreads: number of threads for each horizon calculation
+        workers: number of azimuths to calculate at the same time with a
+            thread pool
+        dtype: float32 or float64 type for the dem, gradient, horizons
+            and integral
+        stats: optional topocalc.stats.Stats to record the stages in
+        cancel: optional topocalc.progress.CancelToken to stop the
+            calculation
+        max_distance: optional distance to search for the horizons
+
+    Returns:
+        svf: sky view factor
+        tcf: terrain configuration factor
+        error: change of the sky view factor from the last doubling
+        nangles: number of azimuths used for each cell
+    """
+
+    if dem.ndim != 2:
+        raise ValueError('viewf input of dem is not a 2D array')
+
+    if min_angles < 16:
+        raise ValueError('viewf number of angles should be 16 or greater')
+
+    levels = np.log2(max_angles / min_angles)
+    if levels < 1 or levels != int(levels):
+        raise ValueError(
+            'max_angles must be min_angles times a power of 2')
+
+    if tol < 0:
+        raise ValueError('tol must be 0 or greater')
+
+    dtype = np.dtype(dtype)
+    if dtype not in (np.float32, np.float64):
+        raise ValueError('viewf dtype must be float32 or float64')
+
+    dem = dem.astype(dtype, copy=False)
+    sin_slope, cos_slope, aspect = _gradient(
+        dem, spacing, sin_slope, aspect, dtype, stats)
+
+    # every cell gets the coarse azimuths
+    total = np.zeros_like(sin_slope)
+    angles = np.linspace(-180, 180, num=min_angles, endpoint=False)
+    for _ in _accumulate(total, angles, dem, spacing, sin_slope, cos_slope,
+                         aspect, nthreads, workers, 'thread', (None, None),
+                         max_distance, stats, None, cancel):
+        pass
+
+    error = np.zeros(dem.shape, dtype=dtype)
+    nangles = np.full(dem.shape, min_angles, dtype=np.intc)
+    active = np.ones(dem.shape, dtype=bool)
+
+    n = min_angles
+    while n < max_angles and active.any():
+        idx = np.flatnonzero(active)
+        slopes = (sin_slope.flat[idx], cos_slope.flat[idx], aspect.flat[idx])
+
+        # the azimuths halfway between the ones before
+        angles = np.linspace(-180, 180, num=2 * n, endpoint=False)[1::2]
+
+        added = np.zeros(len(idx), dtype=dtype)
+        for angle, intgrnd in zip(angles, _masked_integrands(
+                angles, dem, spacing, active, idx, slopes, nthreads,
+                workers, max_distance, stats, cancel)):
+            with stage(stats, 'sum', len(idx), angle):
+                added += np.maximum(intgrnd, 0)
+
+        before = total.flat[idx] / n
+        total.flat[idx] += added
+        after = total.flat[idx] / (2 * n)
+
+        change = np.abs(after - before)
+        error.flat[idx] = change
+        nangles.flat[idx] = 2 * n
+        active.flat[idx] = change > tol
+
+        n *= 2
+
+    svf = total / nangles.astype(dtype)
+    tcf = (1 + cos_slope)/2 - svf
+
+    return svf, tcf, error, nangles
+
+
+def _masked_integrands(angles, dem, spacing, mask, idx, slopes, nthreads,
+                       workers, max_distance, stats, cancel):
+    """Generate the integrand of the cells idx in mask for each angle in
+    order, see viewf_integrand
+    """
+
+    def integrand(angle):
+
+        hcos = horizon(angle, dem, spacing, nthreads=nthreads,
+                       dtype=dem.dtype, stats=stats, cancel=cancel,
+                       mask=mask, max_distance=max_distance)
+        return _integrand(angle, hcos.flat[idx], *slopes, stats)
+
+    if workers is None or workers <= 1:
+        for angle in angles:
+            yield integrand(angle)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        yield from _ordered(executor, integrand, angles, workers)
+
+
+def _gradient(dem, spacing, sin_slope, aspect, dtype, stats):
+    """sin(S), cos(S) and aspect of the dem, calculated if sin_slope
+    isn't given
+    """
+
+    # the native gradient gives sin(S) and cos(S) without the slope
+    with stage(stats, 'gradient', dem.size):
+        if sin_slope is None:
+            sin_slope, cos_slope, aspect = (
+                np.empty(dem.shape, dtype=dtype) for _ in range(3))
+            gradient_c(dem, spacing, spacing, dtype=dtype,
+                       out=(None, sin_slope, cos_slope, aspect))
+        else:
+            sin_slope = np.asarray(sin_slope, dtype=dtype)
+            aspect = np.asarray(aspect, dtype=dtype)
+            cos_slope = np.sqrt((1 - sin_slope) * (1 + sin_slope))
+
+    return sin_slope, cos_slope, aspect
+
+
+def _check_pool(pool):
+    """Raise a ValueError for an unknown pool, or a process pool without
+    shared memory before Python 3.8
+    """
+
+    if pool not in ('thread', 'process'):
+        raise ValueError("viewf pool must be 'thread' or 'process'")
+
+    if pool == 'process' and sys.version_info < (3, 8):
+        raise ValueError('viewf process pool requires Python 3.8 or newer')
+
+
+def _accumulate(total, angles, dem, spacing, sin_slope, cos_slope, aspect,
+                nthreads, workers, pool, grid, max_distance, stats, progress,
+                cancel):
+    """Add the positive integrand of each angle to total, yielding each
+    angle once its integrand is added
+    """
+
+    # the integrand for each angle is summed in the order of the angles
+    # so the result doesn't depend on the number of workers
+    t0 = time.perf_counter()
+    check(cancel)
+    integrands = _integrands(
+        angles, dem, spacing, sin_slope, cos_slope, aspect, nthreads,
+        workers, pool, grid, max_distance, stats, cancel)
+
+    # close the integrands on an error so the pool and shared memory
+    # are released right away
+    try:
+        for k, (angle, intgrnd) in enumerate(zip(angles, integrands)):
+            with stage(stats, 'sum', intgrnd.size, angle):
+                ind = intgrnd > 0
+                total[ind] = total[ind] + intgrnd[ind]
+
+            yield angle
+
+            check(cancel)
+            if progress is not None:
+                done = (k + 1) / len(angles)
+                elapsed = time.perf_counter() - t0
+                progress(done, elapsed * (1 - done) / done)
+    finally:
+        integrands.close()
+
+
+def viewf_integrand(angle, dem, spacing, sin_slope, cos_slope, aspect,
+                    nthreads=1, grid=(None, None), stats=None, cancel=None,
+                    max_distance=None):
+    """Integrand of equation 7b in Dozier and Frew 1990 for one
+    azimuth
+
+    Args:
+        angle: azimuth in degrees
+        dem: numpy array for the DEM, float32 gives float32 horizons
+        spacing: grid spacing of the DEM
+        sin_slope: sin(slope) with range from 0 to 1
+        cos_slope: cos(slope) with range from 0 to 1
+        aspect: aspect as radians from south
+        nthreads: number of threads for the horizon calculation
+        grid: origin and grid_shape of a larger grid for horizon
+        stats: optional Stats to record the horizon and integral in
+        cancel: optional CancelToken to stop the horizon search
+        max_distance: optional distance to search for the horizon
+
+    Returns:
+        intgrnd: integrand for the azimuth
+    """
+
+    # horizon angles in the type of the dem
+    dtype = np.float32 if dem.dtype == np.float32 else np.float64
+    hcos = horizon(angle, dem, spacing, nthreads=nthreads,
+                   origin=grid[0], grid_shape=grid[1], dtype=dtype,
+                   stats=stats, cancel=cancel, max_distance=max_distance)
+
+    return _integrand(angle, hcos, sin_slope, cos_slope, aspect, stats)
+
+
+def _integrand(angle, hcos, sin_slope, cos_slope, aspect, stats):
+    """Integrand of equation 7b from the horizons for an azimuth"""
+
+    azimuth = float(d2r(angle))
+
+    with stage(stats, 'integral', hcos.size, angle):
         # sin^2(H)
         sin_squared = (1 - hcos) * (1 + hcos)
 
@@ -98,11 +578,100 @@ def viewf(dem, spacing, nangles=72, sin_slope=None, aspect=None):
         intgrnd = cos_slope * sin_squared + \
             sin_slope * cos_aspect * h_mult
 
-        ind = intgrnd > 0
-        svf[ind] = svf[ind] + intgrnd[ind]
+    return intgrnd
 
-    svf = svf / len(angles)
 
-    tcf = (1 + cos_slope)/2 - svf
+def _integrands(angles, dem, spacing, sin_slope, cos_slope, aspect,
+                nthreads, workers, pool, grid, max_distance=None, stats=None,
+                cancel=None):
+    """Generate the integrand for each angle in order, spreading the
+    angles over a pool of workers if requested
+    """
 
-    return svf, tcf
+    if workers is None or workers <= 1:
+        for angle in angles:
+            yield viewf_integrand(angle, dem, spacing, sin_slope,
+                                  cos_slope, aspect, nthreads, grid, stats,
+                                  cancel, max_distance)
+        return
+
+    if pool == 'thread':
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            yield from _ordered(
+                executor, viewf_integrand, angles, workers,
+                dem, spacing, sin_slope, cos_slope, aspect, nthreads, grid,
+                stats, cancel, max_distance)
+        return
+
+    # process workers attach to the arrays in shared memory. They are
+    # spawned, a forked worker can deadlock in OpenMP when the parent
+    # has already run OpenMP threads
+    from multiprocessing import shared_memory
+
+    arrays = {
+        'dem': dem,
+        'sin_slope': sin_slope,
+        'cos_slope': cos_slope,
+        'aspect': aspect
+    }
+    blocks = []
+    specs = {}
+    try:
+        for name, arr in arrays.items():
+            arr = np.asarray(arr)
+            shm = shared_memory.SharedMemory(
+                create=True, size=max(arr.nbytes, 1))
+            blocks.append(shm)
+            np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[:] = arr
+            specs[name] = (shm.name, arr.shape, arr.dtype.str)
+
+        with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_attach_shared,
+                initargs=(specs,)) as executor:
+            yield from _ordered(
+                executor, _shared_integrand, angles, workers,
+                spacing, nthreads, grid, max_distance)
+    finally:
+        for shm in blocks:
+            try:
+                shm.close()
+            finally:
+                shm.unlink()
+
+
+def _ordered(executor, fn, angles, workers, *args):
+    """Submit the angles to the executor and yield the results in the
+    order of the angles, keeping at most two results per worker in
+    flight
+    """
+
+    futures = deque()
+    for angle in angles:
+        futures.append(executor.submit(fn, angle, *args))
+        if len(futures) >= 2 * workers:
+            yield futures.popleft().result()
+
+    while futures:
+        yield futures.popleft().result()
+
+
+def _attach_shared(specs):
+    """Process pool initializer to attach to the shared arrays"""
+
+    from multiprocessing import shared_memory
+
+    for name, (shm_name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _SHARED[name] = (
+            shm, np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf))
+
+
+def _shared_integrand(angle, spacing, nthreads, grid, max_distance):
+    """viewf_integrand for a process worker using the shared arrays"""
+
+    return viewf_integrand(
+        angle, _SHARED['dem'][1], spacing, _SHARED['sin_slope'][1],
+        _SHARED['cos_slope'][1], _SHARED['aspect'][1], nthreads, grid,
+        max_distance=max_distance)
@@ -0,0 +1,289 @@
+import numpy as np
+
+from topocalc import gradient as _gradient
+from topocalc import horizon as _horizon
+from topocalc import shade as _shade
+from topocalc import viewf as _viewf
+from topocalc.tiles import halo_size
+
+# xarray, and dask for chunked arrays, are optional
+try:
+    import xarray as xr
+except ImportError:
+    xr = None
+
+# attributes of the dem that describe the elevations and not the grid
+VALUE_ATTRS = ('units', 'long_name', 'standard_name', 'valid_min',
+               'valid_max', 'valid_range', 'scale_factor', 'add_offset',
+               '_FillValue', 'missing_value')
+
+
+def gradient_d8(dem, dx=None, dy=None, aspect_rad=False, dtype=None):
+    """Slope and aspect of a DataArray dem with gradient_d8. A dask
+    backed dem is calculated a chunk at a time with an overlap of one
+    cell.
+
+    Args:
+        dem: 2D DataArray of elevations with the rows from north to
+            south like the numpy functions
+        dx: cell size along the x axis, defaults to the spacing of the
+            last dimension's coordinate
+        dy: cell size along the y axis, defaults to the spacing of the
+            first dimension's coordinate
+        aspect_rad: turn the aspect from degrees to IPW radians
+        dtype: float32 or float64 type to calculate in, see gradient_d8
+
+    Returns:
+        Dataset with the slope in radians and the aspect
+    """
+
+    _check_dem(dem)
+    dx = _spacing(dem, 1) if dx is None else dx
+    dy = _spacing(dem, 0) if dy is None else dy
+
+    def calc(z, origin, grid_shape):
+        return np.stack(_gradient.gradient_d8(
+            z, dx, dy, aspect_rad=aspect_rad, dtype=dtype))
+
+    out_dtype = calc(np.zeros((2, 2), dtype=dem.dtype), None, None).dtype
+
+    slope, aspect = _map_overlap(calc, dem.data, 1, out_dtype, 2)
+
+    return xr.Dataset({
+        'slope': _like(dem, slope, units='radians', long_name='slope'),
+        'aspect': _like(
+            dem, aspect, units='radians' if aspect_rad else 'degrees',
+            long_name='aspect')
+    }, attrs=_grid_attrs(dem))
+
+
+def shade(sin_slope, aspect, azimuth, cosz=None, zenith=None, dtype=None):
+    """Illumination angle of DataArrays of sin(slope) and aspect for one
+    sun position with shade. This is done cell by cell so a dask backed
+    array needs no overlap.
+
+    Args:
+        sin_slope: DataArray of sin(S)
+        aspect: DataArray of the aspect in IPW radians
+        azimuth: azimuth in degrees to the sun -180..180
+        cosz: cosine of the zenith angle 0..1
+        zenith: the solar zenith angle 0..90 degrees
+        dtype: float32 or float64 type to calculate mu in
+
+    Returns:
+        DataArray of the cosine of the local illumination angle
+    """
+
+    _require_xarray()
+
+    if np.ndim(azimuth) > 0 or np.ndim(cosz) > 0 or np.ndim(zenith) > 0:
+        raise ValueError('shade takes one sun position')
+
+    def calc(s, a):
+        return _shade.shade(s, a, azimuth, cosz=cosz, zenith=zenith,
+                            dtype=dtype)
+
+    out_dtype = calc(np.zeros(1, dtype=sin_slope.dtype),
+                     np.zeros(1, dtype=aspect.dtype)).dtype
+    mu = xr.apply_ufunc(calc, sin_slope, aspect, dask='parallelized',
+                        output_dtypes=[out_dtype])
+
+    mu.attrs = _grid_attrs(sin_slope)
+    mu.attrs.update(long_name='cosine of the local illumination angle')
+    return mu.rename('illumination')
+
+
+def horizon(azimuth, dem, max_distance=None, spacing=None, **kwargs):
+    """Cosines of the horizon angles of a DataArray dem for one
+    direction with horizon. A dask backed dem is calculated a chunk at
+    a time with an overlap that covers max_distance, and the search is
+    limited to max_distance, so it is the same as horizon on the whole
+    dem with max_distance.
+
+    Args:
+        azimuth: find the horizons along this direction
+        dem: 2D DataArray of elevations
+        max_distance: horizon search distance in the units of spacing,
+            needed for a dask backed dem
+        spacing: grid spacing, defaults to the spacing of the
+            coordinates, which must be the same for both dimensions
+        **kwargs: passed to horizon, like nthreads or dtype
+
+    Returns:
+        DataArray of the cosines of the horizon angles
+    """
+
+    _check_dem(dem)
+    spacing = _square_spacing(dem) if spacing is None else spacing
+    depth = _depth(dem, max_distance, spacing)
+
+    dtype = np.dtype(kwargs.get('dtype', np.float64))
+
+    def calc(z, origin, grid_shape):
+        return _horizon.horizon(
+            azimuth, z, spacing, origin=origin, grid_shape=grid_shape,
+            max_distance=max_distance, **kwargs)
+
+    hcos = _map_overlap(calc, dem.data, depth, dtype)
+
+    return _like(dem, hcos, long_name='cosine of the horizon angle',
+                 azimuth=azimuth).rename('hcos')
+
+
+def viewf(dem, max_distance=None, spacing=None, **kwargs):
+    """Sky view factor and terrain configuration factor of a DataArray
+    dem with viewf. A dask backed dem is calculated a chunk at a time
+    with an overlap that covers max_distance, like viewf_tiled.
+
+    Args:
+        dem: 2D DataArray of elevations
+        max_distance: horizon search distance in the units of spacing,
+            needed for a dask backed dem
+        spacing: grid spacing, defaults to the spacing of the
+            coordinates, which must be the same for both dimensions
+        **kwargs: passed to viewf, like nangles, workers or dtype
+
+    Returns:
+        Dataset with the sky_view_factor and the
+        terrain_configuration_factor
+    """
+
+    _check_dem(dem)
+    spacing = _square_spacing(dem) if spacing is None else spacing
+    depth = _depth(dem, max_distance, spacing)
+
+    dtype = np.dtype(kwargs.get('dtype', np.float64))
+
+    def calc(z, origin, grid_shape):
+        return np.stack(_viewf.viewf(
+            z, spacing, origin=origin, grid_shape=grid_shape,
+            max_distance=max_distance, **kwargs))
+
+    svf, tcf = _map_overlap(calc, dem.data, depth, dtype, 2)
+
+    return xr.Dataset({
+        'sky_view_factor': _like(dem, svf, long_name='sky view factor'),
+        'terrain_configuration_factor': _like(
+            dem, tcf, long_name='terrain configuration factor')
+    }, attrs=_grid_attrs(dem))
+
+
+def _map_overlap(calc, data, depth, dtype, nout=None):
+    """Run calc(z, origin, grid_shape) on a numpy array, or on each chunk
+    of a dask array with depth cells of the neighboring chunks around
+    it. The origin and grid_shape of each chunk with its overlap in the
+    whole array are given so the horizon lines are the lines of the
+    whole array. The overlap isn't padded at the edges of the array.
+
+    This is dask's map_overlap without the trim, so that calc can
+    return nout outputs stacked on a new first axis.
+    """
+
+    if not _is_dask(data):
+        return calc(np.asarray(data), None, None)
+
+    import dask.array as dsa
+
+    # chunks smaller than the depth are rechunked by overlap
+    overlapped = dsa.overlap.overlap(
+        data, depth={0: depth, 1: depth}, boundary='none')
+
+    # the chunks without the overlap
+    inner = []
+    starts = []
+    for chunks in overlapped.chunks:
+        n = len(chunks)
+        sizes = tuple(
+            c - depth * ((k > 0) + (k < n - 1)) for k, c in enumerate(chunks))
+        inner.append(sizes)
+        starts.append(np.cumsum((0,) + sizes[:-1]))
+
+    def block(z, block_id=None):
+        r, c = block_id[-2:]
+        top = depth if r > 0 else 0
+        left = depth if c > 0 else 0
+        out = calc(z, (int(starts[0][r]) - top, int(starts[1][c]) - left),
+                   data.shape)
+        return out[..., top:top + inner[0][r], left:left + inner[1][c]]
+
+    if nout is None:
+        return overlapped.map_blocks(
+            block, dtype=dtype, chunks=tuple(inner))
+
+    return overlapped.map_blocks(
+        block, dtype=dtype, chunks=((nout,),) + tuple(inner), new_axis=0)
+
+
+def _is_dask(data):
+    """True if data is a dask array"""
+    return hasattr(data, 'dask') and hasattr(data, 'chunks')
+
+
+def _require_xarray():
+    """Raise an ImportError if xarray isn't installed"""
+
+    if xr is None:
+        raise ImportError('topocalc.xr requires xarray')
+
+
+def _check_dem(dem):
+    """Raise if the dem isn't a 2D DataArray"""
+
+    _require_xarray()
+
+    if not isinstance(dem, xr.DataArray):
+        raise ValueError('dem must be an xarray DataArray')
+
+    if dem.ndim != 2:
+        raise ValueError('dem must be a 2D DataArray')
+
+
+def _depth(dem, max_distance, spacing):
+    """Overlap between the chunks for a horizon search of max_distance"""
+
+    if max_distance is None:
+        if _is_dask(dem.data):
+            raise ValueError(
+                'max_distance is needed for the overlap of a dask array')
+        return 0
+
+    return halo_size(max_distance, spacing)
+
+
+def _spacing(dem, axis):
+    """Spacing of the coordinate of a dimension of the dem"""
+
+    dim = dem.dims[axis]
+    if dim not in dem.coords or dem.sizes[dim] < 2:
+        raise ValueError(
+            'the spacing is needed without a {} coordinate'.format(dim))
+
+    coord = np.asarray(dem[dim].values, dtype=np.float64)
+    return float(np.abs(coord[1] - coord[0]))
+
+
+def _square_spacing(dem):
+    """Spacing of the coordinates, which must be square cells"""
+
+    dy, dx = _spacing(dem, 0), _spacing(dem, 1)
+    if not np.isclose(dx, dy):
+        raise ValueError('the horizons need the same spacing for x and y')
+
+    return dx
+
+
+def _grid_attrs(dem):
+    """Attributes of the dem without the ones describing the values"""
+
+    return {k: v for k, v in dem.attrs.items() if k not in VALUE_ATTRS}
+
+
+def _like(dem, data, **attrs):
+    """DataArray of data with the dims, coordinates and grid attributes
+    of the dem
+    """
+
+    out = xr.DataArray(data, coords=dem.coords, dims=dem.dims,
+                       attrs=_grid_attrs(dem))
+    out.attrs.update(attrs)
+    return out